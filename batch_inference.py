@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""Batched inference helpers for YOLO ONNX models exported with a dynamic batch axis.
+
+Usage:
+    python batch_inference.py testimage.tif --model yolov8s.onnx --tiles 64
+
+N preprocessed tiles or images are stacked into one (N, 3, 640, 640) tensor and sent to
+onnxruntime in a single ``sess.run`` call; the outputs are split back per item. The batch
+size can be picked automatically from a memory budget. Models exported with a fixed batch
+size (see ``convert_yolov8s_to_onnx.py --dynamic``) are run in chunks of that size instead.
+
+Running the script compares one call per tile against batched calls on tiles of a raster.
+"""
+
+import argparse
+import itertools
+import os
+import time
+
+import numpy as np
+
+from profiling import timed
+from run_onnx_inference_draw import INPUT_SIZE
+from session_pool import get_session
+
+# Parameters
+MEMORY_BUDGET_MB = 1024
+MAX_BATCH_SIZE = 32
+# Rough ratio of peak intermediate activation memory to input + output memory for YOLOv8
+ACTIVATION_FACTOR = 12
+# Strides of the YOLOv8 detection heads; their cells make up the anchor axis of the output
+HEAD_STRIDES = (8, 16, 32)
+
+
+def fixed_batch_size(sess):
+    """Return the batch size a model was exported with, or None if its batch axis is dynamic."""
+    batch_dim = sess.get_inputs()[0].shape[0]
+    return batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+
+
+def model_input_shape(sess):
+    """Return the (width, height) model input size, INPUT_SIZE for dynamic axes."""
+    shape = sess.get_inputs()[0].shape
+    if isinstance(shape[3], int) and isinstance(shape[2], int):
+        return shape[3], shape[2]
+    return INPUT_SIZE
+
+
+def anchor_count(input_shape):
+    """Return the number of YOLOv8 anchors (output columns) for a (width, height) input."""
+    width, height = input_shape
+    return sum((width // stride) * (height // stride) for stride in HEAD_STRIDES)
+
+
+def item_nbytes(shape, itemsize=4, symbolic=1):
+    """Return the number of bytes of one batch item of a tensor with the given shape.
+
+    Symbolic (dynamic) dimensions after the batch axis count as ``symbolic`` elements.
+    """
+    count = 1
+    for dim in shape[1:]:
+        count *= dim if isinstance(dim, int) and dim > 0 else symbolic
+    return count * itemsize
+
+
+def auto_batch_size(sess, memory_budget_mb=MEMORY_BUDGET_MB, max_batch_size=MAX_BATCH_SIZE):
+    """Pick the largest batch size whose estimated working set fits in the memory budget.
+
+    The estimate is the input and output bytes of one item scaled by ACTIVATION_FACTOR.
+    Models with dynamic spatial axes (``yolo export dynamic=True``) are estimated at
+    model_input_shape, their symbolic output axis at its anchor count. Models with a fixed
+    batch axis always use their exported batch size.
+    """
+    fixed = fixed_batch_size(sess)
+    if fixed is not None:
+        return fixed
+    width, height = model_input_shape(sess)
+    per_item = item_nbytes(list(sess.get_inputs()[0].shape[:2]) + [height, width])
+    per_item += sum(item_nbytes(output.shape, symbolic=anchor_count((width, height)))
+                    for output in sess.get_outputs())
+    per_item *= ACTIVATION_FACTOR
+    return int(max(1, min(max_batch_size, memory_budget_mb * 1024 * 1024 // per_item)))
+
+
+def iter_batches(items, batch_size):
+    """Yield lists of up to batch_size items from any iterable."""
+    iterator = iter(items)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def stack_inputs(tensors):
+    """Stack (3, H, W) or (1, 3, H, W) float32 tensors into one contiguous (N, 3, H, W) batch."""
+    return np.ascontiguousarray(np.concatenate([np.asarray(t, dtype=np.float32).reshape((1,) + t.shape[-3:])
+                                                for t in tensors]))
+
+
+@timed("infer")
+def run_batch(sess, batch):
+    """Run an (N, 3, H, W) batch through the session and return the batched outputs.
+
+    A model with a fixed batch size is run in chunks of that size and the chunk outputs are
+    concatenated, so callers can always pass any N.
+    """
+    input_name = sess.get_inputs()[0].name
+    fixed = fixed_batch_size(sess)
+    if fixed is None or fixed == len(batch):
+        return sess.run(None, {input_name: batch})
+    chunks = []
+    for start in range(0, len(batch), fixed):
+        chunk = batch[start:start + fixed]
+        if len(chunk) < fixed:
+            # Pad the last chunk up to the exported batch size and drop the padding afterwards
+            pad = np.zeros((fixed - len(chunk),) + chunk.shape[1:], dtype=chunk.dtype)
+            outputs = sess.run(None, {input_name: np.concatenate([chunk, pad])})
+            chunks.append([output[:len(chunk)] for output in outputs])
+        else:
+            chunks.append(sess.run(None, {input_name: chunk}))
+    return [np.concatenate(parts) for parts in zip(*chunks)]
+
+
+def split_outputs(outputs):
+    """Split batched outputs into one list of (1, ...) outputs per item, as ``sess.run`` returns for batch 1."""
+    return [[output[i:i + 1] for output in outputs] for i in range(len(outputs[0]))]
+
+
+def infer_batch(sess, tensors):
+    """Run a list of preprocessed tensors in one batch and return the outputs of each item."""
+    return split_outputs(run_batch(sess, stack_inputs(tensors)))
+
+
+def main():
+    # Imported here because tiled_inference itself batches tiles through this module, and so that
+    # the helpers above do not need rasterio
+    import rasterio
+
+    from tiled_inference import TILE_OVERLAP, generate_windows, read_tile
+
+    parser = argparse.ArgumentParser(description='Compare per-tile and batched inference throughput.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--tiles', type=int, default=64, help='Number of tiles to run.')
+    parser.add_argument('--batch-size', type=int, default=0, help='Batch size, 0 to pick it from the memory budget.')
+    parser.add_argument('--memory-budget', type=int, default=MEMORY_BUDGET_MB, help='Memory budget in MB.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    sess = get_session(args.model)
+    batch_size = args.batch_size or auto_batch_size(sess, args.memory_budget)
+    tile_size = model_input_shape(sess)[0]
+    print(f"Batch size: {batch_size} ({'dynamic' if fixed_batch_size(sess) is None else 'fixed'} batch axis)")
+
+    with rasterio.open(args.raster) as src:
+        windows = itertools.islice(generate_windows(src.width, src.height, tile_size, TILE_OVERLAP), args.tiles)
+        tiles = [read_tile(src, window, tile_size) for window in windows]
+
+    input_name = sess.get_inputs()[0].name
+    start = time.perf_counter()
+    for tile in tiles:
+        sess.run(None, {input_name: tile})
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for batch in iter_batches(tiles, batch_size):
+        run_batch(sess, stack_inputs(batch))
+    batched = time.perf_counter() - start
+
+    print(f"One call per tile: {len(tiles) / single:.2f} tiles/s")
+    print(f"Batched calls:     {len(tiles) / batched:.2f} tiles/s ({single / batched:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import pytest
+import subprocess
+import sys
+import os
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+
+from run_onnx_inference import preprocess_image
+from run_onnx_inference_draw import non_max_suppression, postprocess, xywh_to_xyxy
+from batch_inference import run_batch
+from session_pool import SessionPool
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, generate_windows, run_tiled_inference
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Runs the tiled path in a fresh interpreter, so the peak RSS is that of one scene and nothing else
+PEAK_RSS_SCRIPT = """
+import resource, sys, time
+import rasterio
+from session_pool import get_session
+from tiled_inference import run_tiled_inference
+sess = get_session(sys.argv[1])
+with rasterio.open(sys.argv[2]) as src:
+    start = time.perf_counter()
+    boxes, _, _ = run_tiled_inference(sess, src, batch_size=int(sys.argv[3]))
+    seconds = time.perf_counter() - start
+scale = 1 if sys.platform == "darwin" else 1024
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, seconds, len(boxes))
+"""
+
+
+def add_rates(benchmark, **counts):
+    """Record items per second of the mean round for each count; nothing is timed with --benchmark-disable."""
+    if benchmark.stats is not None:
+        mean = benchmark.stats.stats.mean
+        benchmark.extra_info.update({f"{name}_per_second": count / mean for name, count in counts.items()})
+
+
+@pytest.fixture(scope="module")
+def sess(detector):
+    # No optimized-model cache, so runs do not depend on what an earlier run left on disk
+    return SessionPool(cache_dir=None).get(detector)
+
+
+@pytest.fixture(scope="module")
+def raw_outputs(sess):
+    batch = np.random.default_rng(1).random((1, 3, 640, 640), dtype=np.float32)
+    return sess.run(None, {sess.get_inputs()[0].name: batch})
+
+
+def test_preprocess_image(benchmark, image_file):
+    tensor = benchmark(preprocess_image, image_file)
+    assert tensor.shape == (1, 3, 640, 640)
+
+
+def test_postprocess(benchmark, raw_outputs):
+    boxes, scores, class_ids = benchmark(postprocess, raw_outputs)
+    benchmark.extra_info["detections"] = len(boxes)
+    assert len(boxes) > 0
+
+
+@pytest.mark.parametrize("count", [100, 1000, 5000])
+def test_non_max_suppression(benchmark, count):
+    rng = np.random.default_rng(count)
+    xywh = np.column_stack([rng.uniform(0, 640, (count, 2)), rng.uniform(10, 80, (count, 2))])
+    boxes, scores = xywh_to_xyxy(xywh), rng.random(count)
+    keep = benchmark(non_max_suppression, boxes, scores)
+    benchmark.extra_info["kept"] = len(keep)
+
+
+@pytest.mark.parametrize("batch_size", [1, 4, 8])
+def test_session_run(benchmark, sess, batch_size):
+    batch = np.random.default_rng(2).random((batch_size, 3, 640, 640), dtype=np.float32)
+    outputs = benchmark(run_batch, sess, batch)
+    benchmark.extra_info["images"] = batch_size
+    add_rates(benchmark, images=batch_size)
+    assert outputs[0].shape == (batch_size, 84, 8400)
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_tiled_scene(benchmark, sess, scene, batch_size):
+    with rasterio.open(scene) as src:
+        tiles = sum(1 for _ in generate_windows(src.width, src.height, TILE_SIZE, TILE_OVERLAP))
+        megapixels = src.width * src.height / 1e6
+        benchmark.pedantic(run_tiled_inference, args=(sess, src), kwargs={"batch_size": batch_size},
+                           rounds=3, warmup_rounds=1)
+    benchmark.extra_info["tiles"] = tiles
+    add_rates(benchmark, tiles=tiles, megapixels=megapixels)
+
+
+def test_tiled_scene_peak_rss(benchmark, detector, scene):
+    pytest.importorskip("resource")
+
+    def run():
+        result = subprocess.run([sys.executable, "-c", PEAK_RSS_SCRIPT, detector, scene, "4"], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.split()
+
+    peak_rss, seconds, detections = benchmark.pedantic(run, rounds=1)
+    benchmark.extra_info.update(peak_rss_mb=int(peak_rss) / 2 ** 20, scene_seconds=float(seconds),
+                                detections=int(detections))
@@ -0,0 +1,112 @@
+"""Fixtures of the benchmark suite: a synthetic YOLOv8-shaped detector and synthetic GeoTIFFs.
+
+Usage:
+    pytest benchmarks                                  # saves .benchmarks/<machine>/NNNN_<commit>.json
+    pytest benchmarks --raster-size 8192
+    pytest benchmarks --benchmark-compare              # compare against the last saved run
+
+Everything is generated offline into a temporary directory; no model download is needed.
+"""
+
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+onnx = pytest.importorskip("onnx")
+rasterio = pytest.importorskip("rasterio")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+
+from onnx import TensorProto, helper, numpy_helper
+
+# Parameters
+INPUT_SIZE = 640
+STRIDES = (8, 16, 32)
+RASTER_SIZE = 2048
+
+
+def pytest_addoption(parser):
+    parser.addoption("--raster-size", type=int, default=RASTER_SIZE,
+                     help="Width and height in pixels of the synthetic scene.")
+
+
+def write_yolo_detector(path, input_size=INPUT_SIZE):
+    """Write a detector with the YOLOv8 (N, 84, 8400) output: one strided conv per detection scale.
+
+    Box channels come out around image-sized xywh values and class channels through a sigmoid
+    biased low, so postprocessing sees a realistic couple of hundred candidates per image.
+    """
+    rng = np.random.default_rng(0)
+    nodes, initializers, heads = [], [], []
+    for stride in STRIDES:
+        # Unit-variance outputs for [0, 1] inputs, then spread the box channels over the image
+        weight = rng.normal(0, 1 / stride / np.sqrt(3), (84, 3, stride, stride))
+        weight[:4] *= np.array([input_size / 4, input_size / 4, input_size / 32, input_size / 32])[:, None, None, None]
+        weight = weight.astype(np.float32)
+        bias = np.concatenate([[input_size / 2, input_size / 2, input_size / 8, input_size / 8],
+                               np.full(80, -3.0)]).astype(np.float32)
+        initializers += [numpy_helper.from_array(weight, f"w{stride}"), numpy_helper.from_array(bias, f"b{stride}")]
+        nodes += [helper.make_node("Conv", ["images", f"w{stride}", f"b{stride}"], [f"conv{stride}"],
+                                   strides=[stride, stride]),
+                  helper.make_node("Reshape", [f"conv{stride}", "shape"], [f"head{stride}"])]
+        heads.append(f"head{stride}")
+    initializers += [numpy_helper.from_array(np.array([0, 84, -1], dtype=np.int64), "shape"),
+                     numpy_helper.from_array(np.array([4, 80], dtype=np.int64), "split")]
+    nodes += [helper.make_node("Concat", heads, ["raw"], axis=2),
+              helper.make_node("Split", ["raw", "split"], ["xywh", "logits"], axis=1),
+              helper.make_node("Sigmoid", ["logits"], ["classes"]),
+              helper.make_node("Concat", ["xywh", "classes"], ["output0"], axis=1)]
+    anchors = sum((input_size // stride) ** 2 for stride in STRIDES)
+    graph = helper.make_graph(
+        nodes, "yolo_like",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, input_size, input_size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 84, anchors])],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def write_scene(path, size, block_size=256):
+    """Write a tiled, georeferenced size x size RGB GeoTIFF of random pixels, one block row at a time."""
+    rng = np.random.default_rng(0)
+    transform = rasterio.transform.from_origin(500000, 4000000, 0.5, 0.5)
+    with rasterio.open(path, "w", driver="GTiff", width=size, height=size, count=3, dtype="uint8",
+                       crs="EPSG:32633", transform=transform, tiled=True,
+                       blockxsize=block_size, blockysize=block_size) as dst:
+        for row_off in range(0, size, block_size):
+            height = min(block_size, size - row_off)
+            data = rng.integers(0, 255, (3, height, size), dtype=np.uint8)
+            dst.write(data, window=rasterio.windows.Window(0, row_off, size, height))
+
+
+@pytest.fixture(scope="session")
+def bench_dir(tmp_path_factory):
+    return tmp_path_factory.mktemp("bench")
+
+
+@pytest.fixture(scope="session")
+def detector(bench_dir):
+    path = str(bench_dir / "yolo_like.onnx")
+    write_yolo_detector(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def scene(bench_dir, request):
+    size = request.config.getoption("--raster-size")
+    path = str(bench_dir / f"scene_{size}.tif")
+    write_scene(path, size)
+    return path
+
+
+@pytest.fixture(scope="session")
+def image_file(bench_dir):
+    path = str(bench_dir / "frame.jpg")
+    cv2.imwrite(path, np.random.default_rng(0).integers(0, 255, (1080, 1920, 3), dtype=np.uint8))
+    return path
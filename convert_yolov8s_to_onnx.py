@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 """Script to convert YOLOv8 small model from PyTorch (.pt) to ONNX format.
 Usage:
-    python convert_yolov8s_to_onnx.py
+    python convert_yolov8s_to_onnx.py [--dynamic]
+
+Pass --dynamic to export the model with dynamic axes, so that several tiles or images can be
+stacked into one (N, 3, 640, 640) tensor (see batch_inference.py). The export makes the height
+and width dynamic too; the inference scripts run such models at 640 x 640.
 
 Ensure that you have the 'ultralytics' package installed and that 'yolov8s.pt' 
 is accessible (in the current directory or update the path accordingly).
 """
 
+import argparse
+
 try:
     from ultralytics import YOLO
 except ImportError:
@@ -14,15 +20,19 @@ except ImportError:
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Convert YOLOv8 small model from PyTorch to ONNX format.')
+    parser.add_argument('--dynamic', action='store_true', help='Export with dynamic batch and spatial axes.')
+    args = parser.parse_args()
+
     pt_model_file = "yolov8s.pt"
     onnx_model_file = "yolov8s.onnx"
 
     print(f"Loading YOLOv8 small model from {pt_model_file}...")
     model = YOLO(pt_model_file)
 
-    print("Exporting model to ONNX format...")
+    print(f"Exporting model to ONNX format ({'dynamic' if args.dynamic else 'fixed batch-1'} axes)...")
     # This will export the model as 'yolov8s.onnx' to the current directory
-    model.export(format="onnx", simplify=True, project=".", name="yolov8s")
+    model.export(format="onnx", simplify=True, dynamic=args.dynamic, project=".", name="yolov8s")
 
     print(f"Export complete. The ONNX model should be available as {onnx_model_file}.")
 
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""Run several ONNX detectors on the same imagery with shared preprocessing and fuse their detections.
+
+Usage:
+    python ensemble_inference.py testimage.tif --models yolov8s.onnx yolov8n.onnx --weights 2 1
+    python ensemble_inference.py samples/bus.jpg --models yolov8s.onnx yolov8n.onnx
+
+Every input is decoded and preprocessed once. Models whose input shapes match share one
+BatchPreprocessor batch; for another input shape the normalized tile is resized into that
+shape's batch (or, for images, letterboxed into it). All models then run concurrently on a
+thread pool, one worker per model, each session limited to its share of the cores, since
+onnxruntime releases the GIL while it runs. Each worker also postprocesses its own outputs.
+
+Per tile, the detections of all models are mapped back to tile pixels and fused with weighted
+box fusion: boxes of any model and the same class (any class with --class-agnostic) that
+overlap the highest (score x weight) box of a cluster are averaged with score x weight as
+weights. The fused score is the weight-averaged score of the cluster, scaled by the fraction
+of the models that found it, so it stays in [0, 1] and a box only one model reports is
+down-weighted. The report lists the latency of each model and the
+combined throughput.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import rasterio
+
+from batch_inference import iter_batches, model_input_shape, run_batch
+from merge_detections import cluster_detections
+from parallel_inference import threads_per_worker
+from preprocess_buffer import BatchPreprocessor
+from profiling import Histogram, count, timer
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, postprocess_batch, scale_boxes_to_original
+from session_pool import get_session
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, concat_detections, generate_windows, to_image_coordinates
+
+# Parameters
+BATCH_SIZE = 4
+# Boxes of different models overlapping at least this much are fused into one
+FUSION_IOU = 0.55
+RASTER_EXTENSIONS = ('.tif', '.tiff', '.vrt', '.jp2', '.img')
+
+
+def weighted_box_fusion(detections, weights, iou_threshold=FUSION_IOU, class_aware=True):
+    """Fuse one (boxes, scores, class_ids) tuple per model, in common pixels, into one set of detections.
+
+    Only boxes of the same class are fused unless class_aware is False; a class-agnostic
+    cluster keeps the class of its highest (score x weight) box. Clusters come highest first.
+    """
+    boxes, scores, class_ids = concat_detections(detections)
+    if not len(boxes):
+        return boxes, scores, class_ids
+    models = len(detections)
+    model = np.repeat(np.arange(models), [len(d[0]) for d in detections])
+    box_weights = np.asarray(weights, dtype=np.float64)[model]
+    weighted_scores = scores * box_weights
+    keep, cluster = cluster_detections(boxes, weighted_scores, class_ids, iou_threshold, class_aware)
+
+    n = len(boxes)
+    coordinates = np.zeros((n, 4), dtype=np.float64)
+    score_sums = np.zeros(n, dtype=np.float64)
+    weight_sums = np.zeros(n, dtype=np.float64)
+    np.add.at(coordinates, cluster, boxes * weighted_scores[:, None])
+    np.add.at(score_sums, cluster, weighted_scores)
+    np.add.at(weight_sums, cluster, box_weights)
+    # Models with at least one box in the cluster
+    agreeing = np.bincount(np.unique(cluster * models + model) // models, minlength=n)
+
+    fused = (coordinates[keep] / np.maximum(score_sums[keep], 1e-12)[:, None]).astype(np.float32)
+    fused_scores = score_sums[keep] / weight_sums[keep] * agreeing[keep] / models
+    return fused, fused_scores.astype(np.float32), class_ids[keep]
+
+
+class EnsembleMember:
+    """One model of an ensemble: its session, input shape, fusion weight and latency histogram."""
+
+    def __init__(self, name, sess, weight=1.0):
+        self.name = name
+        self.sess = sess
+        self.weight = weight
+        self.input_shape = model_input_shape(sess)
+        self.latency = Histogram()
+
+
+class Ensemble:
+    """Runs the members on one preprocessed batch per distinct input shape, concurrently."""
+
+    def __init__(self, members, fusion_iou=FUSION_IOU, class_aware=True):
+        if any(member.weight <= 0 for member in members):
+            raise ValueError(f"Model weights must be positive, got {[member.weight for member in members]}")
+        self.members = members
+        self.fusion_iou = fusion_iou
+        self.class_aware = class_aware
+        self.input_shapes = sorted({member.input_shape for member in members})
+        self._executor = ThreadPoolExecutor(max_workers=len(members))
+
+    @classmethod
+    def from_files(cls, model_files, weights=None, fusion_iou=FUSION_IOU, intra_op_threads=None, class_aware=True):
+        """Load the models once from the session pool, splitting the cores between them."""
+        intra_op_threads = intra_op_threads or threads_per_worker(len(model_files))
+        weights = weights or [1.0] * len(model_files)
+        members = []
+        for model_file, weight in zip(model_files, weights):
+            name = os.path.splitext(os.path.basename(model_file))[0]
+            if any(member.name == name for member in members):
+                name = f"{name}_{len(members)}"
+            members.append(EnsembleMember(name, get_session(model_file, intra_op_threads=intra_op_threads), weight))
+        return cls(members, fusion_iou, class_aware)
+
+    def _run_member(self, member, batch, conf_threshold, iou_threshold):
+        start = time.perf_counter()
+        with timer(f"model_{member.name}"):
+            detections = postprocess_batch(run_batch(member.sess, batch), conf_threshold, iou_threshold)
+        member.latency.observe(time.perf_counter() - start)
+        return detections
+
+    def run(self, batches, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+        """Run every member on batches[member.input_shape]; returns one list of per-item detections per member."""
+        futures = [self._executor.submit(self._run_member, member, batches[member.input_shape], conf_threshold,
+                                         iou_threshold)
+                   for member in self.members]
+        return [future.result() for future in futures]
+
+    def fuse(self, detections):
+        """Fuse one (boxes, scores, class_ids) tuple per member, in common pixels, with weighted box fusion."""
+        return weighted_box_fusion(detections, [member.weight for member in self.members], self.fusion_iou,
+                                   self.class_aware)
+
+    def report(self, items, elapsed):
+        """Return per-member latency lines and the combined throughput over items processed in elapsed seconds."""
+        lines = [f"{'model':<16}{'calls':>7}{'mean ms':>10}{'p95 ms':>10}{'total s':>10}"]
+        busy = 0.0
+        for member in self.members:
+            h = member.latency
+            busy += h.sum
+            mean = h.sum / h.count * 1000 if h.count else 0.0
+            lines.append(f"{member.name:<16}{h.count:>7}{mean:>10.2f}{h.quantile(0.95) * 1000:>10.2f}{h.sum:>10.3f}")
+        lines.append(f"Combined: {items} items in {elapsed:.2f}s ({items / max(elapsed, 1e-9):.1f} items/s), "
+                     f"model time / wall time {busy / max(elapsed, 1e-9):.2f}")
+        return "\n".join(lines)
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def resize_chw(tile, out):
+    """Resize a (3, H, W) float32 tile into a preallocated (3, h, w) slot, channel by channel."""
+    for channel in range(tile.shape[0]):
+        cv2.resize(tile[channel], (out.shape[2], out.shape[1]), dst=out[channel], interpolation=cv2.INTER_LINEAR)
+    return out
+
+
+def iter_ensemble_tiles(ensemble, src, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, conf_threshold=CONF_THRESHOLD,
+                        iou_threshold=IOU_THRESHOLD, batch_size=BATCH_SIZE, reader=None):
+    """Yield (window, boxes, scores, class_ids) of the fused detections of every tile of src.
+
+    Tiles are read and normalized once into a tile_size batch; members with another input
+    shape get the tile resized into their shape's batch. With a raster_input.RasterTileReader,
+    tiles without a valid pixel are skipped.
+    """
+    tile_shape = (tile_size, tile_size)
+    base = BatchPreprocessor(batch_size, tile_shape)
+    resized = {shape: BatchPreprocessor(batch_size, shape) for shape in ensemble.input_shapes if shape != tile_shape}
+    for windows in iter_batches(generate_windows(src.width, src.height, tile_size, overlap), batch_size):
+        kept = []
+        for window in windows:
+            slot = len(kept)
+            if reader is None:
+                base.read_window(slot, src, window)
+            else:
+                data, valid = reader.read(window)
+                if valid is not None and not valid.any():
+                    count("nodata_tiles")
+                    continue
+                reader.normalize(data, valid, base.batch[slot])
+            for preprocessor in resized.values():
+                resize_chw(base.batch[slot], preprocessor.batch[slot])
+            kept.append(window)
+        if not kept:
+            continue
+        batches = {tile_shape: base.batch[:len(kept)]}
+        batches.update({shape: preprocessor.batch[:len(kept)] for shape, preprocessor in resized.items()})
+        per_member = ensemble.run(batches, conf_threshold, iou_threshold)
+        count("tiles", len(kept))
+        for index, window in enumerate(kept):
+            detections = []
+            for member, results in zip(ensemble.members, per_member):
+                boxes, scores, class_ids = results[index]
+                width, height = member.input_shape
+                scale = np.array([tile_size / width, tile_size / height] * 2, dtype=np.float32)
+                detections.append((boxes * scale, scores, class_ids))
+            boxes, scores, class_ids = ensemble.fuse(detections)
+            count("detections", len(boxes))
+            yield window, to_image_coordinates(boxes, window), scores, class_ids
+
+
+def run_ensemble_tiled(ensemble, src, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, conf_threshold=CONF_THRESHOLD,
+                       iou_threshold=IOU_THRESHOLD, batch_size=BATCH_SIZE, reader=None):
+    """Run the ensemble over a whole raster and return the concatenated fused (boxes, scores, class_ids)."""
+    tiles = iter_ensemble_tiles(ensemble, src, tile_size, overlap, conf_threshold, iou_threshold, batch_size, reader)
+    return concat_detections([tuple(tile[1:]) for tile in tiles])
+
+
+def detect_image(ensemble, image, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """Letterbox a BGR image once per distinct input shape, run the ensemble and return fused detections."""
+    batches, geometry = {}, {}
+    for shape in ensemble.input_shapes:
+        preprocessor = BatchPreprocessor(1, shape)
+        geometry[shape] = preprocessor.set_image_letterbox(0, image)
+        batches[shape] = preprocessor.batch
+    per_member = ensemble.run(batches, conf_threshold, iou_threshold)
+    detections = []
+    for member, results in zip(ensemble.members, per_member):
+        boxes, scores, class_ids = results[0]
+        scale, pad = geometry[member.input_shape]
+        detections.append((scale_boxes_to_original(boxes, scale, pad, image.shape), scores, class_ids))
+    return ensemble.fuse(detections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an ensemble of ONNX detectors and fuse their detections.')
+    parser.add_argument('source', help='GeoTIFF (tiled inference) or image file.')
+    parser.add_argument('--models', nargs='+', default=['yolov8s.onnx', 'yolov8n.onnx'], help='ONNX models.')
+    parser.add_argument('--weights', type=float, nargs='+', help='Fusion weight of each model; 1 for all by default.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Tiles per session call.')
+    parser.add_argument('--conf', type=float, default=CONF_THRESHOLD, help='Confidence threshold.')
+    parser.add_argument('--iou', type=float, default=IOU_THRESHOLD, help='IoU threshold for non-max suppression.')
+    parser.add_argument('--fusion-iou', type=float, default=FUSION_IOU, help='IoU threshold for box fusion.')
+    parser.add_argument('--class-agnostic', action='store_true',
+                        help='Also fuse overlapping boxes of different classes.')
+    args = parser.parse_args()
+
+    for model_file in args.models:
+        if not os.path.exists(model_file):
+            print(f"ONNX model file '{model_file}' not found. Please export the model first.")
+            return
+    if args.weights and len(args.weights) != len(args.models):
+        print(f"Got {len(args.weights)} weights for {len(args.models)} models.")
+        return
+    if args.weights and min(args.weights) <= 0:
+        print("Model weights must be positive.")
+        return
+    if not os.path.exists(args.source):
+        print(f"Input '{args.source}' not found.")
+        return
+
+    with Ensemble.from_files(args.models, args.weights, args.fusion_iou,
+                             class_aware=not args.class_agnostic) as ensemble:
+        start = time.perf_counter()
+        if args.source.lower().endswith(RASTER_EXTENSIONS):
+            from raster_input import RasterTileReader
+
+            with rasterio.open(args.source) as src:
+                reader = RasterTileReader(src, tile_size=args.tile_size)
+                boxes, scores, class_ids = run_ensemble_tiled(ensemble, src, args.tile_size, args.overlap, args.conf,
+                                                              args.iou, args.batch_size, reader)
+                items = len(list(generate_windows(src.width, src.height, args.tile_size, args.overlap)))
+        else:
+            image = cv2.imread(args.source)
+            if image is None:
+                print(f"Failed to load image {args.source}")
+                return
+            boxes, scores, class_ids = detect_image(ensemble, image, args.conf, args.iou)
+            items = 1
+        elapsed = time.perf_counter() - start
+
+        print(f"Fused detections: {len(boxes)}")
+        for cls in np.unique(class_ids):
+            print(f"Class {cls}: {int(np.sum(class_ids == cls))}")
+        print(ensemble.report(items, elapsed))
+
+
+if __name__ == "__main__":
+    main()
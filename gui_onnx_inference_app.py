@@ -2,55 +2,128 @@
 """GUI App for ONNX-Based YOLO Inference
 
 Usage:
-    python gui_onnx_inference_app.py
+    python gui_onnx_inference_app.py [--profile [PREFIX]]
 
 Ensure that 'yolov8s.onnx' is in the current directory (export it first if needed).
+
+Inference runs on a background worker thread, so the window stays responsive; progress and
+results come back to the Tk main thread through a queue polled with ``after()``. Results are
+cached by image content hash, model and thresholds, so switching back to an image that was
+already run shows its detections instantly.
+
+With --profile, per-stage timings of every run are recorded and written when the window closes.
 """
 
+import argparse
+import collections
+import hashlib
 import os
+import queue
+import threading
 import cv2
 import numpy as np
 import onnxruntime as ort
 import tkinter as tk
-from tkinter import filedialog, messagebox
+from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 
+from run_onnx_inference_draw import (
+    CONF_THRESHOLD,
+    IOU_THRESHOLD,
+    draw_detections,
+    postprocess,
+    preprocess_image_letterbox,
+    scale_boxes_to_original,
+)
+from batch_inference import model_input_shape
+from profiling import add_profile_argument, finish_profile, start_profile, timer
+from session_pool import get_session
+
+# Parameters
+DISPLAY_SIZE = (400, 300)
+POLL_INTERVAL_MS = 50
+CACHE_SIZE = 32
 
-# Preprocess the image: load, resize, normalize, and format as CHW
 
-def preprocess_image(image_path, input_shape=(640, 640)):
-    img = cv2.imread(image_path)
+# Load an image as BGR; np.fromfile + imdecode also handles non-ASCII paths on Windows
+
+def load_image_bgr(image_path):
+    img = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
     if img is None:
         raise FileNotFoundError(f"Could not load image {image_path}")
-    # Convert from BGR to RGB
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    # Resize image
-    img = cv2.resize(img, input_shape)
-    # Normalize to [0,1]
-    img = img.astype(np.float32) / 255.0
-    # Transpose to CHW and add batch dimension
-    img = np.transpose(img, (2, 0, 1))
-    img = np.expand_dims(img, axis=0)
     return img
 
 
-# Function to perform inference using onnxruntime
+def file_digest(path):
+    """Return the SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """LRU cache of detections keyed by image content hash, model file and thresholds."""
+
+    def __init__(self, max_entries=CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    @staticmethod
+    def make_key(image_digest, model_file, conf_threshold, iou_threshold):
+        model_file = os.path.abspath(model_file)
+        mtime = os.path.getmtime(model_file) if os.path.exists(model_file) else None
+        return image_digest, model_file, mtime, round(conf_threshold, 4), round(iou_threshold, 4)
+
+    def get(self, key):
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
 
-def run_inference(model_file, image_path):
-    sess = ort.InferenceSession(model_file)
-    input_name = sess.get_inputs()[0].name
-    input_tensor = preprocess_image(image_path)
-    outputs = sess.run(None, {input_name: input_tensor})
-    return outputs
+    def put(self, key, detections):
+        self._entries[key] = detections
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# Function to perform inference using onnxruntime; the session is created once and reused across clicks.
+# Returns detections in original-image pixels. run_options.terminate cancels a running sess.run.
+
+def run_inference(model_file, image, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD,
+                  run_options=None, report=lambda stage: None, session_options=None):
+    report("Loading model")
+    sess = get_session(model_file, **(session_options or {}))
+    model_input = sess.get_inputs()[0]
+    input_shape = model_input_shape(sess)
+    report("Preprocessing")
+    input_tensor, scale, pad = preprocess_image_letterbox(image, input_shape)
+    report("Running model")
+    with timer("infer"):
+        outputs = sess.run(None, {model_input.name: input_tensor}, run_options)
+    report("Postprocessing")
+    boxes, scores, class_ids = postprocess(outputs, conf_threshold, iou_threshold)
+    return scale_boxes_to_original(boxes, scale, pad, image.shape), scores, class_ids
 
 
 class ONNXInferenceApp:
-    def __init__(self, master):
+    def __init__(self, master, session_options=None):
         self.master = master
+        self.session_options = session_options or {}
+        self.inference_runs = 0
         master.title("ONNX Inference App")
 
         self.image_path = None
+        self.image = None
+        self.image_digest = None
         self.model_file = "yolov8s.onnx"
+        self.cache = ResultCache()
+        self.messages = queue.Queue()
+        self.worker = None
+        self.cancel_event = threading.Event()
+        self.run_options = None
 
         # Check for ONNX model
         if not os.path.exists(self.model_file):
@@ -63,9 +136,25 @@ class ONNXInferenceApp:
         self.load_button = tk.Button(master, text="Load Image", command=self.load_image)
         self.load_button.pack(pady=5)
 
+        self.conf_scale = tk.Scale(master, label="Confidence threshold", from_=0.05, to=0.95, resolution=0.05,
+                                   orient=tk.HORIZONTAL, length=300)
+        self.conf_scale.set(CONF_THRESHOLD)
+        self.conf_scale.pack()
+
+        self.iou_scale = tk.Scale(master, label="IoU threshold", from_=0.05, to=0.95, resolution=0.05,
+                                  orient=tk.HORIZONTAL, length=300)
+        self.iou_scale.set(IOU_THRESHOLD)
+        self.iou_scale.pack()
+
         self.infer_button = tk.Button(master, text="Run Inference", command=self.run_inference_ui)
         self.infer_button.pack(pady=5)
 
+        self.cancel_button = tk.Button(master, text="Cancel", command=self.cancel_inference, state=tk.DISABLED)
+        self.cancel_button.pack(pady=5)
+
+        self.progress = ttk.Progressbar(master, mode="indeterminate", length=300)
+        self.progress.pack(pady=5)
+
         self.results_label = tk.Label(master, text="Inference results will appear here")
         self.results_label.pack(pady=10)
 
@@ -73,31 +162,136 @@ class ONNXInferenceApp:
         file_path = filedialog.askopenfilename(initialdir="samples", title="Select Image",
                                                filetypes=( ("Image Files", "*.jpg;*.png;*.jpeg"), ("All Files", "*.*") ))
         if file_path:
-            self.image_path = file_path
             try:
-                img = Image.open(file_path)
-                img = img.resize((400, 300))  # Resize for display
-                self.photo = ImageTk.PhotoImage(img)
-                self.img_label.configure(image=self.photo, text="")
-                self.img_label.image = self.photo
+                with timer("read"):
+                    self.image = load_image_bgr(file_path)
+                self.image_digest = file_digest(file_path)
+                self.image_path = file_path
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to load image: {e}")
+                return
+            # Show cached detections right away if this image was already run with these settings
+            detections = self.cache.get(self.current_key())
+            self.show_image(detections)
+            self.show_results(detections)
+
+    def current_key(self):
+        return ResultCache.make_key(self.image_digest, self.model_file, self.conf_scale.get(), self.iou_scale.get())
+
+    def show_image(self, detections=None):
+        image = self.image
+        if detections is not None:
+            image = draw_detections(image.copy(), *detections)
+        img = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        img.thumbnail(DISPLAY_SIZE)  # Resize for display, keeping the aspect ratio
+        self.photo = ImageTk.PhotoImage(img)
+        self.img_label.configure(image=self.photo, text="")
+        self.img_label.image = self.photo
+
+    def show_results(self, detections):
+        if detections is None:
+            self.results_label.config(text="Inference results will appear here")
+            return
+        boxes, scores, class_ids = detections
+        result_text = f"{len(boxes)} detections\n"
+        for cls in np.unique(class_ids):
+            result_text += f"Class {cls}: {int(np.sum(class_ids == cls))}\n"
+        self.results_label.config(text=result_text)
 
     def run_inference_ui(self):
         if not self.image_path:
             messagebox.showerror("Error", "Please load an image first.")
             return
+        if self.worker is not None:
+            return
+        key = self.current_key()
+        detections = self.cache.get(key)
+        if detections is not None:
+            self.show_image(detections)
+            self.show_results(detections)
+            return
+
+        self.cancel_event.clear()
+        self.run_options = ort.RunOptions()
+        self.worker = threading.Thread(target=self._inference_job,
+                                       args=(key, self.image, self.conf_scale.get(), self.iou_scale.get()),
+                                       daemon=True)
+        self.infer_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.progress.start()
+        self.worker.start()
+        self.master.after(POLL_INTERVAL_MS, self._poll_messages)
+
+    def cancel_inference(self):
+        self.cancel_event.set()
+        if self.run_options is not None:
+            self.run_options.terminate = True
+        self.results_label.config(text="Cancelling...")
+
+    def _inference_job(self, key, image, conf_threshold, iou_threshold):
+        # Runs on the worker thread: never touch Tk widgets here, only post messages
+        def report(stage):
+            if self.cancel_event.is_set():
+                raise InterruptedError
+            self.messages.put(("progress", stage))
+
         try:
-            outputs = run_inference(self.model_file, self.image_path)
-            result_text = "Inference outputs:\n"
-            for idx, output in enumerate(outputs):
-                result_text += f"Output {idx}: shape {output.shape}\n"
-            self.results_label.config(text=result_text)
+            detections = run_inference(self.model_file, image, conf_threshold, iou_threshold, self.run_options, report,
+                                       self.session_options)
+            # Posted directly: a cancel arriving now must not throw away a finished result
+            self.messages.put(("done", key, detections))
         except Exception as e:
-            messagebox.showerror("Inference Error", str(e))
+            if self.cancel_event.is_set():
+                self.messages.put(("cancelled",))
+            else:
+                self.messages.put(("error", str(e)))
+
+    def _poll_messages(self):
+        finished = False
+        while True:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "progress":
+                self.results_label.config(text=f"{message[1]}...")
+            elif kind == "done":
+                _, key, detections = message
+                self.cache.put(key, detections)
+                self.inference_runs += 1
+                # The user may have loaded another image meanwhile; only draw if it is still shown
+                if key[0] == self.image_digest:
+                    self.show_image(detections)
+                    self.show_results(detections)
+                finished = True
+            elif kind == "cancelled":
+                self.results_label.config(text="Inference cancelled")
+                finished = True
+            elif kind == "error":
+                messagebox.showerror("Inference Error", message[1])
+                finished = True
+        if finished:
+            self.worker = None
+            self.run_options = None
+            self.progress.stop()
+            self.infer_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+        else:
+            self.master.after(POLL_INTERVAL_MS, self._poll_messages)
 
 
-if __name__ == "__main__":
+def main():
+    parser = argparse.ArgumentParser(description='GUI app for ONNX-based YOLO inference.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = ONNXInferenceApp(root)
-    root.mainloop() 
\ No newline at end of file
+    app = ONNXInferenceApp(root, start_profile(args))
+    root.mainloop()
+    # Only end onnxruntime profiling of a session that was actually used
+    finish_profile(args, [get_session(app.model_file, **app.session_options)] if app.inference_runs else [])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""PyLab command line: one entry point for the GeoTIFF, inference and GUI tools.
+
+Usage:
+    python main.py info                     # versions of Python and the installed packages
+    python main.py info testimage.tif       # georeferencing of a GeoTIFF (pytiff.py info)
+    python main.py tiff layout testimage.tif
+    python main.py infer samples/bus.jpg --model yolov8s.onnx
+    python main.py draw samples/bus.jpg
+    python main.py video drone.mp4 --output annotated.mp4 --target-fps 30
+    python main.py gui [--onnx]
+    python main.py export [--dynamic]
+    python main.py quantize --calibration testimage.tif
+    python main.py index query detections.idx --nearest 500250 3999300 --k 5
+    python main.py render testimage.tif --output annotated.tif --preview preview.jpg
+    python main.py ensemble testimage.tif --models yolov8s.onnx yolov8n.onnx --weights 2 1
+
+Each subcommand hands its remaining arguments to the main() of the script that implements it,
+so ``python main.py infer --help`` shows that script's options. The scripts, and with them
+cv2, onnxruntime, rasterio and tkinter, are only imported once a subcommand has been chosen;
+``--help`` and the version report start without any of them.
+"""
+
+import argparse
+import sys
+
+# Parameters
+VERSION_PACKAGES = ('numpy', 'opencv-python', 'opencv-python-headless', 'onnxruntime', 'onnx', 'rasterio', 'GDAL',
+                    'customtkinter', 'Pillow', 'ultralytics')
+
+
+def print_versions():
+    """Print the versions of Python and the packages the tools use, without importing the packages."""
+    from importlib import metadata
+    print(f"Python: {sys.version.split()[0]}")
+    for name in VERSION_PACKAGES:
+        try:
+            version = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            version = 'not installed'
+        print(f"{name}: {version}")
+
+
+def forward(main, prog, argv):
+    """Run a script's main() as if it had been started with argv."""
+    saved = sys.argv
+    sys.argv = [prog] + list(argv)
+    try:
+        return main()
+    finally:
+        sys.argv = saved
+
+
+# The imports below stay literal, inside each command, so PyInstaller and Nuitka still find them
+
+def run_info(prog, argv):
+    if not argv:
+        print_versions()
+        return
+    from pytiff import main
+    # pytiff.py adds its own 'info' subcommand to the program name
+    forward(main, prog.rsplit(' ', 1)[0], ['info'] + argv)
+
+
+def run_tiff(prog, argv):
+    from pytiff import main
+    forward(main, prog, argv)
+
+
+def run_infer(prog, argv):
+    from run_onnx_inference import main
+    forward(main, prog, argv)
+
+
+def run_draw(prog, argv):
+    from run_onnx_inference_draw import main
+    forward(main, prog, argv)
+
+
+def run_video(prog, argv):
+    from video_inference import main
+    forward(main, prog, argv)
+
+
+def run_gui(prog, argv):
+    parser = argparse.ArgumentParser(prog=prog, description='Start a PyLab GUI.',
+                                     epilog='Other arguments, e.g. --profile, go to the ONNX inference app.')
+    parser.add_argument('--onnx', action='store_true', help='Start the ONNX inference app instead of the raster viewer.')
+    args, rest = parser.parse_known_args(argv)
+    if args.onnx:
+        from gui_onnx_inference_app import main
+        forward(main, prog, rest)
+        return
+    from src.main import main
+    forward(main, prog, rest)
+
+
+def run_export(prog, argv):
+    from convert_yolov8s_to_onnx import main
+    forward(main, prog, argv)
+
+
+def run_quantize(prog, argv):
+    from quantize_model import main
+    forward(main, prog, argv)
+
+
+def run_index(prog, argv):
+    from spatial_index import main
+    forward(main, prog, argv)
+
+
+def run_render(prog, argv):
+    from render_detections import main
+    forward(main, prog, argv)
+
+
+def run_ensemble(prog, argv):
+    from ensemble_inference import main
+    forward(main, prog, argv)
+
+
+COMMANDS = {
+    'info': (run_info, 'Print package versions, or the georeferencing of a GeoTIFF.'),
+    'tiff': (run_tiff, 'GeoTIFF tools: info, layout, cog, scan, query (pytiff.py).'),
+    'infer': (run_infer, 'Run the ONNX model on an image and print the output shapes.'),
+    'draw': (run_draw, 'Run the ONNX model on an image and show the detections.'),
+    'video': (run_video, 'Run the ONNX model over a video or an image sequence.'),
+    'gui': (run_gui, 'Start the raster viewer, or the ONNX inference app with --onnx.'),
+    'export': (run_export, 'Export yolov8s.pt to ONNX.'),
+    'quantize': (run_quantize, 'Build INT8/FP16 variants and report accuracy vs speed.'),
+    'index': (run_index, 'Build and query a spatial index over detections: build, query.'),
+    'render': (run_render, 'Draw detections into an annotated, tiled GeoTIFF.'),
+    'ensemble': (run_ensemble, 'Run several ONNX models with shared preprocessing and fuse their detections.'),
+}
+
+
+def main(argv=None):
+    epilog = 'commands:\n' + '\n'.join(f'  {name:<10}{description}' for name, (_, description) in COMMANDS.items())
+    parser = argparse.ArgumentParser(prog='pylab', description='PyLab GeoTIFF, inference and GUI tools.',
+                                     epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=COMMANDS, metavar='command', help='One of the commands below.')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments of the command; see pylab <command> --help.')
+    args = parser.parse_args(argv)
+
+    run, _ = COMMANDS[args.command]
+    run(f'pylab {args.command}', args.args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+"""Merge detections across tile seams and write them as georeferenced GeoJSON/GeoPackage.
+
+Usage:
+    python merge_detections.py testimage.tif --output detections.geojson --method wbf
+
+Tiled inference reports objects on tile seams once per tile. The merge stage runs a global
+NMS (or weighted box fusion) over all detections of a scene. Candidate pairs are only formed
+between boxes sharing a spatial grid bucket, so the cost grows with the number of
+overlapping boxes rather than quadratically with the number of detections.
+
+Merged pixel boxes are converted to map coordinates in one vectorized step with the dataset
+affine transform (``src.transform``) and streamed to GeoJSON or GeoPackage in the source CRS.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import rasterio
+
+from batch_inference import auto_batch_size
+from raster_input import RasterTileReader, add_band_arguments
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, box_areas
+from session_pool import get_session
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, run_tiled_inference
+
+# Parameters
+WRITE_CHUNK_SIZE = 10000
+# Percentile of the box sides used as the grid cell size, and the growth of the cell for larger boxes
+CELL_PERCENTILE = 95
+LEVEL_FACTOR = 4
+
+
+def bucket_entries(boxes, index, cell, origin, rows, n):
+    """Return the sorted bucket keys and box indices of the grid buckets each box touches.
+
+    Every (bucket, box) entry is one sortable int64 key, deduplicated for boxes inside a
+    single bucket.
+    """
+    x0, y0 = np.floor((boxes[:, 0:2] - origin) / cell).astype(np.int64).T
+    x1, y1 = np.floor((boxes[:, 2:4] - origin) / cell).astype(np.int64).T
+    keys = np.unique(np.concatenate([(x * rows + y) * n + index for x in (x0, x1) for y in (y0, y1)]))
+    return keys // n, keys % n
+
+
+def same_bucket_pairs(buckets, entries, n):
+    """Return the pair codes i * n + j, i < j, of entries sharing a bucket."""
+    # Pair every entry with the ones k places further on while they are still in the same bucket;
+    # buckets are small, so this loops only up to the largest bucket size
+    pairs = []
+    for k in range(1, len(buckets)):
+        same = buckets[:-k] == buckets[k:]
+        if not same.any():
+            break
+        pairs.append(entries[:-k][same] * n + entries[k:][same])
+    return pairs
+
+
+def cross_bucket_pairs(buckets, entries, other_buckets, other_entries, n):
+    """Return the pair codes of every entry of one sorted bucket list with the entries of another in its bucket."""
+    low = np.searchsorted(buckets, other_buckets, side="left")
+    counts = np.searchsorted(buckets, other_buckets, side="right") - low
+    total = int(counts.sum())
+    if total == 0:
+        return []
+    starts = np.repeat(low - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+    first = entries[starts + np.arange(total)]
+    second = np.repeat(other_entries, counts)
+    return [np.minimum(first, second) * n + np.maximum(first, second)]
+
+
+def candidate_pairs(boxes, cell_percentile=CELL_PERCENTILE):
+    """Return the (i, j) index pairs, i < j, of boxes that share a spatial grid bucket.
+
+    The bucket size is a high percentile of the box sides, so a few very large boxes do not
+    coarsen the grid for all the others. Larger boxes are bucketed on coarser grids, each
+    LEVEL_FACTOR times the previous, with cells at least as large as their sides, and only
+    paired with the boxes of their own or finer levels in the same coarse bucket. Every pair
+    of overlapping boxes thus shares a bucket on the grid of the larger one, and each box
+    falls in at most 2 x 2 buckets per grid.
+    """
+    n = len(boxes)
+    if n < 2:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    sides = np.max(boxes[:, 2:4] - boxes[:, 0:2], axis=1)
+    cell = max(float(np.percentile(sides, cell_percentile)), 1.0)
+    levels = np.zeros(n, dtype=np.int64)
+    large = sides > cell
+    levels[large] = np.ceil(np.log(sides[large] / cell) / np.log(LEVEL_FACTOR)).astype(np.int64)
+    # Guard against rounding in the logarithm
+    levels += sides > cell * np.float64(LEVEL_FACTOR) ** levels
+    origin = boxes[:, 0:2].min(axis=0)
+    index = np.arange(n, dtype=np.int64)
+    pairs = []
+    for level in np.unique(levels):
+        level_cell = cell * LEVEL_FACTOR ** int(level)
+        rows = int(np.floor((boxes[:, 3].max() - origin[1]) / level_cell)) + 1
+        members = levels == level
+        buckets, entries = bucket_entries(boxes[members], index[members], level_cell, origin, rows, n)
+        pairs += same_bucket_pairs(buckets, entries, n)
+        finer = levels < level
+        if finer.any():
+            pairs += cross_bucket_pairs(buckets, entries,
+                                        *bucket_entries(boxes[finer], index[finer], level_cell, origin, rows, n), n)
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    pairs = np.unique(np.concatenate(pairs))
+    return pairs // n, pairs % n
+
+
+def pair_iou(boxes, i, j):
+    """Compute the IoU of box i[k] with box j[k] for every k."""
+    x1 = np.maximum(boxes[i, 0], boxes[j, 0])
+    y1 = np.maximum(boxes[i, 1], boxes[j, 1])
+    x2 = np.minimum(boxes[i, 2], boxes[j, 2])
+    y2 = np.minimum(boxes[i, 3], boxes[j, 3])
+    inter_area = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas = box_areas(boxes)
+    union = areas[i] + areas[j] - inter_area
+    return np.divide(inter_area, union, out=np.zeros_like(inter_area, dtype=np.float64), where=union > 0)
+
+
+def cluster_detections(boxes, scores, class_ids, iou_threshold=IOU_THRESHOLD, class_aware=False):
+    """Greedy NMS over all boxes using only the bucketed candidate pairs.
+
+    Returns (keep, cluster): the kept indices, highest score first, and for every box the
+    index of the kept box that suppressed it (kept boxes point to themselves). The kept set
+    is exactly what a full pairwise greedy NMS would keep.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    class_ids = np.asarray(class_ids)
+    i, j = candidate_pairs(boxes)
+    overlapping = pair_iou(boxes, i, j) >= iou_threshold
+    if class_aware:
+        overlapping &= class_ids[i] == class_ids[j]
+    i, j = i[overlapping], j[overlapping]
+
+    # Symmetric adjacency in CSR form
+    src = np.concatenate([i, j])
+    dst = np.concatenate([j, i])
+    order = np.argsort(src, kind="stable")
+    src, dst = src[order], dst[order]
+    offsets = np.searchsorted(src, np.arange(len(boxes) + 1))
+
+    # Boxes without overlapping neighbours are kept as they are; only the rest needs the greedy pass
+    cluster = np.arange(len(boxes), dtype=np.int64)
+    has_neighbours = np.diff(offsets) > 0
+    cluster[has_neighbours] = -1
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    for current in order[has_neighbours[order]]:
+        if cluster[current] >= 0:
+            continue
+        cluster[current] = current
+        neighbours = dst[offsets[current]:offsets[current + 1]]
+        cluster[neighbours[cluster[neighbours] < 0]] = current
+    keep = order[cluster[order] == order]
+    return keep, cluster
+
+
+def merge_detections(boxes, scores, class_ids, iou_threshold=IOU_THRESHOLD, method="nms", class_aware=False):
+    """Merge duplicate detections of a whole scene.
+
+    method="nms" keeps the highest scoring box of each cluster; method="wbf" replaces it by
+    the score-weighted average of all boxes in the cluster, with the cluster's mean score.
+    Like the per-tile NMS of postprocess_batch, merging is class-agnostic by default, so an
+    object labelled differently in two tiles is still merged; the kept box's class wins.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32)
+    class_ids = np.asarray(class_ids)
+    if len(boxes) == 0:
+        return boxes, scores, class_ids
+    keep, cluster = cluster_detections(boxes, scores, class_ids, iou_threshold, class_aware)
+    if method == "nms":
+        return boxes[keep], scores[keep], class_ids[keep]
+    if method != "wbf":
+        raise ValueError(f"Unknown merge method '{method}', expected 'nms' or 'wbf'")
+
+    weighted = np.zeros((len(boxes), 4), dtype=np.float64)
+    weights = np.zeros(len(boxes), dtype=np.float64)
+    counts = np.zeros(len(boxes), dtype=np.int64)
+    np.add.at(weighted, cluster, boxes * scores[:, None])
+    np.add.at(weights, cluster, scores)
+    np.add.at(counts, cluster, 1)
+    fused = (weighted[keep] / np.maximum(weights[keep], 1e-12)[:, None]).astype(np.float32)
+    return fused, (weights[keep] / counts[keep]).astype(np.float32), class_ids[keep]
+
+
+def pixel_to_map(boxes, transform):
+    """Convert (N, 4) pixel boxes into (N, 5, 2) closed map-coordinate rings with an affine transform.
+
+    All four corners are transformed, so rotated or sheared transforms are handled too.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    cols = boxes[:, [0, 2, 2, 0, 0]]
+    rows = boxes[:, [1, 1, 3, 3, 1]]
+    a, b, c, d, e, f = transform[:6]
+    return np.stack([a * cols + b * rows + c, d * cols + e * rows + f], axis=-1)
+
+
+def iter_features(rings, scores, class_ids):
+    """Yield GeoJSON Feature dicts for the detections."""
+    for ring, score, cls in zip(rings.tolist(), scores.tolist(), class_ids.tolist()):
+        yield {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [ring]},
+            "properties": {"class_id": int(cls), "score": round(float(score), 4)},
+        }
+
+
+def write_geojson(path, rings, scores, class_ids, crs=None):
+    """Stream detections to a GeoJSON FeatureCollection, chunk by chunk.
+
+    The source CRS is recorded in the legacy ``crs`` member when it has an EPSG code.
+    """
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection",\n')
+        epsg = crs.to_epsg() if crs is not None else None
+        if epsg is not None:
+            f.write(f'"crs": {{"type": "name", "properties": {{"name": "urn:ogc:def:crs:EPSG::{epsg}"}}}},\n')
+        f.write('"features": [\n')
+        first = True
+        for start in range(0, len(rings), WRITE_CHUNK_SIZE):
+            end = start + WRITE_CHUNK_SIZE
+            for feature in iter_features(rings[start:end], scores[start:end], class_ids[start:end]):
+                f.write(("" if first else ",\n") + json.dumps(feature))
+                first = False
+        f.write("\n]}\n")
+
+
+def write_geopackage(path, rings, scores, class_ids, crs=None, layer_name="detections"):
+    """Stream detections to a GeoPackage layer through OGR, one transaction per chunk."""
+    try:
+        from osgeo import ogr, osr
+    except ImportError:
+        raise ImportError("GDAL's Python bindings (osgeo) are required to write GeoPackage files.")
+
+    driver = ogr.GetDriverByName("GPKG")
+    if os.path.exists(path):
+        driver.DeleteDataSource(path)
+    datasource = driver.CreateDataSource(path)
+    srs = None
+    if crs is not None:
+        srs = osr.SpatialReference()
+        srs.ImportFromWkt(crs.to_wkt())
+    layer = datasource.CreateLayer(layer_name, srs, ogr.wkbPolygon)
+    layer.CreateField(ogr.FieldDefn("class_id", ogr.OFTInteger))
+    layer.CreateField(ogr.FieldDefn("score", ogr.OFTReal))
+    definition = layer.GetLayerDefn()
+    for start in range(0, len(rings), WRITE_CHUNK_SIZE):
+        end = start + WRITE_CHUNK_SIZE
+        layer.StartTransaction()
+        for feature in iter_features(rings[start:end], scores[start:end], class_ids[start:end]):
+            ogr_feature = ogr.Feature(definition)
+            ogr_feature.SetField("class_id", feature["properties"]["class_id"])
+            ogr_feature.SetField("score", feature["properties"]["score"])
+            ogr_feature.SetGeometry(ogr.CreateGeometryFromJson(json.dumps(feature["geometry"])))
+            layer.CreateFeature(ogr_feature)
+        layer.CommitTransaction()
+    datasource = None
+
+
+def write_detections(path, boxes, scores, class_ids, transform, crs=None):
+    """Georeference pixel boxes and write them; the format follows the file extension."""
+    rings = pixel_to_map(boxes, transform)
+    if path.lower().endswith(".gpkg"):
+        write_geopackage(path, rings, scores, class_ids, crs)
+    else:
+        write_geojson(path, rings, scores, class_ids, crs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tiled inference, merge seams and write georeferenced output.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--output', default='detections.geojson', help='Output .geojson or .gpkg file.')
+    parser.add_argument('--method', choices=['nms', 'wbf'], default='nms', help='How to merge seam duplicates.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--conf', type=float, default=CONF_THRESHOLD, help='Confidence threshold.')
+    parser.add_argument('--iou', type=float, default=IOU_THRESHOLD, help='IoU threshold for merging.')
+    parser.add_argument('--class-aware', action='store_true', help='Only merge boxes of the same class.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    sess = get_session(args.model)
+    with rasterio.open(args.raster) as src:
+        reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+        detections = run_tiled_inference(sess, src, args.tile_size, args.overlap, args.conf, args.iou,
+                                         auto_batch_size(sess), reader=reader)
+        boxes, scores, class_ids = merge_detections(*detections, iou_threshold=args.iou, method=args.method,
+                                                    class_aware=args.class_aware)
+        write_detections(args.output, boxes, scores, class_ids, src.transform, src.crs)
+
+    print(f"Tile detections: {len(detections[0])}, after merging: {len(boxes)}")
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""Memory-mapped store of raw model outputs per tile, for re-thresholding without model calls.
+
+Usage:
+    python output_store.py testimage.tif --model yolov8s.onnx --conf 0.2 0.25 0.35 --iou 0.45 0.6
+    python output_store.py testimage.tif --store ~/.cache/pylab/outputs
+
+Threshold tuning re-runs only the postprocess step, yet tiled_inference re-reads, re-decodes
+and re-runs the model every time. Here the first run over a scene writes the raw output
+tensors of every tile into .npy files opened with ``np.lib.format.open_memmap``, one row per
+tile, next to the tile windows. Later runs with any conf/iou thresholds memory map the outputs and run postprocess_batch over them, with
+no session and no raster reads.
+
+Tiles are read through raster_input.RasterTileReader, and tiles without a valid pixel are not
+recorded. An entry is keyed by the raster (absolute path, modification time and size), the
+model digest, the tile size, the overlap and the reader's band selection and stretch, so
+editing either file starts a new entry.
+Its meta.json is written last; an interrupted recording is never read back. Raw YOLOv8
+outputs are 84 x 8400 float32, about 2.8 MB per tile, so an entry is large: prefer a fast
+local disk, and remove entries with clear().
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from batch_inference import auto_batch_size
+from preprocess_buffer import BatchPreprocessor, make_runner
+from profiling import count
+from raster_input import RasterTileReader, add_band_arguments
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, postprocess_batch
+from session_pool import get_session, model_digest
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, concat_detections, generate_windows, to_image_coordinates
+
+# Parameters
+STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pylab", "outputs")
+# Tiles postprocessed per step when reading an entry back
+READ_CHUNK = 64
+
+
+def entry_key(raster_path, model_key, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, fingerprint=None):
+    """Return the directory name of the entry of one raster version, model, tiling and tile reader.
+
+    fingerprint is RasterTileReader.fingerprint() of the reader the tiles are read with, that
+    of the default reader of the raster when None.
+    """
+    raster_path = os.path.abspath(raster_path)
+    if fingerprint is None:
+        with rasterio.open(raster_path) as src:
+            fingerprint = RasterTileReader(src, tile_size=tile_size).fingerprint()
+    stat = os.stat(raster_path)
+    key = f"{raster_path}|{stat.st_mtime_ns}|{stat.st_size}|{model_key}|{tile_size}|{overlap}|{fingerprint}"
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+class OutputEntry:
+    """The memory-mapped raw outputs of every tile of one scene."""
+
+    def __init__(self, directory, meta, windows, outputs):
+        self.directory = directory
+        self.meta = meta
+        self.windows = windows
+        self.outputs = outputs
+
+    def __len__(self):
+        return len(self.windows)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a complete entry, or return None if the directory holds none."""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        outputs = [np.load(os.path.join(directory, f"output{i}.npy"), mmap_mode=mmap_mode)
+                   for i in range(meta['outputs'])]
+        return cls(directory, meta, np.load(os.path.join(directory, "windows.npy")), outputs)
+
+    def window(self, index):
+        return Window(*self.windows[index].tolist())
+
+    def iter_detections(self, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, chunk=READ_CHUNK):
+        """Yield (window, boxes, scores, class_ids) for every tile from the stored outputs, in image pixels."""
+        for start in range(0, len(self), chunk):
+            # Rows past the recorded tiles are unused, see OutputStore.record
+            outputs = [output[start:min(start + chunk, len(self))] for output in self.outputs]
+            for index, (boxes, scores, class_ids) in enumerate(
+                    postprocess_batch(outputs, conf_threshold, iou_threshold), start):
+                window = self.window(index)
+                yield window, to_image_coordinates(boxes, window), scores, class_ids
+
+    def detections(self, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+        """Return the concatenated (boxes, scores, class_ids) of the scene, as run_tiled_inference does."""
+        return concat_detections([tuple(tile[1:]) for tile in self.iter_detections(conf_threshold, iou_threshold)])
+
+
+class OutputStore:
+    """A directory of OutputEntry subdirectories, one per (raster version, model, tiling)."""
+
+    def __init__(self, directory=STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_dir(self, raster_path, model_key, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, fingerprint=None):
+        return os.path.join(self.directory, entry_key(raster_path, model_key, tile_size, overlap, fingerprint))
+
+    def get(self, raster_path, model_key, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, fingerprint=None):
+        return OutputEntry.load(self.entry_dir(raster_path, model_key, tile_size, overlap, fingerprint))
+
+    def record(self, sess, src, model_key, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=1, reader=None):
+        """Run the session once over every tile of src and write its raw outputs to a new entry.
+
+        Tiles are read through reader, a RasterTileReader of the first three bands by default.
+        """
+        reader = reader or RasterTileReader(src, tile_size=tile_size)
+        directory = self.entry_dir(src.name, model_key, tile_size, overlap, reader.fingerprint())
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        windows = list(generate_windows(src.width, src.height, tile_size, overlap))
+
+        preprocessor = BatchPreprocessor(batch_size, (tile_size, tile_size))
+        run = make_runner(sess, batch_size)
+        outputs = None
+        recorded, pending = [], []
+        for index, window in enumerate(windows):
+            data, valid = reader.read(window)
+            if valid is not None and not valid.any():
+                count("nodata_tiles")
+            else:
+                reader.normalize(data, valid, preprocessor.batch[len(pending)])
+                pending.append(window)
+            if pending and (len(pending) == batch_size or index == len(windows) - 1):
+                results = run(preprocessor.batch[:len(pending)])
+                count("tiles", len(pending))
+                if outputs is None:
+                    # The per-tile output shapes are only known once the model has run; rows of
+                    # skipped nodata tiles are left unused at the end
+                    outputs = [np.lib.format.open_memmap(os.path.join(directory, f"output{i}.npy"), mode='w+',
+                                                         dtype=np.float32, shape=(len(windows),) + result.shape[1:])
+                               for i, result in enumerate(results)]
+                for output, result in zip(outputs, results):
+                    output[len(recorded):len(recorded) + len(pending)] = result
+                recorded += pending
+                pending = []
+        for output in outputs or []:
+            output.flush()
+        np.save(os.path.join(directory, "windows.npy"),
+                np.array([[w.col_off, w.row_off, w.width, w.height] for w in recorded], dtype=np.int64).reshape(-1, 4))
+
+        meta = {'raster': os.path.abspath(src.name), 'model': model_key, 'tile_size': tile_size,
+                'overlap': overlap, 'reader': reader.fingerprint(), 'tiles': len(recorded),
+                'outputs': len(outputs or []), 'created': time.time()}
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return OutputEntry.load(directory)
+
+    def get_or_record(self, sess, src, model_key, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=1,
+                      reader=None):
+        """Return the stored entry of src, recording it first if there is none."""
+        reader = reader or RasterTileReader(src, tile_size=tile_size)
+        entry = self.get(src.name, model_key, tile_size, overlap, reader.fingerprint())
+        if entry is None:
+            entry = self.record(sess, src, model_key, tile_size, overlap, batch_size, reader)
+        return entry
+
+    def clear(self):
+        shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep postprocess thresholds over stored raw model outputs.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--store', default=STORE_DIR, help='Directory of the output store.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--conf', type=float, nargs='+', default=[CONF_THRESHOLD], help='Confidence thresholds.')
+    parser.add_argument('--iou', type=float, nargs='+', default=[IOU_THRESHOLD], help='IoU thresholds for NMS.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    store = OutputStore(args.store)
+    model_key = model_digest(args.model)
+    with rasterio.open(args.raster) as src:
+        reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+        entry = store.get(args.raster, model_key, args.tile_size, args.overlap, reader.fingerprint())
+        if entry is None:
+            sess = get_session(args.model)
+            start = time.perf_counter()
+            entry = store.record(sess, src, model_key, args.tile_size, args.overlap, auto_batch_size(sess), reader)
+            print(f"Recorded {len(entry)} tiles in {time.perf_counter() - start:.2f}s to {entry.directory}")
+        else:
+            print(f"Using {len(entry)} stored tiles from {entry.directory}")
+
+    for conf, iou in itertools.product(args.conf, args.iou):
+        start = time.perf_counter()
+        boxes, _, class_ids = entry.detections(conf, iou)
+        print(f"conf {conf:.2f}  iou {iou:.2f}: {len(boxes):6d} detections, "
+              f"{len(np.unique(class_ids))} classes ({time.perf_counter() - start:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
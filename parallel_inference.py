@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+"""Multi-process tiled YOLO inference over whole scenes and many files.
+
+Usage:
+    python parallel_inference.py testimage.tif other.tif --workers 8 --compare
+
+Raster windows are split into chunks and spread over a process pool. Each worker opens its
+own ONNX session once (in the pool initializer) and its own rasterio dataset handles, reads
+its windows itself and sends back only compact detection arrays, so no pixels cross process
+boundaries. Intra-op threads per worker are set to cores // workers so the workers together
+do not oversubscribe the CPU. Workers read through raster_input.RasterTileReader, so --bands and
+--stretch apply as in tiled_inference.py and tiles without a valid pixel are skipped.
+
+With --compare the same rasters are also run through the single-process tiled path and the
+speedup is reported.
+"""
+
+import argparse
+import collections
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import rasterio
+from rasterio.windows import Window
+
+from batch_inference import iter_batches
+from preprocess_buffer import BatchPreprocessor, make_runner
+from raster_input import RasterTileReader, add_band_arguments
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD
+from session_pool import get_session
+from tiled_inference import (
+    TILE_OVERLAP,
+    TILE_SIZE,
+    concat_detections,
+    generate_windows,
+    postprocess_tiles,
+    run_tiled_inference,
+)
+
+# Parameters
+TILES_PER_TASK = 32
+BATCH_SIZE = 4
+MAX_OPEN_DATASETS = 4
+
+# Per-process state, filled in by _init_worker
+_worker = {}
+
+
+def threads_per_worker(workers, cpu_count=None):
+    """Split the available cores evenly between the workers."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return max(1, cpu_count // workers)
+
+
+def pool_size(workers, task_count):
+    """No more processes than tasks; the cores are split between the processes actually started."""
+    return min(workers, max(1, task_count))
+
+
+def _init_worker(model_file, intra_op_threads):
+    _worker["sess"] = get_session(model_file, intra_op_threads=intra_op_threads)
+    _worker["readers"] = collections.OrderedDict()
+
+
+def _open_reader(raster_path, tile_size, bands, percentiles):
+    """Return this worker's tile reader for the raster, keeping only a few files open."""
+    readers = _worker["readers"]
+    key = (raster_path, tile_size, bands, percentiles)
+    if key in readers:
+        readers.move_to_end(key)
+        return readers[key]
+    if len(readers) >= MAX_OPEN_DATASETS:
+        _, oldest = readers.popitem(last=False)
+        oldest.src.close()
+    readers[key] = RasterTileReader(rasterio.open(raster_path), bands, percentiles, tile_size)
+    return readers[key]
+
+
+def _detect_windows(raster_path, windows, tile_size, conf_threshold, iou_threshold, batch_size, bands=None,
+                    percentiles='default'):
+    """Worker task: read and run a chunk of windows, return (raster_path, tile count, detections)."""
+    reader = _open_reader(raster_path, tile_size, bands, percentiles)
+    key = (tile_size, batch_size)
+    if _worker.get("buffers_key") != key:
+        _worker["buffers_key"] = key
+        _worker["preprocessor"] = BatchPreprocessor(batch_size, (tile_size, tile_size))
+        _worker["run"] = make_runner(_worker["sess"], batch_size)
+    preprocessor, run = _worker["preprocessor"], _worker["run"]
+    detections = []
+    for batch in iter_batches([Window(*w) for w in windows], batch_size):
+        kept = []
+        for window in batch:
+            data, valid = reader.read(window)
+            if valid is not None and not valid.any():
+                continue
+            reader.normalize(data, valid, preprocessor.batch[len(kept)])
+            kept.append(window)
+        if kept:
+            outputs = run(preprocessor.batch[:len(kept)])
+            detections.extend(postprocess_tiles(outputs, kept, conf_threshold, iou_threshold))
+    return raster_path, len(windows), concat_detections(detections)
+
+
+def plan_tasks(raster_paths, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, tiles_per_task=TILES_PER_TASK):
+    """Split every raster into chunks of window tuples; a small raster is a single task."""
+    tasks = []
+    for raster_path in raster_paths:
+        with rasterio.open(raster_path) as src:
+            windows = [(w.col_off, w.row_off, w.width, w.height)
+                       for w in generate_windows(src.width, src.height, tile_size, overlap)]
+        for chunk in iter_batches(windows, tiles_per_task):
+            tasks.append((raster_path, chunk))
+    return tasks
+
+
+def run_parallel_inference(model_file, raster_paths, workers=None, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                           conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, batch_size=BATCH_SIZE,
+                           tiles_per_task=TILES_PER_TASK, bands=None, percentiles='default'):
+    """Run tiled inference over several rasters on a process pool.
+
+    bands and percentiles select and stretch the bands of every raster as in RasterTileReader.
+    Returns a dict mapping each raster path to its concatenated (boxes, scores, class_ids),
+    in full-image pixel coordinates.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Hashable, as the workers key their open readers by them
+    bands = tuple(bands) if bands else None
+    percentiles = percentiles if percentiles == 'default' else tuple(percentiles)
+    tasks = plan_tasks(raster_paths, tile_size, overlap, tiles_per_task)
+    results = {raster_path: [] for raster_path in raster_paths}
+    # Spawn rather than fork: forking a process with live onnxruntime thread pools can deadlock
+    context = multiprocessing.get_context("spawn")
+    processes = pool_size(workers, len(tasks))
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context, initializer=_init_worker,
+                             initargs=(model_file, threads_per_worker(processes))) as executor:
+        futures = [executor.submit(_detect_windows, raster_path, windows, tile_size, conf_threshold,
+                                   iou_threshold, batch_size, bands, percentiles)
+                   for raster_path, windows in tasks]
+        for future in as_completed(futures):
+            raster_path, _, detections = future.result()
+            results[raster_path].append(detections)
+    return {raster_path: concat_detections(detections) for raster_path, detections in results.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tiled YOLO inference over rasters on a process pool.')
+    parser.add_argument('rasters', nargs='+', help='Paths to the GeoTIFF files.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of worker processes.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Tiles per session call in a worker.')
+    parser.add_argument('--compare', action='store_true', help='Also time the single-process tiled path.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    start = time.perf_counter()
+    results = run_parallel_inference(args.model, args.rasters, args.workers, args.tile_size, args.overlap,
+                                     batch_size=args.batch_size, bands=args.bands,
+                                     percentiles=args.stretch or 'default')
+    parallel = time.perf_counter() - start
+
+    processes = pool_size(args.workers, len(plan_tasks(args.rasters, args.tile_size, args.overlap)))
+    print(f"Workers: {processes} x {threads_per_worker(processes)} intra-op threads")
+    for raster_path, (boxes, _, _) in results.items():
+        print(f"{raster_path}: {len(boxes)} detections")
+    print(f"Process pool: {parallel:.2f}s")
+
+    if args.compare:
+        sess = get_session(args.model)
+        start = time.perf_counter()
+        for raster_path in args.rasters:
+            with rasterio.open(raster_path) as src:
+                reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+                run_tiled_inference(sess, src, args.tile_size, args.overlap, batch_size=args.batch_size,
+                                    reader=reader)
+        single = time.perf_counter() - start
+        print(f"Single process: {single:.2f}s (speedup {single / parallel:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
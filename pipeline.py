@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""Prefetching streaming pipeline: read -> preprocess -> infer -> postprocess, overlapped on threads.
+
+Usage:
+    python pipeline.py testimage.tif --batch-size 4 --queue-depth 2
+    python pipeline.py scene_16bit.tif --bands 4 3 2 --stretch 2 98
+
+Every stage runs on its own thread and hands batches to the next one through a bounded queue,
+so the next tiles are read and preprocessed, and the previous batch is postprocessed, while the
+current batch is inside onnxruntime (which, like rasterio reads and most of cv2/numpy, releases
+the GIL). A full queue blocks the stage feeding it; that backpressure bounds memory to roughly
+queue_depth batches per stage. Per-stage busy time and throughput are recorded so the bottleneck
+stage can be read straight off the report.
+"""
+
+import argparse
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import rasterio
+
+from batch_inference import auto_batch_size, iter_batches, run_batch
+from raster_input import RasterTileReader, add_band_arguments
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, postprocess_batch
+from session_pool import get_session
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, concat_detections, generate_windows, to_image_coordinates
+
+# Parameters
+QUEUE_DEPTH = 2
+
+# Marks the end of the stream in a queue
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception raised in a stage thread down to the consumer."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+class StageStats:
+    """Item count, busy time and time spent blocked on the queues for one pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    @property
+    def throughput(self):
+        """Items per second of busy time, i.e. what the stage could sustain on its own."""
+        return self.items / self.busy_seconds if self.busy_seconds > 0 else float("inf")
+
+    def __repr__(self):
+        return (f"{self.name:<12} {self.items:>6} items  busy {self.busy_seconds:8.3f}s  "
+                f"waiting {self.wait_seconds:8.3f}s  {self.throughput:10.1f} items/s")
+
+
+class Pipeline:
+    """A chain of single-threaded stages connected by bounded queues.
+
+    Each stage is a (name, function) pair; the function takes one item and returns the item
+    for the next stage. Items come out of ``run`` in input order.
+    """
+
+    def __init__(self, stages, queue_depth=QUEUE_DEPTH):
+        self.stages = stages
+        self.queue_depth = queue_depth
+        self.stats = [StageStats(name) for name, _ in stages]
+        self._stop = threading.Event()
+
+    def _put(self, q, item):
+        # Poll so a stopped pipeline never leaves a thread blocked on a full queue
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _run_source(self, items, out_queue):
+        try:
+            for item in items:
+                if self._stop.is_set():
+                    return
+                self._put(out_queue, item)
+        except Exception as e:
+            self._put(out_queue, _Failure(e))
+            return
+        self._put(out_queue, _DONE)
+
+    def _run_stage(self, function, stats, in_queue, out_queue):
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            item = in_queue.get()
+            stats.wait_seconds += time.perf_counter() - start
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(out_queue, item)
+                return
+            start = time.perf_counter()
+            try:
+                result = function(item)
+            except Exception as e:
+                self._put(out_queue, _Failure(e))
+                return
+            stats.busy_seconds += time.perf_counter() - start
+            stats.items += 1
+            start = time.perf_counter()
+            self._put(out_queue, result)
+            stats.wait_seconds += time.perf_counter() - start
+
+    def run(self, items):
+        """Stream items through all stages and yield the results of the last stage."""
+        queues = [queue.Queue(maxsize=self.queue_depth) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._run_source, args=(items, queues[0]), daemon=True)]
+        for i, ((_, function), stats) in enumerate(zip(self.stages, self.stats)):
+            threads.append(threading.Thread(target=self._run_stage, args=(function, stats, queues[i], queues[i + 1]),
+                                             daemon=True))
+        self._stop.clear()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self._stop.set()
+            for q in queues:
+                # Unblock any stage still waiting on an empty queue
+                try:
+                    q.put_nowait(_DONE)
+                except queue.Full:
+                    pass
+            for thread in threads:
+                thread.join()
+
+    def report(self):
+        """Return a per-stage throughput report; the stage with the most busy time is the bottleneck."""
+        bottleneck = max(self.stats, key=lambda s: s.busy_seconds)
+        lines = [repr(stats) for stats in self.stats]
+        lines.append(f"Bottleneck: {bottleneck.name}")
+        return "\n".join(lines)
+
+
+def make_tiled_pipeline(sess, src, tile_size=TILE_SIZE, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD,
+                        queue_depth=QUEUE_DEPTH, reader=None):
+    """Build the read -> preprocess -> infer -> postprocess pipeline over batches of windows of src.
+
+    Tiles are read and stretched by a raster_input.RasterTileReader (the first three bands by
+    default); windows without a valid pixel are dropped in the read stage. The dataset handle
+    is only used by the read stage thread.
+    """
+    reader = reader or RasterTileReader(src, tile_size=tile_size)
+
+    def read(windows):
+        tiles = []
+        for window in windows:
+            data, valid = reader.read(window)
+            if valid is not None and not valid.any():
+                continue
+            # The reader reuses its buffer for the next window
+            tiles.append((window, data.copy(), valid))
+        return tiles
+
+    def preprocess(tiles):
+        batch = np.empty((len(tiles), len(reader.bands), tile_size, tile_size), dtype=np.float32)
+        for slot, (_, data, valid) in zip(batch, tiles):
+            reader.normalize(data, valid, slot)
+        return [window for window, _, _ in tiles], batch
+
+    def infer(item):
+        windows, tiles = item
+        return windows, run_batch(sess, tiles) if windows else None
+
+    def postprocess(item):
+        windows, outputs = item
+        if not windows:
+            return []
+        return [(window, to_image_coordinates(boxes, window), scores, class_ids)
+                for window, (boxes, scores, class_ids)
+                in zip(windows, postprocess_batch(outputs, conf_threshold, iou_threshold))]
+
+    stages = [("read", read), ("preprocess", preprocess), ("infer", infer), ("postprocess", postprocess)]
+    return Pipeline(stages, queue_depth)
+
+
+def run_pipelined_inference(sess, src, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, conf_threshold=CONF_THRESHOLD,
+                            iou_threshold=IOU_THRESHOLD, batch_size=1, queue_depth=QUEUE_DEPTH, reader=None):
+    """Pipelined equivalent of tiled_inference.run_tiled_inference.
+
+    Returns the concatenated (boxes, scores, class_ids) and the Pipeline, whose ``report()``
+    gives the per-stage throughput.
+    """
+    pipeline = make_tiled_pipeline(sess, src, tile_size, conf_threshold, iou_threshold, queue_depth, reader)
+    batches = iter_batches(generate_windows(src.width, src.height, tile_size, overlap), batch_size)
+    detections = [tuple(tile[1:]) for results in pipeline.run(batches) for tile in results]
+    return concat_detections(detections), pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tiled YOLO inference through a prefetching pipeline.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--batch-size', type=int, default=0, help='Tiles per session call, 0 to pick it from memory.')
+    parser.add_argument('--queue-depth', type=int, default=QUEUE_DEPTH, help='Batches buffered between stages.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    sess = get_session(args.model)
+    batch_size = args.batch_size or auto_batch_size(sess)
+
+    start = time.perf_counter()
+    with rasterio.open(args.raster) as src:
+        reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+        (boxes, _, _), pipeline = run_pipelined_inference(sess, src, args.tile_size, args.overlap,
+                                                          batch_size=batch_size, queue_depth=args.queue_depth,
+                                                          reader=reader)
+    elapsed = time.perf_counter() - start
+
+    print(f"Detections: {len(boxes)} in {elapsed:.2f}s (batch size {batch_size})")
+    print(pipeline.report())
+
+
+if __name__ == "__main__":
+    main()
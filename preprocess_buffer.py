@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+"""Fused, allocation-free preprocessing into a reusable float32 batch buffer, with IO binding.
+
+Usage:
+    python preprocess_buffer.py samples/bus.jpg --frames 200
+
+``preprocess_image``/``preprocess_image_cv`` allocate several full-size intermediates per frame
+(cvtColor output, resized image, float32 copy, transposed copy). BatchPreprocessor instead
+resizes into one preallocated uint8 scratch image and writes BGR->RGB, HWC->CHW and the 1/255
+normalization straight into a slot of a preallocated (N, 3, H, W) float32 batch in a single
+ufunc call per channel. Raster tiles, which are already RGB and CHW, are read by rasterio
+directly into a uint8 scratch buffer.
+
+IOBindingRunner feeds that batch to onnxruntime through IO binding and also binds preallocated
+output buffers, so neither inputs nor outputs are copied or reallocated per call.
+
+Running the script prints a microbenchmark of peak temporary allocation per frame and ns/pixel
+for the original preprocessing and the fused one.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+from batch_inference import fixed_batch_size, run_batch
+from profiling import timed, timer
+from run_onnx_inference_draw import LETTERBOX_COLOR, letterbox_geometry, preprocess_image_cv
+
+# Parameters
+INPUT_SIZE = (640, 640)
+SCALE = np.float32(1.0 / 255.0)
+
+
+class BatchPreprocessor:
+    """Owns a reusable (batch_size, 3, H, W) float32 batch and writes preprocessed frames into it."""
+
+    def __init__(self, batch_size, input_shape=INPUT_SIZE):
+        self.input_shape = input_shape
+        width, height = input_shape
+        self.batch = np.zeros((batch_size, 3, height, width), dtype=np.float32)
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        self._letterboxed = np.empty(height * width * 3, dtype=np.uint8)
+        self._chw = np.empty((3, height, width), dtype=np.uint8)
+
+    @timed("preprocess")
+    def set_image(self, index, image):
+        """Resize a BGR HWC uint8 image into slot index as normalized RGB CHW; no per-frame arrays."""
+        width, height = self.input_shape
+        if image.shape[:2] == (height, width):
+            resized = image
+        else:
+            resized = cv2.resize(image, self.input_shape, dst=self._resized)
+        slot = self.batch[index]
+        for channel in range(3):
+            # Channel 2 - c of BGR is channel c of RGB; the strided read avoids a cvtColor copy
+            np.multiply(resized[:, :, 2 - channel], SCALE, out=slot[channel])
+        return slot
+
+    @timed("preprocess")
+    def set_image_letterbox(self, index, image):
+        """Letterbox a BGR HWC uint8 image into slot index; returns (scale, pad) for scale_boxes_to_original."""
+        (new_width, new_height), scale, (left, top) = letterbox_geometry(image.shape, self.input_shape)
+        # A contiguous view of the flat scratch buffer, so cv2 resizes into it in place
+        resized = self._letterboxed[:new_height * new_width * 3].reshape(new_height, new_width, 3)
+        cv2.resize(image, (new_width, new_height), dst=resized)
+        slot = self.batch[index]
+        slot.fill(LETTERBOX_COLOR[0] * SCALE)
+        for channel in range(3):
+            np.multiply(resized[:, :, 2 - channel], SCALE,
+                        out=slot[channel, top:top + new_height, left:left + new_width])
+        return scale, (left, top)
+
+    @timed("preprocess")
+    def set_chw(self, index, data):
+        """Write (3, h, w) uint8 CHW data into slot index, zero padding the right and bottom edges."""
+        _, h, w = data.shape
+        slot = self.batch[index]
+        np.multiply(data, SCALE, out=slot[:, :h, :w])
+        if h < slot.shape[1]:
+            slot[:, h:, :] = 0
+        if w < slot.shape[2]:
+            slot[:, :h, w:] = 0
+        return slot
+
+    def read_raw(self, src, window, bands=(1, 2, 3)):
+        """Read a raster window into the uint8 scratch buffer; the view is overwritten by the next read."""
+        indexes = list(bands) if src.count >= len(bands) else [1] * len(bands)
+        h, w = int(window.height), int(window.width)
+        with timer("read"):
+            return src.read(indexes, window=window, out=self._chw[:, :h, :w])
+
+    def read_window(self, index, src, window, bands=(1, 2, 3)):
+        """Read a raster window through the uint8 scratch buffer into slot index."""
+        return self.set_chw(index, self.read_raw(src, window, bands))
+
+
+class IOBindingRunner:
+    """Run a session through IO binding on views of reusable input and output buffers.
+
+    Output buffers are only preallocated when every output dimension except the batch axis
+    is known; otherwise onnxruntime allocates the outputs, still without an input copy.
+    The returned outputs are views into the buffers and are overwritten by the next call.
+    """
+
+    def __init__(self, sess, batch_size):
+        self.sess = sess
+        self.input_name = sess.get_inputs()[0].name
+        self.outputs = {}
+        for output in sess.get_outputs():
+            dims = output.shape[1:]
+            if all(isinstance(dim, int) and dim > 0 for dim in dims):
+                self.outputs[output.name] = np.empty([batch_size] + list(dims), dtype=np.float32)
+            else:
+                self.outputs[output.name] = None
+        self.binding = sess.io_binding()
+
+    @timed("infer")
+    def __call__(self, batch):
+        n = len(batch)
+        self.binding.clear_binding_inputs()
+        self.binding.clear_binding_outputs()
+        self.binding.bind_cpu_input(self.input_name, batch)
+        for name, buffer in self.outputs.items():
+            if buffer is None:
+                self.binding.bind_output(name, "cpu")
+            else:
+                view = buffer[:n]
+                self.binding.bind_output(name, "cpu", 0, np.float32, list(view.shape), view.ctypes.data)
+        self.sess.run_with_iobinding(self.binding)
+        if any(buffer is None for buffer in self.outputs.values()):
+            return self.binding.copy_outputs_to_cpu()
+        return [buffer[:n] for buffer in self.outputs.values()]
+
+
+def make_runner(sess, batch_size):
+    """Return an IOBindingRunner where onnxruntime can take any batch size, else a plain run_batch call."""
+    if isinstance(sess, ort.InferenceSession) and fixed_batch_size(sess) is None:
+        return IOBindingRunner(sess, batch_size)
+    return lambda batch: run_batch(sess, batch)
+
+
+def measure(function, frames):
+    """Return (peak temporary bytes of one call, ns per call) for a preprocessing function."""
+    function()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    del result
+    tracemalloc.stop()
+
+    start = time.perf_counter_ns()
+    for _ in range(frames):
+        function()
+    return peak, (time.perf_counter_ns() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark of the original vs fused preprocessing.')
+    parser.add_argument('image', nargs='?', help='Image to preprocess; a random 1080p frame if omitted.')
+    parser.add_argument('--frames', type=int, default=200, help='Number of timed frames.')
+    args = parser.parse_args()
+
+    if args.image:
+        image = cv2.imread(args.image)
+        if image is None:
+            print(f"Failed to load image {args.image}")
+            return
+    else:
+        image = np.random.default_rng(0).integers(0, 255, (1080, 1920, 3), dtype=np.uint8)
+
+    preprocessor = BatchPreprocessor(1)
+    pixels = image.shape[0] * image.shape[1]
+    for name, function in [("preprocess_image_cv", lambda: preprocess_image_cv(image)),
+                           ("BatchPreprocessor", lambda: preprocessor.set_image(0, image))]:
+        peak, ns = measure(function, args.frames)
+        print(f"{name:<20} {peak / 1e6:8.2f} MB allocated per frame  {ns / pixels:6.2f} ns/pixel")
+
+
+if __name__ == "__main__":
+    main()
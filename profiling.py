@@ -0,0 +1,241 @@
+"""Lightweight per-stage timers, histograms and counters for the inference path.
+
+Usage:
+    python tiled_inference.py testimage.tif --profile            # writes profile.trace.json, profile.prom
+    python run_onnx_inference_draw.py --profile runs/bus
+
+Code marks its stages with ``with timer("read"):`` or ``@timed("postprocess")`` and counts
+work with ``count("tiles")``. Nothing is recorded until enable() is called; while disabled a
+timer is a shared no-op context manager and a timed function only pays one flag check, so the
+instrumentation can stay in hot loops.
+
+When enabled, every timed span is added to a per-stage histogram and to an in-memory trace.
+write_chrome_trace() exports the spans as Chrome trace JSON (chrome://tracing, Perfetto) and
+prometheus_text() a Prometheus text-format snapshot of the histograms and counters. With
+--profile the scripts also turn on onnxruntime's own profiler for the session.
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# Parameters
+# Upper bounds of the stage histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Spans kept for the trace; later spans still update the histograms
+MAX_TRACE_EVENTS = 1_000_000
+METRIC_PREFIX = "pylab"
+
+_enabled = False
+_lock = threading.Lock()
+_origin_ns = time.perf_counter_ns()
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds, in the Prometheus layout."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls in."""
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+histograms = {}
+counters = {}
+trace_events = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Drop everything recorded so far."""
+    with _lock:
+        histograms.clear()
+        counters.clear()
+        trace_events.clear()
+
+
+def record(stage, start_ns, end_ns):
+    """Add one span of a stage to its histogram and to the trace."""
+    seconds = (end_ns - start_ns) / 1e9
+    with _lock:
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = Histogram()
+        histogram.observe(seconds)
+        if len(trace_events) < MAX_TRACE_EVENTS:
+            trace_events.append({"name": stage, "ph": "X", "ts": (start_ns - _origin_ns) / 1000,
+                                 "dur": (end_ns - start_ns) / 1000, "pid": os.getpid(),
+                                 "tid": threading.get_ident()})
+
+
+def count(name, value=1):
+    """Add value to a counter, e.g. tiles or detections."""
+    if _enabled:
+        with _lock:
+            counters[name] = counters.get(name, 0) + value
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class _Timer:
+    __slots__ = ("stage", "start_ns")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.stage, self.start_ns, time.perf_counter_ns())
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    """Context manager timing the enclosed block as one span of stage."""
+    return _Timer(stage) if _enabled else _NULL_TIMER
+
+
+def timed(stage):
+    """Decorator timing every call of the function as one span of stage."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(stage, start_ns, time.perf_counter_ns())
+        return wrapper
+    return decorator
+
+
+def chrome_trace():
+    """Return the recorded spans as a Chrome trace dict, with the counters as trace metadata."""
+    with _lock:
+        return {"traceEvents": list(trace_events), "displayTimeUnit": "ms", "otherData": dict(counters)}
+
+
+def write_chrome_trace(path):
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f)
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+def prometheus_text(prefix=METRIC_PREFIX):
+    """Return a Prometheus text-format snapshot of the stage histograms and the counters."""
+    lines = []
+    with _lock:
+        if histograms:
+            name = f"{prefix}_stage_seconds"
+            lines += [f"# HELP {name} Time spent per stage of the inference path.", f"# TYPE {name} histogram"]
+            for stage, histogram in sorted(histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{_format_value(bound)}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {_format_value(histogram.sum)}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        for counter, value in sorted(counters.items()):
+            name = f"{prefix}_{counter}_total"
+            lines += [f"# TYPE {name} counter", f"{name} {_format_value(value)}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    with open(path, "w") as f:
+        f.write(prometheus_text())
+
+
+def summary():
+    """Return a human-readable table of the stages, slowest total first, and the counters."""
+    with _lock:
+        stages = sorted(histograms.items(), key=lambda item: -item[1].sum)
+        lines = [f"{'stage':<14}{'calls':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"]
+        for stage, h in stages:
+            lines.append(f"{stage:<14}{h.count:>8}{h.sum:>10.3f}{h.sum / h.count * 1000:>10.2f}"
+                         f"{h.quantile(0.95) * 1000:>10.2f}{h.max * 1000:>10.2f}")
+        lines += [f"{name}: {value:g}" for name, value in sorted(counters.items())]
+    return "\n".join(lines)
+
+
+# Command line integration
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='PREFIX',
+                        help='Record per-stage timings and onnxruntime profiling; writes PREFIX.trace.json, '
+                             'PREFIX.prom and PREFIX.ort_*.json.')
+
+
+def start_profile(args):
+    """Enable recording if --profile was given; returns the session options for get_session."""
+    if not getattr(args, 'profile', None):
+        return {}
+    directory = os.path.dirname(args.profile)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    reset()
+    enable()
+    return {'profile_prefix': f"{args.profile}.ort"}
+
+
+def finish_profile(args, sessions=()):
+    """Write and print the profile of a --profile run; ends onnxruntime profiling of the sessions."""
+    if not getattr(args, 'profile', None):
+        return
+    disable()
+    write_chrome_trace(f"{args.profile}.trace.json")
+    write_prometheus(f"{args.profile}.prom")
+    print(summary())
+    print(f"Trace: {args.profile}.trace.json  Metrics: {args.profile}.prom")
+    for sess in sessions:
+        print(f"onnxruntime profile: {sess.end_profiling()}")
@@ -1,6 +1,52 @@
+#!/usr/bin/env python
+"""GeoTIFF inspection and layout tool.
+
+Usage:
+    python pytiff.py testimage.tif                      # same as 'info'
+    python pytiff.py info testimage.tif
+    python pytiff.py layout testimage.tif --tile-size 640 --overlap 64
+    python pytiff.py cog testimage.tif testimage_cog.tif --tile-size 640 --overlap 64
+    python pytiff.py scan scenes/ --index scenes.sqlite --workers 8
+    python pytiff.py query --index scenes.sqlite --bbox 14.0 50.0 14.5 50.2
+
+'layout' reports the block layout, compression, interleave and overviews of a raster, and the
+read amplification (bytes read per byte of pixels needed) of the tiled inference window grid:
+the expected figure from the block geometry and the actual one measured on a sample of window
+reads. A striped GeoTIFF reads whole image-wide strips for every tile.
+
+'cog' rewrites the raster as an internally tiled Cloud-Optimized GeoTIFF with overviews, and
+a block size matched to the inference tile grid, then prints the layout report of the result.
+
+'scan' walks a directory tree, reads the metadata of every GeoTIFF on a thread pool and keeps
+it in a SQLite index keyed by path, mtime and size, so a re-scan only opens new or changed
+files. 'query' finds the indexed scenes intersecting a lon/lat bounding box without opening
+any of them. Both print one JSON object per scene (JSON lines).
+"""
+
 import argparse
-from osgeo import gdal
+import io
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import rasterio
+import rasterio.shutil
+from rasterio.warp import transform_bounds
+
+from tiling import TILE_OVERLAP, TILE_SIZE, generate_windows
+
+# Parameters
+COG_COMPRESS = 'DEFLATE'
+# Cost of fetching and decoding one block, counted in bytes; stops the block size search at tiny blocks
+BLOCK_OVERHEAD_BYTES = 32 * 1024
+BLOCK_SIZE_CANDIDATES = range(64, 1025, 16)
+SAMPLE_WINDOWS = 64
+INDEX_FILE = 'scenes.sqlite'
+SCAN_EXTENSIONS = ('.tif', '.tiff')
+SCAN_WORKERS = 8
+COMMANDS = ('info', 'layout', 'cog', 'scan', 'query')
 
 
 def convert_to_dms(decimal_degrees):
@@ -10,50 +56,346 @@ def convert_to_dms(decimal_degrees):
     return f"{degrees}°{minutes}'{seconds:.2f}\""
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Extract the top-left coordinate from a GeoTIFF file.')
-    parser.add_argument('tiff_file', help='Path to the .tiff file.')
-    args = parser.parse_args()
+def print_info(tiff_file):
+    # The GDAL that rasterio reads with; importing osgeo.gdal just for its version doubled startup time
+    print(f"GDAL version: {rasterio.__gdal_version__}\n")
+    print(f"Rasterio version: {rasterio.__version__}\n")
+
+    with rasterio.open(tiff_file) as src:
+        # Get the coordinates (top-left corner)
+        top_left = src.transform * (0, 0)
+
+        print(f"Coordinate Reference System (CRS):")
+        print(f"{src.crs}\n")
+        print(f"CRS Axis Order: {src.crs.axis_info if hasattr(src.crs, 'axis_info') else 'Unknown'}\n")
+
+        print(f"Coordinates as (x,y) / (longitude,latitude):")
+        print(f"Decimal degrees: ({top_left[1]}, {top_left[0]})")  # Swapped to match DMS format
+        print(f"DMS format: {convert_to_dms(abs(top_left[0]))}{'E' if top_left[0] >= 0 else 'W'}, "
+              f"{convert_to_dms(abs(top_left[1]))}{'N' if top_left[1] >= 0 else 'S'}\n")
+
+        print(f"Coordinates as (y,x) / (latitude,longitude):")
+        print(f"Decimal degrees: ({top_left[1]}, {top_left[0]})")
+        print(f"DMS format: {convert_to_dms(abs(top_left[1]))}{'N' if top_left[1] >= 0 else 'S'}, "
+              f"{convert_to_dms(abs(top_left[0]))}{'E' if top_left[0] >= 0 else 'W'}\n")
+
+        print(f"Image Bounds:")
+        print(f"Left: {src.bounds.left}")
+        print(f"Right: {src.bounds.right}")
+        print(f"Top: {src.bounds.top}")
+        print(f"Bottom: {src.bounds.bottom}\n")
+
+        print(f"Image Size:")
+        print(f"Width: {src.width} pixels")
+        print(f"Height: {src.height} pixels\n")
+
+        print(f"Pixel Size:")
+        print(f"X resolution: {src.transform[0]}")
+        print(f"Y resolution: {src.transform[4]}")
+
+
+def block_layout(src):
+    """Describe the on-disk layout of an open raster as a dict."""
+    block_height, block_width = src.block_shapes[0]
+    return {
+        'width': src.width,
+        'height': src.height,
+        'count': src.count,
+        'dtype': src.dtypes[0],
+        'block_width': block_width,
+        'block_height': block_height,
+        'tiled': block_height > 1 and block_width < src.width,
+        'compression': src.compression.value if src.compression else 'NONE',
+        'interleave': src.interleaving.value if src.interleaving else 'PIXEL',
+        'overviews': src.overviews(1),
+        'cog': src.tags(ns='IMAGE_STRUCTURE').get('LAYOUT') == 'COG',
+    }
+
+
+def tile_grid(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Return the inference windows of a raster as a list."""
+    return list(generate_windows(width, height, tile_size, overlap))
+
+
+def window_blocks(window, block_width, block_height):
+    """Return the number of blocks a window intersects."""
+    cols = (window.col_off + window.width - 1) // block_width - window.col_off // block_width + 1
+    rows = (window.row_off + window.height - 1) // block_height - window.row_off // block_height + 1
+    return int(cols * rows)
+
+
+def expected_read_amplification(layout, windows, block_width=None, block_height=None, bands=3,
+                                block_overhead=0):
+    """Return decoded block bytes touched per pixel byte needed, for reading bands of every window.
+
+    A pixel-interleaved block holds all bands, so reading 3 bands of a 4-band raster still
+    decodes the fourth. block_overhead adds a fixed cost in bytes per block touched.
+    """
+    block_width = block_width or layout['block_width']
+    block_height = block_height or layout['block_height']
+    itemsize = np.dtype(layout['dtype']).itemsize
+    bands = min(bands, layout['count'])
+    block_bands = layout['count'] if layout['interleave'] == 'PIXEL' else bands
+    block_bytes = block_width * block_height * block_bands * itemsize
+    blocks = sum(window_blocks(window, block_width, block_height) for window in windows)
+    needed = sum(int(window.width * window.height) for window in windows) * bands * itemsize
+    if layout['interleave'] != 'PIXEL':
+        blocks *= bands
+    return blocks * (block_bytes + block_overhead) / needed if needed else 0.0
+
+
+def matched_block_size(layout, windows, candidates=BLOCK_SIZE_CANDIDATES, block_overhead=BLOCK_OVERHEAD_BYTES):
+    """Return the square block size with the lowest read cost for the window grid.
+
+    Small blocks waste few bytes but cost a seek and a decode each; block_overhead weighs the two.
+    """
+    pixel_layout = dict(layout, interleave='PIXEL')
+    return min(candidates, key=lambda size: expected_read_amplification(pixel_layout, windows, size, size,
+                                                                          block_overhead=block_overhead))
+
+
+class _CountingFile(io.FileIO):
+    """Read-only file that counts the bytes GDAL reads through it."""
+
+    def __init__(self, path, counter):
+        super().__init__(path, 'r')
+        self.counter = counter
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.counter[0] += len(data)
+        return data
+
+    def readinto(self, buffer):
+        count = super().readinto(buffer)
+        self.counter[0] += count or 0
+        return count
+
+
+def measured_read_amplification(path, windows, bands=3, sample=SAMPLE_WINDOWS):
+    """Read an evenly spaced sample of windows and return (file bytes read, pixel bytes needed).
+
+    Bytes come from the file as stored, so compression can bring the ratio below the decoded figure.
+    """
+    if sample and len(windows) > sample:
+        windows = [windows[i] for i in np.linspace(0, len(windows) - 1, sample).astype(int)]
+    counter = [0]
+    # A small block cache, so the figure reflects the blocks each read needs rather than earlier reads
+    with rasterio.Env(GDAL_CACHEMAX=1):
+        with rasterio.open(path, opener=lambda name, mode='rb': _CountingFile(name, counter)) as src:
+            indexes = list(range(1, min(bands, src.count) + 1))
+            opened = counter[0]
+            needed = 0
+            for window in windows:
+                needed += src.read(indexes, window=window).nbytes
+    return counter[0] - opened, needed
+
 
+def layout_report(path, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, sample=SAMPLE_WINDOWS):
+    """Return the layout of a raster together with its read amplification for the tile grid."""
+    with rasterio.open(path) as src:
+        layout = block_layout(src)
+    windows = tile_grid(layout['width'], layout['height'], tile_size, overlap)
+    read_bytes, needed = measured_read_amplification(path, windows, sample=sample)
+    return dict(layout,
+                windows=len(windows),
+                expected_amplification=expected_read_amplification(layout, windows),
+                measured_amplification=read_bytes / needed if needed else 0.0,
+                matched_block_size=matched_block_size(layout, windows))
+
+
+def print_layout(path, report):
+    print(f"{path}")
+    print(f"Size: {report['width']} x {report['height']} x {report['count']} ({report['dtype']})")
+    print(f"Blocks: {report['block_width']} x {report['block_height']} "
+          f"({'tiled' if report['tiled'] else 'striped'}), interleave {report['interleave']}")
+    print(f"Compression: {report['compression']}")
+    print(f"Overviews: {report['overviews'] or 'none'}")
+    print(f"Cloud-Optimized GeoTIFF: {'yes' if report['cog'] else 'no'}")
+    print(f"Read amplification over {report['windows']} windows: expected {report['expected_amplification']:.2f}x, "
+          f"measured {report['measured_amplification']:.2f}x")
+    print(f"Block size matched to the tile grid: {report['matched_block_size']}\n")
+
+
+def convert_to_cog(src_path, dst_path, block_size, compress=COG_COMPRESS):
+    """Rewrite a raster as a tiled Cloud-Optimized GeoTIFF with overviews."""
+    rasterio.shutil.copy(src_path, dst_path, driver='COG', BLOCKSIZE=block_size, COMPRESS=compress,
+                         OVERVIEWS='AUTO', BIGTIFF='IF_SAFER')
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    west REAL, south REAL, east REAL, north REAL
+);
+CREATE INDEX IF NOT EXISTS scenes_west_east ON scenes (west, east);
+"""
+
+
+def find_rasters(root, extensions=SCAN_EXTENSIONS):
+    """Yield (path, mtime_ns, size) of every raster file under root, skipping broken links and unreadable files."""
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(extensions):
+                path = os.path.abspath(os.path.join(directory, name))
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime_ns, stat.st_size
+
+
+def read_metadata(path):
+    """Return a JSON-serializable dict of a raster's CRS, bounds, size, pixel size and bands.
+
+    A file that cannot be read gets a record with an 'error' field, so it is not retried
+    until it changes.
+    """
     try:
-        print(f"GDAL version: {gdal.__version__}\n")
-        print(f"Rasterio version: {rasterio.__version__}\n")
-
-        with rasterio.open(args.tiff_file) as src:
-            # Get the coordinates (top-left corner)
-            top_left = src.transform * (0, 0)
-            
-            print(f"Coordinate Reference System (CRS):")
-            print(f"{src.crs}\n")
-            print(f"CRS Axis Order: {src.crs.axis_info if hasattr(src.crs, 'axis_info') else 'Unknown'}\n")
-            
-            print(f"Coordinates as (x,y) / (longitude,latitude):")
-            print(f"Decimal degrees: ({top_left[1]}, {top_left[0]})")  # Swapped to match DMS format
-            print(f"DMS format: {convert_to_dms(abs(top_left[0]))}{'E' if top_left[0] >= 0 else 'W'}, "
-                  f"{convert_to_dms(abs(top_left[1]))}{'N' if top_left[1] >= 0 else 'S'}\n")
-            
-            print(f"Coordinates as (y,x) / (latitude,longitude):")
-            print(f"Decimal degrees: ({top_left[1]}, {top_left[0]})")
-            print(f"DMS format: {convert_to_dms(abs(top_left[1]))}{'N' if top_left[1] >= 0 else 'S'}, "
-                  f"{convert_to_dms(abs(top_left[0]))}{'E' if top_left[0] >= 0 else 'W'}\n")
-            
-            print(f"Image Bounds:")
-            print(f"Left: {src.bounds.left}")
-            print(f"Right: {src.bounds.right}")
-            print(f"Top: {src.bounds.top}")
-            print(f"Bottom: {src.bounds.bottom}\n")
-            
-            print(f"Image Size:")
-            print(f"Width: {src.width} pixels")
-            print(f"Height: {src.height} pixels\n")
-            
-            print(f"Pixel Size:")
-            print(f"X resolution: {src.transform[0]}")
-            print(f"Y resolution: {src.transform[4]}")
+        with rasterio.open(path) as src:
+            record = {
+                'path': path,
+                'driver': src.driver,
+                'crs': src.crs.to_string() if src.crs else None,
+                'width': src.width,
+                'height': src.height,
+                'count': src.count,
+                'dtypes': list(src.dtypes),
+                'nodata': src.nodata,
+                'bands': [color.name for color in src.colorinterp],
+                'pixel_size': [src.transform.a, src.transform.e],
+                'bounds': list(src.bounds),
+                'lonlat_bounds': None,
+            }
+            if src.crs:
+                record['lonlat_bounds'] = list(transform_bounds(src.crs, 'EPSG:4326', *src.bounds))
+            return record
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+
+def open_index(index_path):
+    """Open (creating if needed) the scene index database."""
+    connection = sqlite3.connect(index_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def scan_directory(root, index_path=INDEX_FILE, workers=SCAN_WORKERS, extensions=SCAN_EXTENSIONS):
+    """Bring the index up to date with the rasters under root.
+
+    Only files whose (path, mtime, size) is not already indexed are opened; index entries of
+    files that disappeared from under root are removed. Returns (records of every raster
+    under root, number of files read).
+    """
+    connection = open_index(index_path)
+    with connection:
+        files = list(find_rasters(root, extensions))
+        prefix = os.path.join(os.path.abspath(root), '')
+        indexed = {path: (mtime_ns, size) for path, mtime_ns, size in connection.execute(
+            "SELECT path, mtime_ns, size FROM scenes WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))}
+        changed = [(path, mtime_ns, size) for path, mtime_ns, size in files
+                   if indexed.get(path) != (mtime_ns, size)]
+
+        # Opening a GeoTIFF is mostly waiting on I/O, and GDAL releases the GIL while it does
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            records = list(executor.map(read_metadata, [path for path, _, _ in changed]))
+        rows = []
+        for (path, mtime_ns, size), record in zip(changed, records):
+            record.update(mtime_ns=mtime_ns, size=size)
+            west, south, east, north = record.get('lonlat_bounds') or (None,) * 4
+            rows.append((path, mtime_ns, size, json.dumps(record), west, south, east, north))
+        connection.executemany("INSERT OR REPLACE INTO scenes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
 
+        present = {path for path, _, _ in files}
+        connection.executemany("DELETE FROM scenes WHERE path = ?",
+                               [(path,) for path in indexed if path not in present])
+        records = [json.loads(record) for path, record in connection.execute(
+            "SELECT path, record FROM scenes WHERE substr(path, 1, ?) = ? ORDER BY path", (len(prefix), prefix))]
+    connection.close()
+    return records, len(changed)
+
+
+def query_index(index_path, bbox):
+    """Return the records of indexed scenes whose lon/lat bounds intersect bbox (west, south, east, north)."""
+    west, south, east, north = bbox
+    connection = open_index(index_path)
+    rows = connection.execute(
+        "SELECT record FROM scenes WHERE west <= ? AND east >= ? AND south <= ? AND north >= ? ORDER BY path",
+        (east, west, north, south)).fetchall()
+    connection.close()
+    return [json.loads(record) for record, in rows]
+
+
+def print_records(records):
+    for record in records:
+        print(json.dumps(record))
+
+
+def main():
+    # A bare file path keeps working as before and means 'info'
+    argv = sys.argv[1:]
+    if argv and argv[0] not in COMMANDS and not argv[0].startswith('-'):
+        argv.insert(0, 'info')
+
+    parser = argparse.ArgumentParser(description='Inspect, index and convert GeoTIFF files.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    info_parser = subparsers.add_parser('info', help='Extract the top-left coordinate from a GeoTIFF file.')
+    info_parser.add_argument('tiff_file', help='Path to the .tiff file.')
+
+    layout_parser = subparsers.add_parser('layout', help='Report block layout and read amplification.')
+    layout_parser.add_argument('tiff_file', help='Path to the .tiff file.')
+
+    cog_parser = subparsers.add_parser('cog', help='Rewrite as a tiled Cloud-Optimized GeoTIFF.')
+    cog_parser.add_argument('tiff_file', help='Path to the .tiff file.')
+    cog_parser.add_argument('output', help='Path of the COG to write.')
+    cog_parser.add_argument('--block-size', type=int, help='Block size; matched to the tile grid if omitted.')
+    cog_parser.add_argument('--compress', default=COG_COMPRESS, help='COG compression, e.g. DEFLATE, LZW, NONE.')
+
+    scan_parser = subparsers.add_parser('scan', help='Index the metadata of every GeoTIFF under a directory.')
+    scan_parser.add_argument('directory', help='Directory to scan recursively.')
+    scan_parser.add_argument('--workers', type=int, default=SCAN_WORKERS, help='Files read in parallel.')
+
+    query_parser = subparsers.add_parser('query', help='List indexed scenes intersecting a bounding box.')
+    query_parser.add_argument('--bbox', type=float, nargs=4, required=True, metavar=('WEST', 'SOUTH', 'EAST', 'NORTH'),
+                              help='Bounding box in degrees of longitude and latitude.')
+
+    for sub in (scan_parser, query_parser):
+        sub.add_argument('--index', default=INDEX_FILE, help='Path of the SQLite scene index.')
+
+    for sub in (layout_parser, cog_parser):
+        sub.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Inference tile size in pixels.')
+        sub.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+        sub.add_argument('--sample', type=int, default=SAMPLE_WINDOWS, help='Windows read to measure amplification.')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'info':
+            print_info(args.tiff_file)
+        elif args.command == 'layout':
+            print_layout(args.tiff_file, layout_report(args.tiff_file, args.tile_size, args.overlap, args.sample))
+        elif args.command == 'scan':
+            records, read = scan_directory(args.directory, args.index, args.workers)
+            print_records(records)
+            print(f"Scanned {len(records)} files, read {read} new or changed", file=sys.stderr)
+        elif args.command == 'query':
+            if not os.path.exists(args.index):
+                print(f"Scene index '{args.index}' not found. Run 'pytiff scan' first.")
+                return
+            print_records(query_index(args.index, args.bbox))
+        else:
+            report = layout_report(args.tiff_file, args.tile_size, args.overlap, args.sample)
+            print_layout(args.tiff_file, report)
+            block_size = args.block_size or report['matched_block_size']
+            convert_to_cog(args.tiff_file, args.output, block_size, args.compress)
+            print_layout(args.output, layout_report(args.output, args.tile_size, args.overlap, args.sample))
     except Exception as e:
         print(f'Error processing file: {str(e)}')
 
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+"""Script to quantize the YOLO ONNX model to INT8 (dynamic and static) and FP16, with an accuracy-vs-speed report.
+
+Usage:
+    python quantize_model.py --model yolov8s.onnx --calibration testimage.tif samples/bus.jpg --tiles 64
+
+Static INT8 calibration uses our own data: tiles read from the given GeoTIFFs (the same
+windows, band selection and stretch as tiled_inference.py) and letterboxed images. Half of the sampled
+tiles calibrate, the other half evaluate. Each variant is written next to the model
+(``yolov8s.int8-static.onnx`` etc.) and compared against the FP32 model on the evaluation tiles:
+median latency, throughput, and detection agreement with the FP32 ``postprocess`` output
+(mAP@0.5 taking the FP32 detections as ground truth, mean IoU of matched boxes, recall).
+The fastest variant whose mAP stays above --min-map is recommended.
+"""
+
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+import onnx
+import onnxruntime as ort
+import rasterio
+from onnxruntime.quantization import (
+    CalibrationDataReader,
+    CalibrationMethod,
+    QuantFormat,
+    QuantType,
+    quantize_dynamic,
+    quantize_static,
+)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from onnxruntime.transformers.float16 import convert_float_to_float16
+
+from batch_inference import model_input_shape
+from preprocess_buffer import BatchPreprocessor
+from raster_input import RasterTileReader, add_band_arguments
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, compute_iou_vectorized, postprocess
+from session_pool import get_session, make_session_options
+from tiled_inference import TILE_OVERLAP, TILE_SIZE, generate_windows
+
+# Parameters
+CALIBRATION_TILES = 64
+MATCH_IOU = 0.5
+MIN_MAP = 0.9
+VARIANTS = ("int8-dynamic", "int8-static", "fp16")
+RASTER_EXTENSIONS = (".tif", ".tiff")
+WEIGHT_OPS = ("Conv", "MatMul", "Gemm")
+
+
+def sample_tiles(paths, count, size, bands=None, percentiles='default'):
+    """Return up to count preprocessed (1, 3, H, W) tiles spread evenly over rasters and images.
+
+    Raster tiles are read through a RasterTileReader of the given bands and stretch; sampled
+    windows without a valid pixel are left out.
+    """
+    width = size[0]
+    # The tiled_inference grid, with the overlap scaled to the model input size
+    overlap = TILE_OVERLAP * width // TILE_SIZE
+    preprocessor = BatchPreprocessor(1, size)
+    sources = []
+    for path in paths:
+        if path.lower().endswith(RASTER_EXTENSIONS):
+            with rasterio.open(path) as src:
+                sources += [(path, window) for window in generate_windows(src.width, src.height, width, overlap)]
+        else:
+            sources.append((path, None))
+    if len(sources) > count:
+        sources = [sources[i] for i in np.linspace(0, len(sources) - 1, count).astype(int)]
+
+    tiles = []
+    readers = {}
+    try:
+        for path, window in sources:
+            if window is not None:
+                if path not in readers:
+                    readers[path] = RasterTileReader(rasterio.open(path), bands, percentiles, width)
+                data, valid = readers[path].read(window)
+                if valid is not None and not valid.any():
+                    continue
+                readers[path].normalize(data, valid, preprocessor.batch[0])
+            else:
+                image = cv2.imread(path)
+                if image is None:
+                    raise FileNotFoundError(f"Could not load image {path}")
+                preprocessor.set_image_letterbox(0, image)
+            tiles.append(preprocessor.batch[:1].copy())
+    finally:
+        for reader in readers.values():
+            reader.src.close()
+    return tiles
+
+
+class TileCalibrationReader(CalibrationDataReader):
+    """Feed preprocessed tiles to the static quantization calibrator one at a time."""
+
+    def __init__(self, input_name, tiles):
+        self.input_name = input_name
+        self.tiles = iter(tiles)
+
+    def get_next(self):
+        tile = next(self.tiles, None)
+        return None if tile is None else {self.input_name: tile}
+
+
+def variant_path(model_file, variant):
+    stem, ext = os.path.splitext(model_file)
+    return f"{stem}.{variant}{ext}"
+
+
+def head_nodes(model):
+    """Name every node and return the names of those after the last convolutions.
+
+    In YOLOv8 these decode the boxes and concatenate them (pixel-sized values) with the class
+    scores (0-1) into one output tensor; one shared INT8 scale for both would zero the scores,
+    so the head is left in float.
+    """
+    consumers = {}
+    for index, node in enumerate(model.graph.node):
+        if not node.name:
+            node.name = f"{node.op_type}_{index}"
+        for name in node.input:
+            consumers.setdefault(name, []).append(node)
+
+    # Graph nodes are topologically sorted, so walking them backwards sees consumers first
+    feeds_conv = {}
+    for node in reversed(model.graph.node):
+        feeds_conv[node.name] = any(consumer.op_type in WEIGHT_OPS or feeds_conv[consumer.name]
+                                    for output in node.output for consumer in consumers.get(output, []))
+    return [node.name for node in model.graph.node if node.op_type not in WEIGHT_OPS and not feeds_conv[node.name]]
+
+
+def quantize(model_file, variant, calibration_tiles=(), reduce_range=False):
+    """Write one quantized variant of the model and return its path."""
+    output_file = variant_path(model_file, variant)
+    # Shape inference and graph optimization first, as onnxruntime recommends before quantizing
+    prepared_file = variant_path(model_file, "prepared")
+    quant_pre_process(model_file, prepared_file, skip_symbolic_shape=True)
+    try:
+        model = onnx.load(prepared_file)
+        head = head_nodes(model)
+        onnx.save(model, prepared_file)
+        if variant == "int8-dynamic":
+            quantize_dynamic(prepared_file, output_file, per_channel=True, reduce_range=reduce_range,
+                             weight_type=QuantType.QInt8, nodes_to_exclude=head)
+        elif variant == "int8-static":
+            input_name = model.graph.input[0].name
+            # QDQ with uint8 activations and int8 per-channel weights is the fast path of the x86 CPU kernels
+            quantize_static(prepared_file, output_file, TileCalibrationReader(input_name, calibration_tiles),
+                            quant_format=QuantFormat.QDQ, per_channel=True, reduce_range=reduce_range,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                            nodes_to_exclude=head, calibrate_method=CalibrationMethod.MinMax)
+        elif variant == "fp16":
+            # Keep float32 inputs and outputs so callers and postprocess are unchanged
+            onnx.save(convert_float_to_float16(model, keep_io_types=True), output_file)
+        else:
+            raise ValueError(f"Unknown variant {variant}")
+    finally:
+        os.remove(prepared_file)
+    return output_file
+
+
+def run_detections(model_file, tiles, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """Run every tile at batch 1; return (per-tile detections, per-tile latencies in seconds)."""
+    sess = ort.InferenceSession(model_file, sess_options=make_session_options(),
+                                providers=["CPUExecutionProvider"])
+    input_name = sess.get_inputs()[0].name
+    sess.run(None, {input_name: tiles[0]})  # Warm-up
+    detections, latencies = [], []
+    for tile in tiles:
+        start = time.perf_counter()
+        outputs = sess.run(None, {input_name: tile})
+        latencies.append(time.perf_counter() - start)
+        detections.append(postprocess(outputs, conf_threshold, iou_threshold))
+    return detections, latencies
+
+
+def average_precision(recall, precision):
+    """Area under the precision-recall curve with all-point interpolation (VOC style)."""
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.concatenate([[1.0], precision, [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    steps = np.flatnonzero(recall[1:] != recall[:-1])
+    return float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1]))
+
+
+def detection_agreement(reference, candidate, match_iou=MATCH_IOU):
+    """Compare per-tile candidate detections with the reference ones taken as ground truth.
+
+    Returns a dict with mAP at match_iou over the reference classes, the mean IoU of matched
+    boxes and the recall of reference boxes.
+    """
+    per_class = {}
+    matched_ious = []
+    for (ref_boxes, _, ref_classes), (boxes, scores, classes) in zip(reference, candidate):
+        for cls in np.unique(np.concatenate([ref_classes, classes])):
+            ref = ref_boxes[ref_classes == cls]
+            mask = classes == cls
+            order = np.argsort(-scores[mask], kind="stable")
+            cls_boxes, cls_scores = boxes[mask][order], scores[mask][order]
+            taken = np.zeros(len(ref), dtype=bool)
+            hits = np.zeros(len(cls_boxes), dtype=bool)
+            for i, box in enumerate(cls_boxes):
+                if len(ref) == 0:
+                    break
+                ious = np.where(taken, -1.0, compute_iou_vectorized(box, ref))
+                best = int(np.argmax(ious))
+                if ious[best] >= match_iou:
+                    taken[best] = hits[i] = True
+                    matched_ious.append(ious[best])
+            entry = per_class.setdefault(int(cls), {"scores": [], "hits": [], "references": 0})
+            entry["scores"].append(cls_scores)
+            entry["hits"].append(hits)
+            entry["references"] += len(ref)
+
+    aps, references, found = [], 0, 0
+    for entry in per_class.values():
+        if entry["references"] == 0:
+            continue
+        scores, hits = np.concatenate(entry["scores"]), np.concatenate(entry["hits"])
+        hits = hits[np.argsort(-scores, kind="stable")]
+        true_positives = np.cumsum(hits)
+        recall = true_positives / entry["references"]
+        precision = true_positives / np.arange(1, len(hits) + 1)
+        aps.append(average_precision(recall, precision) if len(hits) else 0.0)
+        references += entry["references"]
+        found += int(hits.sum())
+    return {
+        "map": float(np.mean(aps)) if aps else 1.0,
+        "mean_iou": float(np.mean(matched_ious)) if matched_ious else (1.0 if not references else 0.0),
+        "recall": found / references if references else 1.0,
+    }
+
+
+def evaluate(model_file, variant_files, tiles):
+    """Return one report row per model: FP32 first, then every variant against it."""
+    reference, latencies = run_detections(model_file, tiles)
+    rows = [dict(variant="fp32", path=model_file, latencies=latencies, map=1.0, mean_iou=1.0, recall=1.0)]
+    for variant, path in variant_files.items():
+        detections, latencies = run_detections(path, tiles)
+        rows.append(dict(variant=variant, path=path, latencies=latencies, **detection_agreement(reference, detections)))
+    base = np.median(rows[0]["latencies"])
+    for row in rows:
+        row["size_mb"] = os.path.getsize(row["path"]) / 2 ** 20
+        row["latency_ms"] = float(np.median(row["latencies"])) * 1000
+        row["tiles_per_second"] = len(row["latencies"]) / sum(row["latencies"])
+        row["speedup"] = base * 1000 / row["latency_ms"]
+    return rows
+
+
+def recommend(rows, min_map=MIN_MAP):
+    """Return the fastest row whose mAP stays within tolerance; FP32 always qualifies."""
+    return min((row for row in rows if row["map"] >= min_map), key=lambda row: row["latency_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the YOLO ONNX model and report accuracy vs speed.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the FP32 ONNX model.')
+    parser.add_argument('--calibration', nargs='+', required=True,
+                        help='GeoTIFFs and/or images to take calibration and evaluation tiles from.')
+    parser.add_argument('--tiles', type=int, default=CALIBRATION_TILES, help='Calibration tiles (as many again evaluate).')
+    parser.add_argument('--variants', nargs='+', default=list(VARIANTS), choices=VARIANTS, help='Variants to build.')
+    parser.add_argument('--reduce-range', action='store_true',
+                        help='7-bit weights, for CPUs without VNNI where 8-bit can saturate.')
+    parser.add_argument('--min-map', type=float, default=MIN_MAP, help='mAP@0.5 vs FP32 a variant must keep.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    tiles = sample_tiles(args.calibration, 2 * args.tiles, model_input_shape(get_session(args.model)), args.bands,
+                         args.stretch or 'default')
+    calibration_tiles, evaluation_tiles = tiles[0::2], tiles[1::2] or tiles
+    print(f"Calibration tiles: {len(calibration_tiles)}, evaluation tiles: {len(evaluation_tiles)}")
+
+    variant_files = {}
+    for variant in args.variants:
+        start = time.perf_counter()
+        variant_files[variant] = quantize(args.model, variant, calibration_tiles, args.reduce_range)
+        print(f"Wrote {variant_files[variant]} in {time.perf_counter() - start:.1f}s")
+
+    rows = evaluate(args.model, variant_files, evaluation_tiles)
+    print(f"\n{'variant':<14}{'size MB':>9}{'latency ms':>12}{'tiles/s':>9}{'speedup':>9}"
+          f"{'mAP@0.5':>9}{'mean IoU':>10}{'recall':>8}")
+    for row in rows:
+        print(f"{row['variant']:<14}{row['size_mb']:>9.1f}{row['latency_ms']:>12.2f}{row['tiles_per_second']:>9.1f}"
+              f"{row['speedup']:>8.2f}x{row['map']:>9.3f}{row['mean_iou']:>10.3f}{row['recall']:>8.3f}")
+    best = recommend(rows, args.min_map)
+    print(f"\nFastest within mAP >= {args.min_map}: {best['variant']} ({best['path']})")
+
+
+if __name__ == "__main__":
+    main()
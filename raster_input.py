@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+"""Multi-band and high-bit-depth raster tiles as normalized float32 CHW model input.
+
+Usage:
+    python raster_input.py scene_16bit.tif --bands 3 2 1 --stretch 2 98
+    python tiled_inference.py scene_4band.tif --bands 4 3 2 --stretch 2 98
+
+cv2.imread and the 8-bit tile path assume 3-band uint8 data; a 16-bit or 4-band GeoTIFF either
+fails or is silently truncated. RasterTileReader reads any three bands of any integer or float
+dtype with rasterio and maps each band's [low, high] stretch linearly onto [0, 1], straight
+into a batch slot, with three in-place ufuncs over the whole tile.
+
+The per-band stretch is computed once per raster and cached. Percentiles come from, in order:
+the stretch cache, the band histograms GDAL keeps in the .aux.xml sidecar, the
+STATISTICS_MINIMUM/MAXIMUM it stores there (for a 0-100 min-max stretch), and otherwise a
+decimated read that GDAL serves from the overviews.
+
+Nodata pixels (a nodata value, an alpha band or an internal mask) are set to 0. Tiles without
+any valid pixel, common along scene edges, are reported so tiled inference skips them before
+preprocessing and inference.
+"""
+
+import argparse
+import json
+import os
+import threading
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import rasterio
+from rasterio.enums import MaskFlags
+
+from profiling import timer
+from run_onnx_inference_draw import INPUT_SIZE
+
+# Parameters
+PERCENTILES = (2.0, 98.0)
+# Long side in pixels of the decimated read the percentiles are sampled from
+SAMPLE_SIZE = 1024
+STRETCH_CACHE = os.path.join(os.path.expanduser("~"), ".cache", "pylab", "stretch.json")
+
+_cache_lock = threading.Lock()
+
+
+def default_bands(src):
+    """The first three bands, or the first band three times for single-band rasters."""
+    return (1, 2, 3) if src.count >= 3 else (1, 1, 1)
+
+
+def default_percentiles(src):
+    """No stretch (the full 0-255 range) for 8-bit rasters, PERCENTILES for every other dtype."""
+    return None if src.dtypes[0] == 'uint8' else PERCENTILES
+
+
+def pam_bands(path):
+    """Return {band: {'statistics': {...}, 'histogram': (min, max, counts)}} from a raster's .aux.xml."""
+    aux_path = path + '.aux.xml'
+    if not os.path.exists(aux_path):
+        return {}
+    try:
+        root = ElementTree.parse(aux_path).getroot()
+    except ElementTree.ParseError:
+        return {}
+    bands = {}
+    for element in root.iter('PAMRasterBand'):
+        band = bands.setdefault(int(element.get('band')), {'statistics': {}, 'histogram': None})
+        for item in element.iter('MDI'):
+            if item.get('key', '').startswith('STATISTICS_') and item.text:
+                band['statistics'][item.get('key')[len('STATISTICS_'):].lower()] = item.text
+        histogram = element.find('Histograms/HistItem')
+        if histogram is not None and histogram.findtext('HistCounts'):
+            counts = np.array([int(c) for c in histogram.findtext('HistCounts').split('|')], dtype=np.float64)
+            bands[int(element.get('band'))]['histogram'] = (float(histogram.findtext('HistMin')),
+                                                            float(histogram.findtext('HistMax')), counts)
+    return bands
+
+
+def histogram_percentiles(hist_min, hist_max, counts, percentiles):
+    """Return the bucket centers at which the cumulative histogram reaches each percentile."""
+    cumulative = np.cumsum(counts)
+    width = (hist_max - hist_min) / len(counts)
+    # At least one pixel, so the 0th percentile is the first non-empty bucket
+    buckets = np.searchsorted(cumulative, np.maximum(np.asarray(percentiles) / 100 * cumulative[-1], 1))
+    return hist_min + (np.minimum(buckets, len(counts) - 1) + 0.5) * width
+
+
+def sampled_percentiles(src, bands, percentiles, sample_size=SAMPLE_SIZE):
+    """Compute per-band percentiles of the valid pixels of a decimated read; GDAL reads the overviews."""
+    factor = max(1, -(-max(src.width, src.height) // sample_size))
+    shape = (len(bands), max(1, src.height // factor), max(1, src.width // factor))
+    data = src.read(list(bands), out_shape=shape, masked=True)
+    result = []
+    for band in data:
+        valid = band.compressed()
+        result.append(np.percentile(valid, percentiles) if len(valid) else [0.0, 1.0])
+    return np.array(result, dtype=np.float64)
+
+
+def _cache_key(path, bands, percentiles):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{list(bands)}|{list(percentiles)}"
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def band_stretch(src, bands, percentiles=PERCENTILES, cache_file=STRETCH_CACHE):
+    """Return a (bands, 2) float64 array of the [low, high] values each band is stretched over.
+
+    percentiles=None stretches over the dtype's full range (8-bit data is then divided by 255
+    exactly as the 8-bit path does); float rasters fall back to a 0-100 percentile stretch.
+    """
+    bands = list(bands)
+    dtype = np.dtype(src.dtypes[bands[0] - 1])
+    if percentiles is None:
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return np.tile([float(info.min), float(info.max)], (len(bands), 1))
+        percentiles = (0.0, 100.0)
+    percentiles = tuple(float(p) for p in percentiles)
+
+    key = _cache_key(src.name, bands, percentiles) if cache_file and os.path.exists(src.name) else None
+    if key is not None:
+        cached = _load_cache(cache_file).get(key)
+        if cached is not None:
+            return np.array(cached, dtype=np.float64)
+
+    pam = pam_bands(src.name)
+    result = []
+    for band in bands:
+        entry = pam.get(band, {})
+        statistics = entry.get('statistics', {})
+        if entry.get('histogram') is not None:
+            result.append(histogram_percentiles(*entry['histogram'], percentiles))
+        elif percentiles == (0.0, 100.0) and 'minimum' in statistics and 'maximum' in statistics:
+            result.append([float(statistics['minimum']), float(statistics['maximum'])])
+        else:
+            result = None
+            break
+    stretch = np.array(result, dtype=np.float64) if result is not None else sampled_percentiles(src, bands,
+                                                                                                  percentiles)
+
+    if key is not None:
+        with _cache_lock:
+            cache = _load_cache(cache_file)
+            cache[key] = stretch.tolist()
+            os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+            temporary = f"{cache_file}.{os.getpid()}.tmp"
+            with open(temporary, 'w') as f:
+                json.dump(cache, f)
+            os.replace(temporary, cache_file)
+    return stretch
+
+
+def add_band_arguments(parser):
+    """Add the --bands and --stretch options of RasterTileReader to a script's argument parser."""
+    parser.add_argument('--bands', type=int, nargs=3, help='Bands to use as R, G, B; the first three by default.')
+    parser.add_argument('--stretch', type=float, nargs=2, metavar=('LOW', 'HIGH'),
+                        help='Per-band percentiles to stretch over; 2 98 by default for non-8-bit rasters.')
+
+
+class RasterTileReader:
+    """Reads windows of selected bands into normalized float32 CHW tiles, with nodata masking.
+
+    read() returns the raw window data, in a reusable scratch buffer of the raster's dtype,
+    and its validity mask (None when every pixel is valid); normalize() writes them into a
+    (bands, H, W) float32 slot, zero padding the right and bottom edges.
+    """
+
+    def __init__(self, src, bands=None, percentiles='default', tile_size=INPUT_SIZE[0], cache_file=STRETCH_CACHE):
+        self.src = src
+        self.bands = tuple(bands) if bands else default_bands(src)
+        if percentiles == 'default':
+            percentiles = default_percentiles(src)
+        self.percentiles = percentiles
+        stretch = band_stretch(src, self.bands, percentiles, cache_file)
+        span = stretch[:, 1] - stretch[:, 0]
+        self.stretch = stretch
+        self._scale = (1.0 / np.where(span > 0, span, 1.0)).astype(np.float32)[:, None, None]
+        self._offset = (stretch[:, 0] * self._scale[:, 0, 0]).astype(np.float32)[:, None, None]
+        self._scratch = np.empty((len(self.bands), tile_size, tile_size), dtype=src.dtypes[self.bands[0] - 1])
+
+        flags = [src.mask_flag_enums[band - 1] for band in self.bands]
+        self.nodata = src.nodata
+        if all(band_flags == [MaskFlags.all_valid] for band_flags in flags):
+            self._mask_mode = None
+        elif self.nodata is not None and all(MaskFlags.nodata in band_flags for band_flags in flags):
+            self._mask_mode = 'nodata'
+        else:
+            self._mask_mode = 'dataset'
+
+    def fingerprint(self):
+        """A string identifying the bands and stretch, for keys of stores of derived results."""
+        return f"{list(self.bands)}|{np.round(self.stretch, 6).tolist()}|{self.nodata}"
+
+    def read(self, window):
+        """Read a window; returns (data, valid) with valid an (h, w) bool mask or None."""
+        h, w = int(window.height), int(window.width)
+        with timer("read"):
+            data = self.src.read(list(self.bands), window=window, out=self._scratch[:, :h, :w])
+            if self._mask_mode is None:
+                return data, None
+            if self._mask_mode == 'nodata':
+                invalid = np.isnan(data) if np.isnan(self.nodata) else data == self.nodata
+                return data, ~invalid.all(axis=0)
+            return data, self.src.dataset_mask(window=window) > 0
+
+    def normalize(self, data, valid, out):
+        """Stretch (bands, h, w) data into the top-left of an out (bands, H, W) float32 slot."""
+        _, h, w = data.shape
+        view = out[:, :h, :w]
+        np.multiply(data, self._scale, out=view)
+        np.subtract(view, self._offset, out=view)
+        np.clip(view, 0.0, 1.0, out=view)
+        if valid is not None:
+            view[:, ~valid] = 0
+        if h < out.shape[1]:
+            out[:, h:, :] = 0
+        if w < out.shape[2]:
+            out[:, :h, w:] = 0
+        return out
+
+    def read_tile(self, window):
+        """Read one window as a (1, bands, tile_size, tile_size) tensor, or None if it has no valid pixel."""
+        data, valid = self.read(window)
+        if valid is not None and not valid.any():
+            return None
+        tile = np.empty((1,) + self._scratch.shape, dtype=np.float32)
+        self.normalize(data, valid, tile[0])
+        return tile
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the band stretch and nodata coverage of a raster.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    add_band_arguments(parser)
+    parser.add_argument('--tile-size', type=int, default=INPUT_SIZE[0], help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=64, help='Overlap between tiles in pixels.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.raster):
+        print(f"Raster '{args.raster}' not found.")
+        return
+
+    from tiling import generate_windows
+
+    with rasterio.open(args.raster) as src:
+        reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+        print(f"{args.raster}: {src.count} bands, {src.dtypes[0]}, nodata {src.nodata}")
+        for band, (low, high) in zip(reader.bands, reader.stretch):
+            print(f"Band {band}: stretch {low:g} - {high:g}")
+        tiles = empty = 0
+        for window in generate_windows(src.width, src.height, args.tile_size, args.overlap):
+            _, valid = reader.read(window)
+            tiles += 1
+            empty += valid is not None and not valid.any()
+    print(f"Tiles: {tiles}, without valid pixels: {empty}")
+
+
+if __name__ == "__main__":
+    main()
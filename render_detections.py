@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""Render detections into an annotated GeoTIFF block by block, without loading the whole scene.
+
+Usage:
+    python render_detections.py testimage.tif --output annotated.tif --preview preview.jpg
+    python render_detections.py testimage.tif --index detections.idx --scene 0 --overviews
+
+draw_detections draws one box and one label at a time on an in-memory image, which for a
+full scene means the whole raster in memory and a cv2.putText per detection. Here the output
+is a tiled, compressed GeoTIFF with the source's CRS and transform, written one block at a
+time: each block is read from the source, the boxes touching it are looked up in a
+spatial_index.DetectionIndex, their outlines are drawn with a single cv2.polylines call and
+their labels are blended in from coverage masks rendered once per distinct label text.
+
+Boxes are drawn at the same pixel positions in every block they touch, so the output is
+identical to drawing on the whole image at once, whatever the block size. Optional internal
+overviews and a small preview image make the result quick to look at.
+
+Detections come from running tiled inference and the seam merge on the raster, or from a
+saved detection index (--index, --scene).
+"""
+
+import argparse
+import os
+
+import cv2
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+from raster_input import RasterTileReader, add_band_arguments
+from spatial_index import DetectionIndex
+
+# Parameters
+BLOCK_SIZE = 512
+COMPRESS = 'DEFLATE'
+# RGB, the green of draw_detections
+COLOR = (0, 255, 0)
+THICKNESS = 2
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+# Labels sit this far above the top edge of their box, as in draw_detections
+LABEL_OFFSET = 10
+OVERVIEW_FACTORS = (2, 4, 8, 16, 32)
+PREVIEW_SIZE = 2048
+
+
+class LabelCache:
+    """Label texts rendered once into coverage masks, blended into blocks afterwards."""
+
+    def __init__(self, font=FONT, font_scale=FONT_SCALE, thickness=THICKNESS):
+        self.font = font
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self._masks = {}
+        # Extent of a score label around its origin, for culling
+        (width, height), baseline = cv2.getTextSize("0.00", font, font_scale, thickness)
+        self.width = width + thickness
+        self.height = height + baseline + thickness
+
+    def get(self, text):
+        """Return (alpha, top, left) of text: its (h, w, 1) coverage and offsets from the baseline origin."""
+        entry = self._masks.get(text)
+        if entry is None:
+            (width, height), baseline = cv2.getTextSize(text, self.font, self.font_scale, self.thickness)
+            pad = self.thickness
+            image = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+            cv2.putText(image, text, (pad, height + pad), self.font, self.font_scale, 255, self.thickness)
+            entry = self._masks[text] = ((image / np.float32(255))[:, :, None], -height - pad, -pad)
+        return entry
+
+    def stamp(self, block, text, x, y, color):
+        """Blend text into an (h, w, 3) uint8 block with its baseline origin at (x, y), clipped to the block."""
+        alpha, top, left = self.get(text)
+        x0, y0 = x + left, y + top
+        x1, y1 = x0 + alpha.shape[1], y0 + alpha.shape[0]
+        cx0, cy0 = max(x0, 0), max(y0, 0)
+        cx1, cy1 = min(x1, block.shape[1]), min(y1, block.shape[0])
+        if cx0 >= cx1 or cy0 >= cy1:
+            return
+        region = block[cy0:cy1, cx0:cx1]
+        visible = alpha[cy0 - y0:cy1 - y0, cx0 - x0:cx1 - x0]
+        region[:] = region + (np.asarray(color, dtype=np.float32) - region) * visible + np.float32(0.5)
+
+
+def render_block(block, boxes, scores, col_off, row_off, labels=None, color=COLOR, thickness=THICKNESS):
+    """Draw boxes (in image pixels) and their score labels into an (h, w, 3) block at (col_off, row_off)."""
+    if not len(boxes):
+        return block
+    corners = np.asarray(boxes, dtype=np.float32).astype(np.int32) - np.array([col_off, row_off] * 2, dtype=np.int32)
+    x1, y1, x2, y2 = corners.T
+    outlines = np.stack([np.column_stack(pair) for pair in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))], axis=1)
+    cv2.polylines(block, outlines, True, color, thickness, cv2.LINE_8)
+    if labels is not None:
+        for x, y, score in zip(x1.tolist(), (y1 - LABEL_OFFSET).tolist(), scores.tolist()):
+            labels.stamp(block, f'{score:.2f}', x, y, color)
+    return block
+
+
+def iter_blocks(width, height, block_size=BLOCK_SIZE):
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(col_off, row_off, min(block_size, width - col_off), min(block_size, height - row_off))
+
+
+def render_raster(src, dst_path, index, scene=None, block_size=BLOCK_SIZE, compress=COMPRESS, labels=True,
+                  overviews=False, color=COLOR, thickness=THICKNESS, bands=None, percentiles='default'):
+    """Write src with the detections of index (one scene of it) drawn on, as a tiled RGB GeoTIFF.
+
+    Blocks are read through a raster_input.RasterTileReader, so any band selection and dtype
+    is drawn on with the stretch the model saw; 8-bit sources are copied through unchanged.
+
+    Returns the number of box outlines drawn, counting a box once per block it touches.
+    """
+    reader = RasterTileReader(src, bands, percentiles, block_size)
+    scaled = np.empty((len(reader.bands), block_size, block_size), dtype=np.float32)
+    label_cache = LabelCache(thickness=thickness) if labels else None
+    # Boxes this far outside a block can still draw into it: their line width, or a label above and to the right
+    below = thickness + (label_cache.height + LABEL_OFFSET if labels else 0)
+    left = max(thickness, label_cache.width if labels else 0)
+    profile = {
+        'driver': 'GTiff', 'width': src.width, 'height': src.height, 'count': 3, 'dtype': 'uint8',
+        'crs': src.crs, 'transform': src.transform, 'tiled': True, 'blockxsize': block_size,
+        'blockysize': block_size, 'compress': compress, 'photometric': 'RGB', 'BIGTIFF': 'IF_SAFER',
+    }
+    drawn = 0
+    with rasterio.open(dst_path, 'w', **profile) as dst:
+        for window in iter_blocks(src.width, src.height, block_size):
+            data, valid = reader.read(window)
+            view = reader.normalize(data, valid, scaled)[:, :data.shape[1], :data.shape[2]]
+            view *= 255
+            view += 0.5
+            block = np.ascontiguousarray(view.transpose(1, 2, 0), dtype=np.uint8)
+            col_off, row_off = int(window.col_off), int(window.row_off)
+            bounds = (col_off - left, row_off - thickness, col_off + window.width + thickness,
+                      row_off + window.height + below)
+            found = index.window(bounds) if scene is None else index.pixel_window(scene, bounds)
+            # Overlapping labels blend in index order, the same in every block
+            found = np.sort(found)
+            render_block(block, index.boxes[found], index.scores[found], col_off, row_off, label_cache, color,
+                         thickness)
+            drawn += len(found)
+            dst.write(block.transpose(2, 0, 1), window=window)
+        if overviews:
+            factors = [f for f in OVERVIEW_FACTORS if max(src.width, src.height) // f >= 256] or [2]
+            dst.build_overviews(factors, Resampling.average)
+    return drawn
+
+
+def write_preview(path, preview_path, max_size=PREVIEW_SIZE):
+    """Write a downsampled RGB image of a raster; decimated reads use its overviews when it has them."""
+    with rasterio.open(path) as src:
+        factor = max(1, -(-max(src.width, src.height) // max_size))
+        data = src.read([1, 2, 3], out_shape=(3, src.height // factor or 1, src.width // factor or 1),
+                        resampling=Resampling.average)
+    cv2.imwrite(preview_path, cv2.cvtColor(data.transpose(1, 2, 0), cv2.COLOR_RGB2BGR))
+    return data.shape[2], data.shape[1]
+
+
+def detect_raster(src, model_file, bands=None, percentiles='default'):
+    """Run tiled inference and the seam merge on src and index the detections in pixel coordinates."""
+    from batch_inference import auto_batch_size
+    from merge_detections import merge_detections
+    from session_pool import get_session
+    from tiled_inference import TILE_SIZE, run_tiled_inference
+
+    sess = get_session(model_file)
+    reader = RasterTileReader(src, bands, percentiles, TILE_SIZE)
+    boxes, scores, class_ids = merge_detections(*run_tiled_inference(sess, src, batch_size=auto_batch_size(sess),
+                                                                     reader=reader))
+    return DetectionIndex.build(boxes, scores, class_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Draw detections into an annotated, tiled GeoTIFF.')
+    parser.add_argument('raster', help='Path to the source GeoTIFF.')
+    parser.add_argument('--output', default='annotated.tif', help='Annotated GeoTIFF to write.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='ONNX model to detect with, unless --index is given.')
+    parser.add_argument('--index', help='Saved detection index (spatial_index.py build) to draw instead.')
+    parser.add_argument('--scene', type=int, default=0, help='Scene of the index the raster is.')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Output block size in pixels.')
+    parser.add_argument('--compress', default=COMPRESS, help='GeoTIFF compression of the output.')
+    parser.add_argument('--no-labels', action='store_true', help='Only draw the boxes.')
+    parser.add_argument('--overviews', action='store_true', help='Build internal overviews in the output.')
+    parser.add_argument('--preview', help='Also write a downsampled preview image, e.g. preview.jpg.')
+    add_band_arguments(parser)
+    args = parser.parse_args()
+
+    with rasterio.open(args.raster) as src:
+        if args.index:
+            if not os.path.exists(os.path.join(args.index, "index.json")):
+                print(f"Index '{args.index}' not found.")
+                return
+            index, scene = DetectionIndex.load(args.index), args.scene
+        else:
+            if not os.path.exists(args.model):
+                print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+                return
+            index, scene = detect_raster(src, args.model, args.bands, args.stretch or 'default'), None
+        drawn = render_raster(src, args.output, index, scene, args.block_size, args.compress, not args.no_labels,
+                              args.overviews, bands=args.bands, percentiles=args.stretch or 'default')
+    print(f"Drew {drawn} box outlines into {args.output}")
+    if args.preview:
+        width, height = write_preview(args.output, args.preview)
+        print(f"Wrote {width}x{height} preview {args.preview}")
+
+
+if __name__ == "__main__":
+    main()
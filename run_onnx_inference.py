@@ -1,48 +1,51 @@
 #!/usr/bin/env python
 """Script to run inference using the YOLO ONNX model via onnxruntime.
 Usage:
-    python run_onnx_inference.py
+    python run_onnx_inference.py [image] [--model yolov8s.onnx] [--profile [PREFIX]]
 
 Ensure that 'yolov8s.onnx' is in the current directory. If not, please run 'download_yolo_models_onnx.py' first to generate the ONNX model.
 """
 
+import argparse
 import os
 import cv2
-import numpy as np
-import onnxruntime as ort
+
+from run_onnx_inference_draw import preprocess_image_letterbox
+from profiling import add_profile_argument, finish_profile, start_profile, timer
+from session_pool import get_session
 
 
 def preprocess_image(image_path, input_shape=(640, 640)):
     # Load image
-    img = cv2.imread(image_path)
+    with timer("read"):
+        img = cv2.imread(image_path)
     if img is None:
         raise FileNotFoundError(f"Could not load image {image_path}")
-    # Convert from BGR to RGB
-    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    # Resize image
-    img = cv2.resize(img, input_shape)
-    # Normalize image to [0,1]
-    img = img.astype(np.float32) / 255.0
-    # Transpose to CHW
-    img = np.transpose(img, (2, 0, 1))
-    # Add batch dimension
-    img = np.expand_dims(img, axis=0)
+    # Letterbox (keep the aspect ratio and pad), convert BGR to RGB, normalize to [0,1],
+    # transpose to CHW and add the batch dimension
+    img, _, _ = preprocess_image_letterbox(img, input_shape)
     return img
 
 
 def main():
-    model_file = "yolov8s.onnx"
+    parser = argparse.ArgumentParser(description='Run the YOLO ONNX model on an image and print the output shapes.')
+    parser.add_argument('image', nargs='?', default=os.path.join("samples", "bus.jpg"), help='Image to run on.')
+    parser.add_argument('--model', default="yolov8s.onnx", help='Path to the ONNX model.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    model_file = args.model
     if not os.path.exists(model_file):
         print(f"ONNX model file '{model_file}' not found. Please run 'download_yolo_models_onnx.py' first to generate it.")
         return
 
-    # Create an ONNX runtime session
-    sess = ort.InferenceSession(model_file)
+    # Get the shared ONNX runtime session (created and optimized once, then reused)
+    sess = get_session(model_file, **start_profile(args))
     input_name = sess.get_inputs()[0].name
     print(f"Model input name: {input_name}")
 
-    # Use a sample image from the 'samples' folder
-    image_file = os.path.join("samples", "bus.jpg")
+    # Defaults to a sample image from the 'samples' folder
+    image_file = args.image
     if not os.path.exists(image_file):
         print(f"Sample image '{image_file}' not found. Please ensure the image exists.")
         return
@@ -52,10 +55,12 @@ def main():
     print(f"Input tensor shape: {input_tensor.shape}")
 
     # Run inference using the ONNX runtime
-    outputs = sess.run(None, {input_name: input_tensor})
+    with timer("infer"):
+        outputs = sess.run(None, {input_name: input_tensor})
     print("Inference outputs:")
     for idx, output in enumerate(outputs):
         print(f"Output {idx}: shape {output.shape}")
+    finish_profile(args, [sess])
 
 
 if __name__ == "__main__":
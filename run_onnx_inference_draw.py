@@ -2,20 +2,24 @@
 """Script to run inference using the YOLO ONNX model, post-process detections, and draw output bounding boxes.
 
 Usage:
-    python run_onnx_inference_draw.py
+    python run_onnx_inference_draw.py [image] [--model yolov8s.onnx] [--profile [PREFIX]]
 
 Ensure that 'yolov8s.onnx' is in the current directory and that a sample image (e.g., samples/bus.jpg) exists.
 """
 
+import argparse
 import os
 import cv2
 import numpy as np
-import onnxruntime as ort
+
+from profiling import add_profile_argument, finish_profile, start_profile, timed, timer
+from session_pool import get_session
 
 # Parameters
 INPUT_SIZE = (640, 640)
 CONF_THRESHOLD = 0.25
 IOU_THRESHOLD = 0.45
+LETTERBOX_COLOR = (114, 114, 114)
 
 
 def preprocess_image_cv(image, input_shape=INPUT_SIZE):
@@ -33,14 +37,55 @@ def preprocess_image_cv(image, input_shape=INPUT_SIZE):
     return img
 
 
-def xywh_to_xyxy(box):
-    """Convert [center_x, center_y, w, h] to [x1, y1, x2, y2]."""
-    cx, cy, w, h = box
-    x1 = cx - w / 2
-    y1 = cy - h / 2
-    x2 = cx + w / 2
-    y2 = cy + h / 2
-    return [x1, y1, x2, y2]
+def letterbox_geometry(image_shape, input_shape=INPUT_SIZE):
+    """Return the (width, height) of the scaled image, the per-axis (x, y) scale and the (left, top) padding.
+
+    The scale is recorded per axis from the rounded size, so the inverse transform is exact.
+    """
+    height, width = image_shape[:2]
+    ratio = min(input_shape[0] / width, input_shape[1] / height)
+    new_width, new_height = max(1, round(width * ratio)), max(1, round(height * ratio))
+    scale = (new_width / width, new_height / height)
+    pad = ((input_shape[0] - new_width) // 2, (input_shape[1] - new_height) // 2)
+    return (new_width, new_height), scale, pad
+
+
+def letterbox_image(image, input_shape=INPUT_SIZE, color=LETTERBOX_COLOR):
+    """Resize keeping the aspect ratio and pad to input_shape; returns (image, scale, pad)."""
+    (new_width, new_height), scale, (left, top) = letterbox_geometry(image.shape, input_shape)
+    resized = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    right, bottom = input_shape[0] - new_width - left, input_shape[1] - new_height - top
+    padded = cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=color)
+    return padded, scale, (left, top)
+
+
+@timed("preprocess")
+def preprocess_image_letterbox(image, input_shape=INPUT_SIZE):
+    """Letterbox and normalize the image for model input; returns (tensor, scale, pad)."""
+    padded, scale, pad = letterbox_image(image, input_shape)
+    return preprocess_image_cv(padded, input_shape), scale, pad
+
+
+def scale_boxes_to_original(boxes, scale, pad, original_shape):
+    """Map (N, 4) [x1, y1, x2, y2] boxes from letterboxed model input back to original-image pixels."""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    offset = np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)
+    factor = np.array([scale[0], scale[1], scale[0], scale[1]], dtype=np.float32)
+    boxes = (boxes - offset) / factor
+    height, width = original_shape[:2]
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height)
+    return boxes
+
+
+def xywh_to_xyxy(boxes):
+    """Convert [center_x, center_y, w, h] to [x1, y1, x2, y2].
+
+    Works on a single box or on an (N, 4) array of boxes at once.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32)
+    half = boxes[..., 2:4] / 2
+    return np.concatenate([boxes[..., 0:2] - half, boxes[..., 0:2] + half], axis=-1)
 
 
 def compute_iou(box1, box2):
@@ -58,59 +103,97 @@ def compute_iou(box1, box2):
     return inter_area / union
 
 
+def box_areas(boxes):
+    """Compute the areas of an (N, 4) array of [x1, y1, x2, y2] boxes."""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def compute_iou_vectorized(box, boxes, box_area=None, areas=None):
+    """Compute the IoU of one [x1, y1, x2, y2] box against an (N, 4) array of boxes."""
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter_area = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    if box_area is None:
+        box_area = max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+    if areas is None:
+        areas = box_areas(boxes)
+    union = box_area + areas - inter_area
+    return np.divide(inter_area, union, out=np.zeros_like(inter_area, dtype=np.float64), where=union > 0)
+
+
 def non_max_suppression(boxes, scores, iou_threshold=IOU_THRESHOLD):
-    """Simple non-max suppression implementation."""
-    indices = sorted(range(len(boxes)), key=lambda i: scores[i], reverse=True)
+    """Greedy non-max suppression; returns the indices of the kept boxes, highest score first.
+
+    Each kept box suppresses all remaining boxes in one vectorized IoU computation.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores)
+    areas = box_areas(boxes)
+    order = np.argsort(-scores, kind="stable")
     keep = []
-    while indices:
-        current = indices.pop(0)
+    while order.size > 0:
+        current = order[0]
         keep.append(current)
-        indices = [i for i in indices if compute_iou(boxes[current], boxes[i]) < iou_threshold]
-    return keep
+        rest = order[1:]
+        ious = compute_iou_vectorized(boxes[current], boxes[rest], areas[current], areas[rest])
+        order = rest[ious < iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def class_aware_non_max_suppression(boxes, scores, class_ids, iou_threshold=IOU_THRESHOLD):
+    """Non-max suppression that only suppresses boxes of the same class.
+
+    Boxes of each class are shifted into their own disjoint coordinate range, so a single
+    NMS pass handles all classes at once.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if boxes.shape[0] == 0:
+        return np.empty(0, dtype=np.int64)
+    offset = float(boxes.max() - min(boxes.min(), 0) + 1)
+    shifted = boxes + (np.asarray(class_ids, dtype=np.float32) * offset)[:, None]
+    return non_max_suppression(shifted, scores, iou_threshold)
+
 
+def decode_predictions(raw, conf_threshold=CONF_THRESHOLD):
+    """Decode one (84, 8400) YOLOv8 prediction into (boxes, scores, class_ids) above the threshold.
 
-def postprocess(outputs, conf_threshold=CONF_THRESHOLD):
+    The 84 rows are 4 box coordinates (xywh) followed by 80 class scores; YOLOv8 has no
+    objectness column.
+    """
+    class_scores = raw[4:]
+    class_ids = np.argmax(class_scores, axis=0)
+    scores = np.take_along_axis(class_scores, class_ids[None, :], axis=0)[0]
+    mask = scores >= conf_threshold
+    boxes = xywh_to_xyxy(raw[0:4, mask].T)
+    return boxes, scores[mask].astype(np.float32), class_ids[mask].astype(np.int64)
+
+
+@timed("postprocess")
+def postprocess_batch(outputs, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, class_aware=False):
+    """Post-process a batched model output into one (boxes, scores, class_ids) tuple per image."""
+    results = []
+    for raw in outputs[0]:
+        boxes, scores, class_ids = decode_predictions(raw, conf_threshold)
+        if class_aware:
+            keep = class_aware_non_max_suppression(boxes, scores, class_ids, iou_threshold)
+        else:
+            keep = non_max_suppression(boxes, scores, iou_threshold)
+        results.append((boxes[keep], scores[keep], class_ids[keep]))
+    return results
+
+
+def postprocess(outputs, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, class_aware=False):
     """Post-process raw model outputs to extract detections and apply NMS.
 
     Assumes outputs is a list with at least one element. The first element should have shape (1, 84, 8400),
-    where 84 = 4 (box) + 1 (objectness) + 79 (class scores).
+    where 84 = 4 (box) + 80 (class scores).
     """
-    raw = outputs[0]  # shape: (1, 84, 8400)
-    # Remove batch dimension and transpose to (8400, 84)
-    preds = np.squeeze(raw, axis=0).transpose(1, 0)  # shape: (8400, 84)
-
-    boxes = []
-    scores = []
-    class_ids = []
-
-    for pred in preds:
-        # The first 4 are bbox (assumed to be in xywh format), next is objectness, rest are class scores
-        box = pred[0:4]
-        obj_conf = pred[4]
-        class_scores = pred[5:]
-        cls_id = np.argmax(class_scores)
-        cls_conf = class_scores[cls_id]
-        score = obj_conf * cls_conf
-        if score >= conf_threshold:
-            # Convert box from xywh to xyxy
-            box_xyxy = xywh_to_xyxy(box)
-            boxes.append(box_xyxy)
-            scores.append(score)
-            class_ids.append(cls_id)
-
-    if len(boxes) == 0:
-        return [], [], []
-
-    boxes = np.array(boxes)
-    scores = np.array(scores)
-    class_ids = np.array(class_ids)
-
-    # Apply non-max suppression
-    keep_indices = non_max_suppression(boxes, scores, iou_threshold=IOU_THRESHOLD)
-
-    return boxes[keep_indices], scores[keep_indices], class_ids[keep_indices]
+    return postprocess_batch([outputs[0][:1]], conf_threshold, iou_threshold, class_aware)[0]
 
 
+@timed("draw")
 def draw_detections(image, boxes, scores, class_ids):
     """Draw bounding boxes and scores on the image."""
     for box, score, cls in zip(boxes, scores, class_ids):
@@ -122,8 +205,14 @@ def draw_detections(image, boxes, scores, class_ids):
 
 
 def main():
-    model_file = "yolov8s.onnx"
-    sample_image_path = os.path.join("samples", "bus.jpg")
+    parser = argparse.ArgumentParser(description='Run the YOLO ONNX model on an image and draw the detections.')
+    parser.add_argument('image', nargs='?', default=os.path.join("samples", "bus.jpg"), help='Image to run on.')
+    parser.add_argument('--model', default="yolov8s.onnx", help='Path to the ONNX model.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    model_file = args.model
+    sample_image_path = args.image
 
     if not os.path.exists(model_file):
         print(f"ONNX model file '{model_file}' not found. Please export the model first.")
@@ -134,26 +223,29 @@ def main():
         return
 
     # Load the model
-    sess = ort.InferenceSession(model_file)
+    sess = get_session(model_file, **start_profile(args))
     input_name = sess.get_inputs()[0].name
 
     # Read and preprocess image
-    orig_image = cv2.imread(sample_image_path)
+    with timer("read"):
+        orig_image = cv2.imread(sample_image_path)
     if orig_image is None:
         print(f"Failed to load image {sample_image_path}")
         return
-    # For inference, resize and preprocess the image
-    input_tensor = preprocess_image_cv(orig_image, INPUT_SIZE)
+    # For inference, letterbox and preprocess the image
+    input_tensor, scale, pad = preprocess_image_letterbox(orig_image, INPUT_SIZE)
 
     # Run inference
-    outputs = sess.run(None, {input_name: input_tensor})
+    with timer("infer"):
+        outputs = sess.run(None, {input_name: input_tensor})
 
-    # Post-process detections
+    # Post-process detections and map them back to the original image
     boxes, scores, class_ids = postprocess(outputs, CONF_THRESHOLD)
+    boxes = scale_boxes_to_original(boxes, scale, pad, orig_image.shape)
 
-    # For drawing, use the resized image (for consistency with inference)
-    drawn_image = cv2.resize(orig_image, INPUT_SIZE)
-    drawn_image = draw_detections(drawn_image, boxes, scores, class_ids)
+    # Draw directly on the original image, no resized copy needed
+    drawn_image = draw_detections(orig_image, boxes, scores, class_ids)
+    finish_profile(args, [sess])
 
     # Display the image
     cv2.imshow('Detections', drawn_image)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""Shared onnxruntime InferenceSession pool with an on-disk optimized-model cache.
+
+Usage:
+    python session_pool.py --model yolov8s.onnx
+
+Each session is created once per (model, providers, options) and reused afterwards. The first
+time a model is loaded, onnxruntime writes the graph-optimized model to the cache directory
+(``SessionOptions.optimized_model_filepath``); later process starts load that file with graph
+optimization disabled, which skips the optimization cost.
+
+Running the script reports the cold-start, warm-start (optimized model cache) and pool-hit times.
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+
+import onnxruntime as ort
+
+# Parameters
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pylab", "onnx")
+DEFAULT_PROVIDERS = ("CPUExecutionProvider",)
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def model_digest(model_file):
+    """Return a short SHA-1 digest of the model file contents."""
+    digest = hashlib.sha1()
+    with open(model_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def make_session_options(intra_op_threads=0, inter_op_threads=1, graph_optimization_level="all",
+                         profile_prefix=None):
+    """Build SessionOptions tuned for CPU inference of a single model.
+
+    intra_op_threads=0 lets onnxruntime use one thread per physical core. Operators run
+    sequentially, so inter_op_threads only matters when several sessions share a process.
+    With a profile_prefix, onnxruntime profiles every operator and sess.end_profiling()
+    writes the result to <profile_prefix>_<timestamp>.json.
+    """
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+    if profile_prefix:
+        options.enable_profiling = True
+        options.profile_file_prefix = profile_prefix
+    return options
+
+
+class SessionPool:
+    """Create each InferenceSession once per (model, providers, options) and hand out the same one afterwards."""
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def optimized_model_path(self, model_file, providers, graph_optimization_level):
+        """Return the cache path of the optimized model; it depends on the model contents and providers."""
+        stem = os.path.splitext(os.path.basename(model_file))[0]
+        key = hashlib.sha1(f"{model_digest(model_file)}|{'|'.join(providers)}|{graph_optimization_level}"
+                           f"|{ort.__version__}".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{stem}.{key}.onnx")
+
+    def create_session(self, model_file, providers=DEFAULT_PROVIDERS, intra_op_threads=0, inter_op_threads=1,
+                       graph_optimization_level="all", profile_prefix=None):
+        """Create a new session, loading the cached optimized model if there is one."""
+        providers = list(providers)
+        if self.cache_dir is None or graph_optimization_level == "disable":
+            options = make_session_options(intra_op_threads, inter_op_threads, graph_optimization_level,
+                                           profile_prefix)
+            return ort.InferenceSession(model_file, sess_options=options, providers=providers)
+
+        cached_file = self.optimized_model_path(model_file, providers, graph_optimization_level)
+        if os.path.exists(cached_file):
+            # Already optimized offline, so skip graph optimization on load
+            options = make_session_options(intra_op_threads, inter_op_threads, "disable", profile_prefix)
+            return ort.InferenceSession(cached_file, sess_options=options, providers=providers)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        options = make_session_options(intra_op_threads, inter_op_threads, graph_optimization_level,
+                                       profile_prefix)
+        # Write to a temporary name first so a concurrent process never loads a partial file
+        tmp_file = f"{cached_file}.{os.getpid()}.tmp"
+        options.optimized_model_filepath = tmp_file
+        sess = ort.InferenceSession(model_file, sess_options=options, providers=providers)
+        if os.path.exists(tmp_file):
+            os.replace(tmp_file, cached_file)
+        return sess
+
+    def get(self, model_file, providers=DEFAULT_PROVIDERS, intra_op_threads=0, inter_op_threads=1,
+            graph_optimization_level="all", profile_prefix=None):
+        """Return the pooled session for these settings, creating it on first use."""
+        key = (os.path.abspath(model_file), tuple(providers), intra_op_threads, inter_op_threads,
+               graph_optimization_level, profile_prefix)
+        with self._lock:
+            sess = self._sessions.get(key)
+            if sess is None:
+                sess = self.create_session(model_file, providers, intra_op_threads, inter_op_threads,
+                                           graph_optimization_level, profile_prefix)
+                self._sessions[key] = sess
+            return sess
+
+    def clear(self):
+        """Drop all pooled sessions; the optimized models stay on disk."""
+        with self._lock:
+            self._sessions.clear()
+
+
+_default_pool = SessionPool()
+
+
+def get_session(model_file, **kwargs):
+    """Return a session from the process-wide pool; see SessionPool.get for the options."""
+    return _default_pool.get(model_file, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report cold-start vs warm-start session creation time.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help='Directory of the optimized model cache.')
+    parser.add_argument('--threads', type=int, default=0, help='Intra-op threads, 0 for one per physical core.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    pool = SessionPool(args.cache_dir)
+    cached_file = pool.optimized_model_path(args.model, DEFAULT_PROVIDERS, "all")
+    if os.path.exists(cached_file):
+        os.remove(cached_file)
+
+    start = time.perf_counter()
+    pool.get(args.model, intra_op_threads=args.threads)
+    cold = time.perf_counter() - start
+
+    # A fresh pool behaves like a new process that finds the optimized model on disk
+    start = time.perf_counter()
+    SessionPool(args.cache_dir).get(args.model, intra_op_threads=args.threads)
+    warm = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pool.get(args.model, intra_op_threads=args.threads)
+    hit = time.perf_counter() - start
+
+    print(f"Optimized model cache: {cached_file}")
+    print(f"Cold start (optimize and save): {cold * 1000:.1f} ms")
+    print(f"Warm start (cached model):      {warm * 1000:.1f} ms")
+    print(f"Pool hit:                       {hit * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""Array-backed detection collection with an STR-packed R-tree for window and nearest-neighbour queries.
+
+Usage:
+    python spatial_index.py build scenes/*.tif --model yolov8s.onnx --output detections.idx
+    python spatial_index.py query detections.idx --bbox 500100 3999000 500400 3999600
+    python spatial_index.py query detections.idx --nearest 500250 3999300 --k 5 --class-id 2
+    python spatial_index.py query detections.idx --scene 0 --bbox 0 0 640 640        # pixel coordinates
+
+A DetectionIndex holds the detections of many scenes as flat arrays: pixel boxes, scores,
+class ids, the scene each detection came from, and the map-coordinate bounds of every box
+(from the scene's affine transform). The R-tree is bulk loaded with Sort-Tile-Recursive
+packing over the map bounds: detections are reordered so every leaf is a contiguous run of
+CAPACITY detections and every inner node a contiguous run of CAPACITY child nodes, so the
+whole tree is two arrays, node bounds and (first child, child count).
+
+Window queries descend the tree one level at a time with vectorized bounds tests; nearest
+neighbour queries are a best-first search. Pixel-coordinate queries are for one scene: the
+window or point goes through that scene's transform and the candidates are filtered by scene.
+
+save() writes every array as a .npy file in a directory; load() memory maps them, so a query
+only pages in the nodes and detections it touches.
+"""
+
+import argparse
+import glob
+import heapq
+import json
+import math
+import os
+
+import numpy as np
+
+# Parameters
+CAPACITY = 16
+# Identity affine transform (a, b, c, d, e, f) for detections without georeferencing
+IDENTITY = (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+ARRAYS = ('boxes', 'scores', 'class_ids', 'scene_ids', 'map_boxes', 'node_bounds', 'node_children', 'transforms')
+
+
+def map_bounds(boxes, transform):
+    """Return the (N, 4) map-coordinate bounds (xmin, ymin, xmax, ymax) of pixel boxes."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    cols = boxes[:, [0, 2, 2, 0]]
+    rows = boxes[:, [1, 1, 3, 3]]
+    a, b, c, d, e, f = transform[:6]
+    x = a * cols + b * rows + c
+    y = d * cols + e * rows + f
+    return np.column_stack([x.min(axis=1), y.min(axis=1), x.max(axis=1), y.max(axis=1)])
+
+
+def str_order(bounds, capacity=CAPACITY):
+    """Return the Sort-Tile-Recursive order of boxes: vertical slabs by x center, each sorted by y center."""
+    n = len(bounds)
+    cx = bounds[:, 0] + bounds[:, 2]
+    cy = bounds[:, 1] + bounds[:, 3]
+    slab_size = capacity * math.ceil(math.sqrt(math.ceil(n / capacity)))
+    slab = np.empty(n, dtype=np.int64)
+    slab[np.argsort(cx, kind="stable")] = np.arange(n) // slab_size
+    return np.lexsort((cy, slab))
+
+
+def group_bounds(bounds, capacity=CAPACITY):
+    """Return the bounds of consecutive groups of capacity boxes and each group's (first, count)."""
+    starts = np.arange(0, len(bounds), capacity)
+    grouped = np.column_stack([np.minimum.reduceat(bounds[:, 0], starts), np.minimum.reduceat(bounds[:, 1], starts),
+                               np.maximum.reduceat(bounds[:, 2], starts), np.maximum.reduceat(bounds[:, 3], starts)])
+    counts = np.minimum(capacity, len(bounds) - starts)
+    return grouped, np.column_stack([starts, counts])
+
+
+def intersects(bounds, window):
+    xmin, ymin, xmax, ymax = window
+    return (bounds[:, 0] <= xmax) & (bounds[:, 2] >= xmin) & (bounds[:, 1] <= ymax) & (bounds[:, 3] >= ymin)
+
+
+def point_distances(bounds, x, y):
+    """Return the distance from (x, y) to each box; 0 inside a box."""
+    dx = np.maximum(np.maximum(bounds[:, 0] - x, x - bounds[:, 2]), 0)
+    dy = np.maximum(np.maximum(bounds[:, 1] - y, y - bounds[:, 3]), 0)
+    return np.hypot(dx, dy)
+
+
+def expand(children):
+    """Return the concatenated index ranges [first, first + count) of the given (first, count) rows."""
+    counts = children[:, 1]
+    if not len(counts):
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(children[:, 0] - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(counts.sum())
+
+
+class DetectionIndex:
+    """Detections of many scenes in flat arrays, with a packed R-tree over their map bounds.
+
+    Every array is in the tree's order; query results are indices into these arrays. Nodes
+    are stored root first, level by level; the children of an inner node are nodes, those of
+    a node at or after leaf_offset are detections.
+    """
+
+    def __init__(self, arrays, scenes, leaf_offset, capacity=CAPACITY):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.scenes = scenes
+        self.leaf_offset = leaf_offset
+        self.capacity = capacity
+
+    @classmethod
+    def build(cls, boxes, scores, class_ids, scene_ids=None, transforms=(IDENTITY,), scenes=None,
+              capacity=CAPACITY):
+        """Bulk load detections; scene_ids index into transforms (one affine per scene) and scenes (names)."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        scene_ids = np.zeros(len(boxes), dtype=np.int32) if scene_ids is None else np.asarray(scene_ids, np.int32)
+        transforms = np.array([tuple(transform)[:6] for transform in transforms], dtype=np.float64)
+        scenes = list(scenes) if scenes is not None else [str(i) for i in range(len(transforms))]
+        bounds = np.empty((len(boxes), 4), dtype=np.float64)
+        for scene in np.unique(scene_ids):
+            selected = scene_ids == scene
+            bounds[selected] = map_bounds(boxes[selected], transforms[scene])
+
+        order = str_order(bounds, capacity) if len(boxes) else np.empty(0, dtype=np.int64)
+        arrays = {'boxes': boxes[order], 'scores': np.asarray(scores, dtype=np.float32)[order],
+                  'class_ids': np.asarray(class_ids, dtype=np.int64)[order], 'scene_ids': scene_ids[order],
+                  'map_boxes': bounds[order], 'transforms': transforms}
+
+        # Pack levels bottom up; a level is reordered by STR before its parents are formed
+        levels = []
+        level_bounds = arrays['map_boxes']
+        while len(level_bounds):
+            level_bounds, children = group_bounds(level_bounds, capacity)
+            if len(level_bounds) > 1:
+                order = str_order(level_bounds, capacity)
+                level_bounds, children = level_bounds[order], children[order]
+            levels.append((level_bounds, children))
+            if len(level_bounds) == 1:
+                break
+        levels.reverse()
+        # Child pointers of inner nodes become absolute node indices
+        sizes = [len(level_bounds) for level_bounds, _ in levels]
+        offsets = np.cumsum([0] + sizes)
+        for depth, (_, children) in enumerate(levels[:-1]):
+            children[:, 0] += offsets[depth + 1]
+        arrays['node_bounds'] = np.concatenate([b for b, _ in levels]) if levels else np.empty((0, 4))
+        arrays['node_children'] = (np.concatenate([c for _, c in levels]) if levels
+                                   else np.empty((0, 2), dtype=np.int64))
+        return cls(arrays, scenes, int(offsets[-2]) if levels else 0, capacity)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def window(self, bounds, scene=None, class_ids=None):
+        """Return the indices of detections whose map bounds intersect (xmin, ymin, xmax, ymax)."""
+        if not len(self.node_bounds):
+            return np.empty(0, dtype=np.int64)
+        # The frontier always holds nodes of one level, so it reaches the leaves all at once
+        nodes = np.zeros(1, dtype=np.int64)
+        while True:
+            nodes = nodes[intersects(self.node_bounds[nodes], bounds)]
+            if not len(nodes):
+                return nodes
+            children = expand(self.node_children[nodes])
+            if nodes[0] >= self.leaf_offset:
+                break
+            nodes = children
+        items = children[intersects(self.map_boxes[children], bounds)]
+        return items[self._matches(items, scene, class_ids)]
+
+    def pixel_window(self, scene, bounds, class_ids=None):
+        """Return the indices of detections of one scene whose pixel boxes intersect (x0, y0, x1, y1)."""
+        window = map_bounds(np.array([bounds]), self.transforms[scene])[0]
+        items = self.window(window, scene, class_ids)
+        return items[intersects(self.boxes[items], bounds)]
+
+    def nearest(self, x, y, k=1, scene=None, class_ids=None):
+        """Return (indices, distances) of the k detections closest to map point (x, y), nearest first."""
+        found, distances = [], []
+        if not len(self.node_bounds):
+            return np.array(found, dtype=np.int64), np.array(distances)
+        # Best-first search: nodes are pushed as (distance, index), detections as (distance, -1 - index)
+        queue = [(float(point_distances(self.node_bounds[:1], x, y)[0]), 0)]
+        while queue and len(found) < k:
+            distance, entry = heapq.heappop(queue)
+            if entry < 0:
+                found.append(-1 - entry)
+                distances.append(distance)
+                continue
+            first, child_count = self.node_children[entry]
+            children = np.arange(first, first + child_count)
+            if entry >= self.leaf_offset:
+                children = children[self._matches(children, scene, class_ids)]
+                child_distances = point_distances(self.map_boxes[children], x, y)
+                children = -1 - children
+            else:
+                child_distances = point_distances(self.node_bounds[children], x, y)
+            for child_distance, child in zip(child_distances.tolist(), children.tolist()):
+                heapq.heappush(queue, (child_distance, child))
+        return np.array(found, dtype=np.int64), np.array(distances)
+
+    def pixel_nearest(self, scene, col, row, k=1, class_ids=None):
+        """Return (indices, map distances) of the k detections of one scene closest to pixel (col, row).
+
+        Ranking is by map distance, which is the pixel ranking scaled whenever pixels are square.
+        """
+        a, b, c, d, e, f = self.transforms[scene]
+        return self.nearest(a * col + b * row + c, d * col + e * row + f, k, scene, class_ids)
+
+    def _matches(self, items, scene, class_ids):
+        keep = np.ones(len(items), dtype=bool)
+        if scene is not None:
+            keep &= self.scene_ids[items] == scene
+        if class_ids is not None:
+            keep &= np.isin(self.class_ids[items], np.atleast_1d(class_ids))
+        return keep
+
+    def take(self, indices):
+        """Return (boxes, scores, class_ids, scene_ids) of the given detections as in-memory arrays."""
+        return (np.asarray(self.boxes[indices]), np.asarray(self.scores[indices]),
+                np.asarray(self.class_ids[indices]), np.asarray(self.scene_ids[indices]))
+
+    def save(self, directory):
+        """Write the index as one .npy file per array plus index.json into directory."""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump({'scenes': self.scenes, 'leaf_offset': self.leaf_offset, 'capacity': self.capacity}, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """Open a saved index with every array memory mapped (mmap_mode=None reads them into memory)."""
+        with open(os.path.join(directory, "index.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode) for name in ARRAYS}
+        return cls(arrays, meta['scenes'], meta['leaf_offset'], meta['capacity'])
+
+
+def build_from_rasters(paths, model_file, bands=None, percentiles='default', **tiled_kwargs):
+    """Run tiled inference and the seam merge on every raster and bulk load the results into one index.
+
+    Tiles are read through a raster_input.RasterTileReader of the given bands and stretch.
+    """
+    import rasterio
+
+    from batch_inference import auto_batch_size
+    from merge_detections import merge_detections
+    from raster_input import RasterTileReader
+    from session_pool import get_session
+    from tiled_inference import TILE_SIZE, run_tiled_inference
+
+    sess = get_session(model_file)
+    batch_size = auto_batch_size(sess)
+    detections, transforms = [], []
+    for scene, path in enumerate(paths):
+        with rasterio.open(path) as src:
+            reader = RasterTileReader(src, bands, percentiles, tiled_kwargs.get('tile_size', TILE_SIZE))
+            boxes, scores, class_ids = merge_detections(*run_tiled_inference(sess, src, batch_size=batch_size,
+                                                                             reader=reader, **tiled_kwargs))
+            transforms.append(src.transform)
+        detections.append((boxes, scores, class_ids, np.full(len(boxes), scene, dtype=np.int32)))
+        print(f"{path}: {len(boxes)} detections")
+    boxes, scores, class_ids, scene_ids = (np.concatenate(arrays) for arrays in zip(*detections))
+    return DetectionIndex.build(boxes, scores, class_ids, scene_ids, transforms, [os.path.abspath(p) for p in paths])
+
+
+def print_detections(index, indices, distances=None):
+    boxes, scores, class_ids, scene_ids = index.take(indices)
+    for i, (box, score, cls, scene) in enumerate(zip(boxes.tolist(), scores.tolist(), class_ids.tolist(),
+                                                     scene_ids.tolist())):
+        line = f"{index.scenes[scene]}  class {cls}  score {score:.3f}  box {[round(v, 1) for v in box]}"
+        if distances is not None:
+            line += f"  distance {distances[i]:.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query a spatial index over detections.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help='Detect objects in rasters and index them.')
+    build.add_argument('rasters', nargs='+', help='GeoTIFF files or glob patterns.')
+    build.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    build.add_argument('--output', default='detections.idx', help='Index directory to write.')
+    # Spelled out rather than taken from raster_input, which would make queries import rasterio
+    build.add_argument('--bands', type=int, nargs=3, help='Bands to use as R, G, B; the first three by default.')
+    build.add_argument('--stretch', type=float, nargs=2, metavar=('LOW', 'HIGH'),
+                       help='Per-band percentiles to stretch over; 2 98 by default for non-8-bit rasters.')
+    query = subparsers.add_parser('query', help='Query a saved index.')
+    query.add_argument('index', help='Index directory.')
+    query.add_argument('--bbox', nargs=4, type=float, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                       help='Window to query, in map coordinates (pixels with --scene).')
+    query.add_argument('--nearest', nargs=2, type=float, metavar=('X', 'Y'),
+                       help='Point to find the nearest detections of, in map coordinates (pixels with --scene).')
+    query.add_argument('--k', type=int, default=1, help='Number of nearest detections.')
+    query.add_argument('--scene', type=int, help='Query one scene in its pixel coordinates.')
+    query.add_argument('--class-id', type=int, action='append', help='Only return these classes.')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if not os.path.exists(args.model):
+            print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+            return
+        paths = sorted(path for pattern in args.rasters for path in (glob.glob(pattern) or [pattern]))
+        index = build_from_rasters(paths, args.model, args.bands, args.stretch or 'default')
+        index.save(args.output)
+        print(f"Indexed {len(index)} detections of {len(paths)} scenes into {args.output}")
+        return
+
+    if not os.path.exists(os.path.join(args.index, "index.json")):
+        print(f"Index '{args.index}' not found.")
+        return
+    index = DetectionIndex.load(args.index)
+    if args.bbox:
+        if args.scene is None:
+            indices = index.window(args.bbox, class_ids=args.class_id)
+        else:
+            indices = index.pixel_window(args.scene, args.bbox, args.class_id)
+        print_detections(index, indices)
+    if args.nearest:
+        if args.scene is None:
+            indices, distances = index.nearest(*args.nearest, args.k, class_ids=args.class_id)
+        else:
+            indices, distances = index.pixel_nearest(args.scene, *args.nearest, args.k, args.class_id)
+        print_detections(index, indices, distances)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
 import customtkinter as ctk
 import os
-from PIL import Image
+from tkinter import filedialog, messagebox
+
+try:
+    # Imported as src.main by the pylab command line
+    from .raster_viewer import RasterViewer
+except ImportError:
+    # Run as a script, or imported with src/ on the path
+    from raster_viewer import RasterViewer
 
 class ImageProcessingApp(ctk.CTk):
     def __init__(self):
@@ -30,8 +37,8 @@ class ImageProcessingApp(ctk.CTk):
         )
         self.title_label.grid(row=0, column=0, padx=10, pady=10)
 
-        # Add image frame
-        self.image_frame = ctk.CTkFrame(self.main_frame)
+        # Add image frame: a pan/zoom viewer that reads only the visible window at the matching overview level
+        self.image_frame = RasterViewer(self.main_frame)
         self.image_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
 
         # Add buttons frame
@@ -47,8 +54,16 @@ class ImageProcessingApp(ctk.CTk):
         self.load_button.pack(side="left", padx=5, pady=5)
 
     def load_image(self):
-        # TODO: Implement image loading functionality
-        pass
+        file_path = filedialog.askopenfilename(
+            initialdir=os.getcwd(),
+            title="Select Image",
+            filetypes=(("GeoTIFF Files", "*.tif;*.tiff"), ("Image Files", "*.jpg;*.png;*.jpeg"), ("All Files", "*.*"))
+        )
+        if file_path:
+            try:
+                self.image_frame.open(file_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to load image: {e}")
 
 def main():
     app = ImageProcessingApp()
@@ -0,0 +1,241 @@
+import collections
+import math
+
+import customtkinter as ctk
+import numpy as np
+import rasterio
+from PIL import Image, ImageTk
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+# Display tiles are this many screen-resolution pixels on a side at their pyramid level
+DISPLAY_TILE_SIZE = 256
+# Memory budget of the decoded display tile cache
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+ZOOM_STEP = 1.25
+
+
+def overview_factors(width, height, tile_size=DISPLAY_TILE_SIZE):
+    """Return the power-of-two overview factors needed until the whole image fits in one tile."""
+    factors = []
+    factor = 2
+    while max(width, height) / (factor // 2) > tile_size:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def ensure_overviews(path):
+    """Build GDAL overviews for a raster that has none; returns the available factors.
+
+    The overviews go to an external .ovr file, so the source GeoTIFF itself is not rewritten.
+    If the overviews cannot be written (e.g. a read-only location) the viewer still works by
+    decimating full-resolution reads, only slower.
+    """
+    with rasterio.open(path) as src:
+        existing = src.overviews(1)
+        if existing:
+            return existing
+        factors = overview_factors(src.width, src.height)
+    if not factors:
+        return []
+    try:
+        with rasterio.Env(TIFF_USE_OVR=True):
+            with rasterio.open(path, "r+") as dst:
+                dst.build_overviews(factors, Resampling.average)
+    except rasterio.errors.RasterioError:
+        return []
+    return factors
+
+
+def to_display(data):
+    """Convert a (bands, h, w) read into an (h, w, 3) uint8 RGB array."""
+    if data.shape[0] >= 3:
+        data = data[:3]
+    else:
+        data = np.repeat(data[:1], 3, axis=0)
+    if data.dtype != np.uint8:
+        scale = 255.0 / np.iinfo(data.dtype).max if np.issubdtype(data.dtype, np.integer) else 255.0
+        data = np.clip(data * scale, 0, 255).astype(np.uint8)
+    return np.ascontiguousarray(data.transpose(1, 2, 0))
+
+
+class TileCache:
+    """LRU cache of decoded display tiles that evicts the oldest tiles beyond a byte budget."""
+
+    def __init__(self, max_bytes=TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._tiles = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key):
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile):
+        if key in self._tiles:
+            self.nbytes -= self._tiles.pop(key).nbytes
+        self._tiles[key] = tile
+        self.nbytes += tile.nbytes
+        while self.nbytes > self.max_bytes and len(self._tiles) > 1:
+            _, evicted = self._tiles.popitem(last=False)
+            self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        self._tiles.clear()
+        self.nbytes = 0
+
+
+class RasterPyramid:
+    """Reads display tiles of a raster at the overview level matching the zoom."""
+
+    def __init__(self, path, cache=None, tile_size=DISPLAY_TILE_SIZE):
+        self.path = path
+        self.tile_size = tile_size
+        self.factors = [1] + sorted(ensure_overviews(path))
+        self.src = rasterio.open(path)
+        self.width, self.height = self.src.width, self.src.height
+        self.cache = cache if cache is not None else TileCache()
+        self.reads = 0
+
+    def close(self):
+        self.src.close()
+
+    def level_for_zoom(self, zoom):
+        """Return the coarsest pyramid factor that still has at least one source pixel per screen pixel."""
+        factor = 1
+        for candidate in self.factors:
+            if candidate <= 1 / zoom:
+                factor = candidate
+        return factor
+
+    def tile(self, factor, tx, ty):
+        """Return the (h, w, 3) display tile (tx, ty) of the level with the given factor."""
+        key = (factor, tx, ty)
+        tile = self.cache.get(key)
+        if tile is None:
+            span = self.tile_size * factor
+            col_off, row_off = tx * span, ty * span
+            width, height = min(span, self.width - col_off), min(span, self.height - row_off)
+            out_shape = (self.src.count, max(1, math.ceil(height / factor)), max(1, math.ceil(width / factor)))
+            # A decimated read: GDAL serves it from the overview of the matching factor
+            data = self.src.read(window=Window(col_off, row_off, width, height), out_shape=out_shape,
+                                 resampling=Resampling.nearest)
+            tile = to_display(data)
+            self.cache.put(key, tile)
+            self.reads += 1
+        return tile
+
+    def render(self, center, zoom, viewport):
+        """Render the (width, height) viewport centred on source pixel center at zoom screen px per source px."""
+        view_width, view_height = viewport
+        factor = self.level_for_zoom(zoom)
+        # Visible region in level pixels
+        scale = zoom * factor
+        left = center[0] / factor - view_width / scale / 2
+        top = center[1] / factor - view_height / scale / 2
+        right = left + view_width / scale
+        bottom = top + view_height / scale
+        level_width, level_height = math.ceil(self.width / factor), math.ceil(self.height / factor)
+
+        tx0, ty0 = max(0, int(left // self.tile_size)), max(0, int(top // self.tile_size))
+        tx1 = min(math.ceil(level_width / self.tile_size), int(right // self.tile_size) + 1)
+        ty1 = min(math.ceil(level_height / self.tile_size), int(bottom // self.tile_size) + 1)
+
+        canvas = np.zeros((view_height, view_width, 3), dtype=np.uint8)
+        if tx0 >= tx1 or ty0 >= ty1:
+            return canvas
+        mosaic = np.zeros(((ty1 - ty0) * self.tile_size, (tx1 - tx0) * self.tile_size, 3), dtype=np.uint8)
+        for ty in range(ty0, ty1):
+            for tx in range(tx0, tx1):
+                tile = self.tile(factor, tx, ty)
+                y, x = (ty - ty0) * self.tile_size, (tx - tx0) * self.tile_size
+                mosaic[y:y + tile.shape[0], x:x + tile.shape[1]] = tile
+
+        # Map every screen pixel to a mosaic pixel (nearest neighbour) in one vectorized gather
+        xs = np.floor(left + (np.arange(view_width) + 0.5) / scale).astype(np.int64) - tx0 * self.tile_size
+        ys = np.floor(top + (np.arange(view_height) + 0.5) / scale).astype(np.int64) - ty0 * self.tile_size
+        valid_x = (xs >= 0) & (xs < min(mosaic.shape[1], level_width - tx0 * self.tile_size))
+        valid_y = (ys >= 0) & (ys < min(mosaic.shape[0], level_height - ty0 * self.tile_size))
+        canvas[np.ix_(valid_y, valid_x)] = mosaic[np.ix_(ys[valid_y], xs[valid_x])]
+        return canvas
+
+
+class RasterViewer(ctk.CTkFrame):
+    """Pan/zoom viewer that only reads the visible part of a raster at the matching overview level.
+
+    Drag with the left mouse button to pan, use the mouse wheel to zoom around the cursor.
+    """
+
+    def __init__(self, master, **kwargs):
+        super().__init__(master, **kwargs)
+        self.pyramid = None
+        self.cache = TileCache()
+        self.center = (0.0, 0.0)
+        self.zoom = 1.0
+        self._drag_start = None
+        self._render_pending = False
+
+        self.canvas = ctk.CTkCanvas(self, highlightthickness=0, background="black")
+        self.canvas.pack(fill="both", expand=True)
+        self.canvas.bind("<Configure>", lambda event: self.request_render())
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<MouseWheel>", lambda event: self._on_zoom(event, event.delta > 0))
+        self.canvas.bind("<Button-4>", lambda event: self._on_zoom(event, True))
+        self.canvas.bind("<Button-5>", lambda event: self._on_zoom(event, False))
+
+    def open(self, path):
+        """Show a raster, fitted to the viewer."""
+        if self.pyramid is not None:
+            self.pyramid.close()
+        self.cache.clear()
+        self.pyramid = RasterPyramid(path, self.cache)
+        self.center = (self.pyramid.width / 2, self.pyramid.height / 2)
+        width, height = self._viewport()
+        self.zoom = min(width / self.pyramid.width, height / self.pyramid.height)
+        self.request_render()
+
+    def _viewport(self):
+        return max(1, self.canvas.winfo_width()), max(1, self.canvas.winfo_height())
+
+    def request_render(self):
+        # Coalesce bursts of pan/zoom events into one render per idle cycle
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    def _render(self):
+        self._render_pending = False
+        if self.pyramid is None:
+            return
+        image = self.pyramid.render(self.center, self.zoom, self._viewport())
+        self.photo = ImageTk.PhotoImage(Image.fromarray(image))
+        self.canvas.delete("all")
+        self.canvas.create_image(0, 0, image=self.photo, anchor="nw")
+
+    def _on_press(self, event):
+        self._drag_start = (event.x, event.y, self.center)
+
+    def _on_drag(self, event):
+        if self._drag_start is None:
+            return
+        x, y, (cx, cy) = self._drag_start
+        self.center = (cx - (event.x - x) / self.zoom, cy - (event.y - y) / self.zoom)
+        self.request_render()
+
+    def _on_zoom(self, event, zoom_in):
+        if self.pyramid is None:
+            return
+        width, height = self._viewport()
+        # Keep the source pixel under the cursor fixed while zooming
+        px = self.center[0] + (event.x - width / 2) / self.zoom
+        py = self.center[1] + (event.y - height / 2) / self.zoom
+        self.zoom *= ZOOM_STEP if zoom_in else 1 / ZOOM_STEP
+        self.center = (px - (event.x - width / 2) / self.zoom, py - (event.y - height / 2) / self.zoom)
+        self.request_render()
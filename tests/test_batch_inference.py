@@ -0,0 +1,88 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("rasterio")
+
+from batch_inference import auto_batch_size, infer_batch, iter_batches, model_input_shape, run_batch
+
+
+class EchoSession:
+    """Returns the per-item mean of its input, with a configurable batch axis."""
+
+    def __init__(self, batch_dim):
+        self.batch_dim = batch_dim
+        self.batch_sizes = []
+
+    def get_inputs(self):
+        class Input:
+            name = "images"
+            shape = [self.batch_dim, 3, 640, 640]
+        return [Input()]
+
+    def get_outputs(self):
+        class Output:
+            shape = [self.batch_dim, 84, 8400]
+        return [Output()]
+
+    def run(self, output_names, feeds):
+        batch = feeds["images"]
+        self.batch_sizes.append(len(batch))
+        return [batch.mean(axis=(1, 2, 3))[:, None]]
+
+
+def test_infer_batch_splits_outputs():
+    """Test that a dynamic batch runs in one call and outputs are split per item"""
+    sess = EchoSession("batch")
+    tensors = [np.full((1, 3, 640, 640), i, dtype=np.float32) for i in range(5)]
+    outputs = infer_batch(sess, tensors)
+    assert sess.batch_sizes == [5]
+    assert [float(out[0][0, 0]) for out in outputs] == [0, 1, 2, 3, 4]
+
+
+def test_fixed_batch_model_runs_in_chunks():
+    """Test that a fixed batch model is run in padded chunks of its exported size"""
+    sess = EchoSession(2)
+    batch = np.stack([np.full((3, 640, 640), i, dtype=np.float32) for i in range(5)])
+    outputs = run_batch(sess, batch)
+    assert sess.batch_sizes == [2, 2, 2]
+    np.testing.assert_allclose(outputs[0][:, 0], [0, 1, 2, 3, 4])
+    assert auto_batch_size(sess) == 2
+
+
+def test_auto_batch_size_respects_budget():
+    """Test that the batch size grows with the memory budget and is capped"""
+    sess = EchoSession("batch")
+    small = auto_batch_size(sess, memory_budget_mb=200)
+    large = auto_batch_size(sess, memory_budget_mb=1000)
+    assert 1 <= small < large <= 32
+    assert [len(b) for b in iter_batches(range(7), 3)] == [3, 3, 1]
+
+
+class DynamicSession(EchoSession):
+    """EchoSession exported with dynamic batch and spatial axes, as ``yolo export dynamic=True`` does."""
+
+    def get_inputs(self):
+        class Input:
+            name = "images"
+            shape = ["batch", 3, "height", "width"]
+        return [Input()]
+
+    def get_outputs(self):
+        class Output:
+            shape = ["batch", 84, "anchors"]
+        return [Output()]
+
+
+def test_dynamic_spatial_axes_use_the_default_input_size():
+    """Test that symbolic height and width resolve to 640 x 640 for the input shape and the memory estimate"""
+    dynamic = DynamicSession("batch")
+    assert model_input_shape(dynamic) == (640, 640)
+    assert model_input_shape(EchoSession("batch")) == (640, 640)
+    for budget in (200, 1000):
+        assert auto_batch_size(dynamic, memory_budget_mb=budget) == auto_batch_size(EchoSession("batch"), budget)
@@ -0,0 +1,59 @@
+import pytest
+import subprocess
+import sys
+import os
+
+MAIN = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'main.py'))
+
+# Import time the entry point may add on top of the interpreter's own startup
+IMPORT_BUDGET_MS = 50
+HEAVY_MODULES = {"numpy", "cv2", "onnxruntime", "rasterio", "osgeo", "tkinter", "customtkinter", "PIL"}
+
+
+def script_imports(tmp_path, *args):
+    """Run main.py under -X importtime; return {top-level module: cumulative ms} imported after site."""
+    result = subprocess.run([sys.executable, "-X", "importtime", MAIN, *args], capture_output=True, text=True,
+                            cwd=tmp_path, timeout=60)
+    assert result.returncode == 0, result.stderr
+    lines = [line for line in result.stderr.splitlines() if line.startswith("import time:")]
+    # Everything up to site is the interpreter starting up, including any .pth hooks
+    start = max((i for i, line in enumerate(lines) if line.endswith("| site")), default=0) + 1
+    imports = {}
+    for line in lines[start:]:
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):
+            imports[name.strip()] = int(cumulative) / 1000
+    return imports, result.stdout
+
+
+@pytest.mark.parametrize("args", [("--help",), ("info",)])
+def test_startup_stays_light(tmp_path, args):
+    """Test that help and the version report import none of the heavy modules and stay within budget"""
+    imports, stdout = script_imports(tmp_path, *args)
+    assert stdout
+    assert not HEAVY_MODULES & {name.split(".")[0] for name in imports}
+    assert sum(imports.values()) < IMPORT_BUDGET_MS, imports
+
+
+def test_subcommand_help_is_forwarded(tmp_path):
+    """Test that a subcommand's arguments reach the script implementing it"""
+    pytest.importorskip("cv2")
+    pytest.importorskip("onnxruntime")
+    result = subprocess.run([sys.executable, MAIN, "infer", "--help"], capture_output=True, text=True,
+                            cwd=tmp_path, timeout=60)
+    assert result.returncode == 0
+    assert "usage: pylab infer" in result.stdout and "--model" in result.stdout
+
+
+def test_info_prog_and_viewer_import(tmp_path):
+    """Test that info forwards the program name and that the viewer imports without shadowing main.py"""
+    pytest.importorskip("rasterio")
+    result = subprocess.run([sys.executable, MAIN, "info", "--help"], capture_output=True, text=True,
+                            cwd=tmp_path, timeout=60)
+    assert result.returncode == 0 and "usage: pylab info [-h]" in result.stdout
+
+    pytest.importorskip("customtkinter")
+    pytest.importorskip("PIL")
+    result = subprocess.run([sys.executable, "-c", "import main, src.main; print(main.COMMANDS['gui'], src.main.main)"],
+                            capture_output=True, text=True, cwd=os.path.dirname(MAIN), timeout=60)
+    assert result.returncode == 0, result.stderr
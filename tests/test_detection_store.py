@@ -0,0 +1,115 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from detection_store import DetectionStore, tile_digest
+from test_tiled_inference import FakeSession
+from tiled_inference import run_tiled_inference
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+
+def detections(n):
+    return (np.arange(n * 4, dtype=np.float32).reshape(n, 4), np.full(n, 0.5, dtype=np.float32),
+            np.arange(n, dtype=np.int64))
+
+
+def test_store_round_trip_and_persistence(tmp_path):
+    """Test that stored detections come back unchanged, also after reopening the file"""
+    path = str(tmp_path / "store.sqlite")
+    key = DetectionStore.make_key("tile", "model", 0.25, 0.45)
+    assert key != DetectionStore.make_key("tile", "model", 0.3, 0.45)
+    with DetectionStore(path) as store:
+        assert store.get(key) is None
+        store.put(key, detections(3))
+        store.put(DetectionStore.make_key("empty", "model", 0.25, 0.45), detections(0))
+    with DetectionStore(path) as store:
+        assert len(store) == 2
+        boxes, scores, class_ids = store.get(key)
+        np.testing.assert_array_equal(boxes, detections(3)[0])
+        np.testing.assert_array_equal(class_ids, [0, 1, 2])
+        boxes += 1  # returned arrays are writable copies
+        assert len(store.get(DetectionStore.make_key("empty", "model", 0.25, 0.45))[0]) == 0
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    """Test that the store stays under max_bytes by dropping the entries used longest ago"""
+    store = DetectionStore(str(tmp_path / "store.sqlite"), max_bytes=10 ** 9)
+    for name in "abc":
+        store.put(name, detections(10))
+        store.commit()
+    entry_bytes = store.total_bytes // 3
+    store.get("a")
+    store.max_bytes = 2 * entry_bytes
+    store.commit()
+    assert store.get("b") is None and store.get("a") is not None and store.get("c") is not None
+    assert store.total_bytes <= store.max_bytes
+    store.close()
+
+
+def test_tile_digest_depends_on_content_and_shape():
+    data = np.zeros((3, 64, 64), dtype=np.uint8)
+    assert tile_digest(data, 640) == tile_digest(data.copy(), 640)
+    assert tile_digest(data, 640) != tile_digest(data[:, :32], 640)
+    assert tile_digest(data, 640) != tile_digest(data, 320)
+    changed = data.copy()
+    changed[0, 5, 5] = 1
+    assert tile_digest(data, 640) != tile_digest(changed, 640)
+
+
+def test_unchanged_tiles_skip_the_session(tmp_path):
+    """Test that a re-run only sends tiles with changed pixels to the session, with the same result"""
+    path = str(tmp_path / "scene.tif")
+    data = np.random.default_rng(0).integers(0, 255, (3, 640, 1800), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=1800, height=640, count=3, dtype="uint8") as dst:
+        dst.write(data)
+
+    store = DetectionStore(str(tmp_path / "store.sqlite"))
+    with rasterio.open(path) as src:
+        expected = run_tiled_inference(FakeSession(), src, overlap=64, batch_size=2)
+        first = FakeSession()
+        stored = run_tiled_inference(first, src, overlap=64, batch_size=2, store=store, model_key="fake")
+        again = FakeSession()
+        rerun = run_tiled_inference(again, src, overlap=64, batch_size=2, store=store, model_key="fake")
+    assert first.calls == 2 and again.calls == 0
+    for result in (stored, rerun):
+        order = np.lexsort(result[0].T[::-1])
+        np.testing.assert_allclose(result[0][order], expected[0][np.lexsort(expected[0].T[::-1])])
+
+    # Change pixels only inside the last two tiles, which start at columns 1152 and 1160
+    data[:, 100:110, 1700:1710] = 0
+    with rasterio.open(path, "r+") as dst:
+        dst.write(data)
+    changed = FakeSession()
+    with rasterio.open(path) as src:
+        boxes, _, _ = run_tiled_inference(changed, src, overlap=64, batch_size=2, store=store, model_key="fake")
+    assert changed.calls == 1 and len(boxes) == len(expected[0])
+
+    with pytest.raises(ValueError):
+        with rasterio.open(path) as src:
+            run_tiled_inference(FakeSession(), src, store=store)
+    store.close()
+
+
+def test_cli_first_run_with_a_new_store(tmp_path, monkeypatch, capsys):
+    """Test that the first --store run on a new, still empty store passes the model key and fills it"""
+    import tiled_inference
+    from test_parallel_inference import write_detector, write_raster
+
+    model, raster, store_path = (str(tmp_path / name) for name in ("detector.onnx", "scene.tif", "store.sqlite"))
+    write_detector(model)
+    write_raster(raster, 150, 100, 4)
+    assert not DetectionStore(store_path)
+    for _ in range(2):
+        monkeypatch.setattr(sys, "argv", ["tiled_inference.py", raster, "--model", model, "--tile-size", "64",
+                                          "--overlap", "16", "--store", store_path])
+        tiled_inference.main()
+    assert "Detection store: 6 tiles" in capsys.readouterr().out
@@ -0,0 +1,182 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from ensemble_inference import (
+    Ensemble,
+    EnsembleMember,
+    detect_image,
+    iter_ensemble_tiles,
+    run_ensemble_tiled,
+    weighted_box_fusion,
+)
+from merge_detections import merge_detections
+from preprocess_buffer import BatchPreprocessor
+from run_onnx_inference_draw import postprocess_batch
+from test_parallel_inference import write_detector, write_raster
+from test_tiled_inference import FakeSession
+from tiled_inference import generate_windows, iter_tiled_detections
+
+
+class RecordingSession(FakeSession):
+    """FakeSession that also keeps the batches it was run on."""
+
+    def __init__(self, tile_size=640):
+        super().__init__(tile_size)
+        self.batches = []
+
+    def run(self, output_names, feed):
+        self.batches.append(next(iter(feed.values())).copy())
+        return super().run(output_names, feed)
+
+
+@pytest.fixture
+def raster(tmp_path):
+    path = str(tmp_path / "scene.tif")
+    write_raster(path, 150, 100, 3)
+    return path
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_members_with_the_same_shape_share_one_batch(raster):
+    """Test that every tile is preprocessed once and the same batch goes to members of equal input shape"""
+    sessions = [RecordingSession(64), RecordingSession(64), RecordingSession(32)]
+    with Ensemble([EnsembleMember(f"m{i}", sess) for i, sess in enumerate(sessions)]) as ensemble:
+        assert ensemble.input_shapes == [(32, 32), (64, 64)]
+        with rasterio.open(raster) as src:
+            tiles = list(iter_ensemble_tiles(ensemble, src, tile_size=64, overlap=16, batch_size=4))
+            expected = BatchPreprocessor(1, (64, 64))
+            for index, window in enumerate(generate_windows(src.width, src.height, 64, 16)):
+                expected.read_window(0, src, window)
+                batch = sessions[0].batches[index // 4][index % 4]
+                assert np.array_equal(batch, expected.batch[0])
+    assert len(tiles) == len(sessions[0].batches[0]) + sum(len(b) for b in sessions[0].batches[1:])
+    for first, second, small in zip(*(sess.batches for sess in sessions)):
+        assert first is not second
+        assert np.array_equal(first, second)
+        assert small.shape[2:] == (32, 32)
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_single_member_matches_tiled_inference(tmp_path, raster):
+    """Test that a one-model ensemble returns the detections of plain tiled inference"""
+    model = str(tmp_path / "detector.onnx")
+    write_detector(model)
+    from session_pool import get_session
+
+    sess = get_session(model)
+    with Ensemble([EnsembleMember("detector", sess)]) as ensemble, rasterio.open(raster) as src:
+        fused = list(iter_ensemble_tiles(ensemble, src, tile_size=64, overlap=16, conf_threshold=0.3, batch_size=3))
+        plain = list(iter_tiled_detections(sess, src, tile_size=64, overlap=16, conf_threshold=0.3, batch_size=3))
+    assert len(fused) == len(plain)
+    for (window, boxes, scores, class_ids), (_, plain_boxes, plain_scores, plain_class_ids) in zip(fused, plain):
+        expected = merge_detections(plain_boxes, plain_scores, plain_class_ids, iou_threshold=0.55, method="wbf")
+        assert np.allclose(boxes, expected[0], atol=1e-3)
+        assert np.allclose(scores, expected[1])
+        assert np.array_equal(class_ids, expected[2])
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_fusion_weights(raster):
+    """Test that agreeing members fuse into one box at the tile center, keeping their common score"""
+    members = [EnsembleMember("a", FakeSession(64), weight=1.0), EnsembleMember("b", FakeSession(64), weight=0.5)]
+    with Ensemble(members) as ensemble, rasterio.open(raster) as src:
+        tiles = list(iter_ensemble_tiles(ensemble, src, tile_size=64, overlap=16))
+        boxes, scores, _ = run_ensemble_tiled(ensemble, src, tile_size=64, overlap=16)
+    assert len(boxes) == len(tiles)
+    for window, tile_boxes, tile_scores, class_ids in tiles:
+        assert len(tile_boxes) == 1
+        assert np.allclose(tile_boxes[0], [window.col_off + 22, window.row_off + 27,
+                                           window.col_off + 42, window.row_off + 37])
+        assert np.isclose(tile_scores[0], 0.9)
+        assert class_ids[0] == 0
+    assert np.allclose(scores, np.concatenate([tile[2] for tile in tiles]))
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_other_input_shape_is_rescaled_to_tile_pixels(raster):
+    """Test that detections of a member with a smaller input are mapped back to tile pixels"""
+    with Ensemble([EnsembleMember("small", FakeSession(32))]) as ensemble, rasterio.open(raster) as src:
+        tiles = list(iter_ensemble_tiles(ensemble, src, tile_size=64, overlap=16))
+    for window, boxes, _, _ in tiles:
+        # The 20 x 10 box at the center of the 32 pixel input covers 40 x 20 tile pixels
+        assert np.allclose(boxes[0], [window.col_off + 12, window.row_off + 22,
+                                      window.col_off + 52, window.row_off + 42])
+
+
+def test_weighted_box_fusion_scores():
+    """Test that fused scores are weight-averaged, scaled by model agreement and stay within [0, 1]"""
+    first = (np.array([[0, 0, 10, 10], [100, 100, 110, 110]], dtype=np.float32), np.array([0.9, 0.3], np.float32),
+             np.array([1, 1]))
+    second = (np.array([[1, 0, 11, 10]], dtype=np.float32), np.array([0.6], np.float32), np.array([1]))
+    boxes, scores, class_ids = weighted_box_fusion([first, second], [2, 1])
+    # Coordinates are averaged with score x weight: 1.8 for the first model's box, 0.6 for the second's
+    np.testing.assert_allclose(boxes, [[0.25, 0, 10.25, 10], [100, 100, 110, 110]], atol=1e-5)
+    # (2 x 0.9 + 1 x 0.6) / 3 with both models agreeing; the lone box of one model of two is halved
+    np.testing.assert_allclose(scores, [0.8, 0.15], atol=1e-6)
+    assert class_ids.tolist() == [1, 1]
+
+    certain = (first[0][:1], np.ones(1, np.float32), first[2][:1])
+    _, scores, _ = weighted_box_fusion([certain, (second[0], np.ones(1, np.float32), second[2])], [2, 1])
+    np.testing.assert_allclose(scores, [1.0])
+    with pytest.raises(ValueError):
+        Ensemble([EnsembleMember("a", FakeSession(64), weight=0)])
+
+
+def test_weighted_box_fusion_keeps_classes_apart():
+    """Test that overlapping boxes of different classes are only fused when asked to be class-agnostic"""
+    first = (np.array([[0, 0, 10, 10]], dtype=np.float32), np.array([0.9], np.float32), np.array([1]))
+    second = (np.array([[1, 0, 11, 10]], dtype=np.float32), np.array([0.6], np.float32), np.array([2]))
+    boxes, scores, class_ids = weighted_box_fusion([first, second], [1, 1])
+    np.testing.assert_allclose(boxes, [[0, 0, 10, 10], [1, 0, 11, 10]])
+    # Each class was found by one model of two
+    np.testing.assert_allclose(scores, [0.45, 0.3], atol=1e-6)
+    assert class_ids.tolist() == [1, 2]
+
+    boxes, scores, class_ids = weighted_box_fusion([first, second], [1, 1], class_aware=False)
+    assert len(boxes) == 1 and class_ids.tolist() == [1]
+    np.testing.assert_allclose(scores, [0.75], atol=1e-6)
+
+
+def test_detect_image_and_report():
+    """Test that the image path letterboxes once per shape and that the report covers every member"""
+    sessions = [RecordingSession(64), RecordingSession(64), RecordingSession(32)]
+    image = np.random.default_rng(0).integers(0, 255, (48, 80, 3), dtype=np.uint8)
+    with Ensemble([EnsembleMember(f"m{i}", sess) for i, sess in enumerate(sessions)]) as ensemble:
+        boxes, scores, class_ids = detect_image(ensemble, image)
+        report = ensemble.report(1, 0.5)
+    assert sessions[0].batches[0] is not sessions[1].batches[0]
+    assert np.array_equal(sessions[0].batches[0], sessions[1].batches[0])
+    # The two 64 pixel members fuse; the fixed-size box of the 32 pixel member is twice as large and stays apart
+    assert len(boxes) == 2
+    # Both are centered in the image, up to the rounding of the small letterbox
+    assert np.allclose((boxes[:, :2] + boxes[:, 2:]) / 2, [40, 24], atol=1.5)
+    # Two of the three models agree on the first box, one on the second
+    assert np.allclose(scores, [0.9 * 2 / 3, 0.9 / 3])
+    for member in ensemble.members:
+        assert member.latency.count == 1
+        assert member.name in report
+    assert "2.0 items/s" in report
+
+
+def test_from_files_shares_cores(tmp_path):
+    """Test that models are loaded with their share of the cores and duplicate names are made unique"""
+    model = str(tmp_path / "detector.onnx")
+    write_detector(model)
+    with Ensemble.from_files([model, model], weights=[2, 1], intra_op_threads=1) as ensemble:
+        assert [member.name for member in ensemble.members] == ["detector", "detector_1"]
+        assert [member.weight for member in ensemble.members] == [2, 1]
+        outputs = ensemble.run({(64, 64): np.zeros((2, 3, 64, 64), dtype=np.float32)}, conf_threshold=0.0)
+    assert len(outputs) == 2 and all(len(per_item) == 2 for per_item in outputs)
+    expected = postprocess_batch(ensemble.members[0].sess.run(None, {"images": np.zeros((2, 3, 64, 64), np.float32)}),
+                                 0.0)
+    assert np.allclose(outputs[0][0][1], expected[0][1])
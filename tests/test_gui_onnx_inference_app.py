@@ -0,0 +1,90 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("onnx")
+pytest.importorskip("PIL")
+ort = pytest.importorskip("onnxruntime")
+
+from onnxruntime.capi.onnxruntime_pybind11_state import Fail
+
+import gui_onnx_inference_app
+from gui_onnx_inference_app import ONNXInferenceApp, ResultCache, run_inference
+from test_parallel_inference import write_detector
+
+
+def test_result_cache_is_lru():
+    """Test that the cache evicts the least recently used result"""
+    cache = ResultCache(max_entries=2)
+    keys = [ResultCache.make_key(digest, "model.onnx", 0.25, 0.45) for digest in "abc"]
+    cache.put(keys[0], "a")
+    cache.put(keys[1], "b")
+    assert cache.get(keys[0]) == "a"
+    cache.put(keys[2], "c")
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "a" and cache.get(keys[2]) == "c"
+    assert ResultCache.make_key("a", "model.onnx", 0.3, 0.45) != keys[0]
+
+
+def test_background_inference_reports_and_cancels(tmp_path):
+    """Test that run_inference reports its stages, returns original-image boxes and can be cancelled"""
+    model = str(tmp_path / "detector.onnx")
+    write_detector(model)
+    image = np.random.default_rng(0).integers(0, 255, (48, 96, 3), dtype=np.uint8)
+
+    stages = []
+    boxes, scores, class_ids = run_inference(model, image, report=stages.append)
+    assert stages == ["Loading model", "Preprocessing", "Running model", "Postprocessing"]
+    assert len(boxes) > 0
+    assert boxes[:, [0, 2]].max() <= 96 and boxes[:, [1, 3]].max() <= 48
+
+    run_options = ort.RunOptions()
+    run_options.terminate = True
+    with pytest.raises(Fail, match="terminate flag"):
+        run_inference(model, image, run_options=run_options)
+
+
+def test_cancel_after_inference_keeps_the_result(monkeypatch):
+    """Test that a cancel arriving once the model has finished does not throw the result away"""
+    import queue
+    import threading
+    from types import SimpleNamespace
+
+    app = SimpleNamespace(messages=queue.Queue(), cancel_event=threading.Event(), model_file="model.onnx",
+                          run_options=None, session_options={})
+
+    def finish_then_cancel(*args):
+        app.cancel_event.set()
+        return "detections"
+    monkeypatch.setattr(gui_onnx_inference_app, "run_inference", finish_then_cancel)
+    ONNXInferenceApp._inference_job(app, "key", None, 0.25, 0.45)
+    assert app.messages.get_nowait() == ("done", "key", "detections")
+    assert app.messages.empty()
+
+
+def test_dynamic_axes_model_uses_the_default_input_size(tmp_path):
+    """Test that a model with symbolic height and width runs at the default input size"""
+    import onnx
+    from onnx import TensorProto, helper
+
+    model = str(tmp_path / "dynamic.onnx")
+    # Global average pooling into an (N, 84, 1) output with one anchor, for any input size
+    graph = helper.make_graph(
+        [helper.make_node("Conv", ["images", "w"], ["features"], kernel_shape=[1, 1]),
+         helper.make_node("ReduceMean", ["features"], ["pooled"], axes=[3], keepdims=0)],
+        "dynamic",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, "height", "width"])],
+        [helper.make_tensor_value_info("pooled", TensorProto.FLOAT, ["batch", 84, "anchors"])],
+        initializer=[helper.make_tensor("w", TensorProto.FLOAT, [84, 3, 1, 1], [0.01] * 252)],
+    )
+    onnx_model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    onnx_model.ir_version = 8
+    onnx.save(onnx_model, model)
+    image = np.zeros((48, 96, 3), dtype=np.uint8)
+    boxes, _, _ = run_inference(model, image)
+    assert boxes.shape == (0, 4)
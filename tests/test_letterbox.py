@@ -0,0 +1,43 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+
+from preprocess_buffer import BatchPreprocessor
+from run_onnx_inference_draw import letterbox_image, preprocess_image_letterbox, scale_boxes_to_original
+
+
+def test_letterbox_keeps_aspect_ratio():
+    """Test that a wide image is scaled to fit and padded at the top and bottom"""
+    image = np.full((300, 900, 3), 255, dtype=np.uint8)
+    padded, scale, pad = letterbox_image(image, (640, 640))
+    assert padded.shape == (640, 640, 3)
+    assert scale == (640 / 900, 213 / 300)
+    assert pad == (0, 213)
+    assert np.all(padded[:213] == 114) and np.all(padded[213:426] == 255) and np.all(padded[426:] == 114)
+
+
+def test_boxes_back_project_exactly():
+    """Test that boxes in model input space map back to original-image pixels"""
+    image = np.zeros((427, 1000, 3), dtype=np.uint8)
+    _, scale, pad = preprocess_image_letterbox(image)
+    original = np.array([[100, 50, 300, 400], [0, 0, 1000, 427]], dtype=np.float32)
+    model_space = original * np.array([scale[0], scale[1]] * 2, dtype=np.float32)
+    model_space += np.array([pad[0], pad[1]] * 2, dtype=np.float32)
+    np.testing.assert_allclose(scale_boxes_to_original(model_space, scale, pad, image.shape), original, atol=1e-3)
+
+
+def test_fused_letterbox_matches_original():
+    """Test that the fused buffer letterbox writes the same tensor as preprocess_image_letterbox"""
+    image = np.random.default_rng(0).integers(0, 255, (360, 500, 3), dtype=np.uint8)
+    expected, expected_scale, expected_pad = preprocess_image_letterbox(image)
+    preprocessor = BatchPreprocessor(1)
+    scale, pad = preprocessor.set_image_letterbox(0, image)
+    assert (scale, pad) == (expected_scale, expected_pad)
+    np.testing.assert_allclose(preprocessor.batch, expected, atol=1e-6)
@@ -0,0 +1,95 @@
+import pytest
+import sys
+import os
+import json
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+from merge_detections import candidate_pairs, merge_detections, pixel_to_map, write_geojson
+from run_onnx_inference_draw import class_aware_non_max_suppression, non_max_suppression
+
+
+def random_boxes(rng, n, extent=5000):
+    xy = rng.uniform(0, extent, size=(n, 2))
+    wh = rng.uniform(5, 60, size=(n, 2))
+    return np.concatenate([xy, xy + wh], axis=1).astype(np.float32)
+
+
+def test_bucketed_merge_matches_global_nms():
+    """Test that the bucketed merge keeps exactly the boxes of a full greedy NMS"""
+    rng = np.random.default_rng(0)
+    boxes = random_boxes(rng, 3000)
+    # Duplicate a third of the boxes with a small shift, as on tile seams
+    dup = boxes[:1000] + rng.uniform(-3, 3, size=(1000, 1)).astype(np.float32)
+    boxes = np.concatenate([boxes, dup])
+    scores = rng.uniform(0.25, 1, size=len(boxes)).astype(np.float32)
+    class_ids = rng.integers(0, 3, size=len(boxes))
+
+    merged, _, _ = merge_detections(boxes, scores, class_ids, 0.45, class_aware=False)
+    np.testing.assert_array_equal(merged, boxes[non_max_suppression(boxes, scores, 0.45)])
+
+    merged, _, _ = merge_detections(boxes, scores, class_ids, 0.45, class_aware=True)
+    np.testing.assert_array_equal(merged, boxes[class_aware_non_max_suppression(boxes, scores, class_ids, 0.45)])
+
+
+def test_large_boxes_keep_the_grid_fine():
+    """Test that a few scene-sized boxes neither lose overlapping pairs nor make the pairing quadratic"""
+    rng = np.random.default_rng(1)
+    boxes = np.concatenate([random_boxes(rng, 4000),
+                            np.array([[0, 0, 5000, 5000], [2400, 100, 2600, 4900], [10, 10, 900, 300]],
+                                     dtype=np.float32)])
+    i, j = candidate_pairs(boxes)
+    assert np.all(i < j)
+    x_overlap = (boxes[:, None, 0] <= boxes[None, :, 2]) & (boxes[None, :, 0] <= boxes[:, None, 2])
+    y_overlap = (boxes[:, None, 1] <= boxes[None, :, 3]) & (boxes[None, :, 1] <= boxes[:, None, 3])
+    overlapping = np.triu(x_overlap & y_overlap, 1)
+    candidates = np.zeros_like(overlapping)
+    candidates[i, j] = True
+    assert not np.any(overlapping & ~candidates)
+    # The whole-scene box pairs with every box, the rest stays close to the overlapping pairs
+    assert len(i) < 4 * overlapping.sum()
+
+
+def test_merge_is_class_agnostic_by_default():
+    """Test that a seam object labelled differently in two tiles is merged, as the per-tile NMS would"""
+    boxes = np.array([[100, 100, 120, 120], [101, 100, 121, 120]], dtype=np.float32)
+    scores = np.array([0.6, 0.5], dtype=np.float32)
+    merged, _, class_ids = merge_detections(boxes, scores, np.array([2, 7]))
+    assert len(merged) == 1 and class_ids[0] == 2
+    assert len(merge_detections(boxes, scores, np.array([2, 7]), class_aware=True)[0]) == 2
+
+
+def test_weighted_box_fusion():
+    """Test that seam duplicates are fused into one score-weighted box"""
+    boxes = np.array([[100, 100, 120, 120], [104, 100, 124, 120], [300, 300, 310, 310]], dtype=np.float32)
+    scores = np.array([0.6, 0.2, 0.9], dtype=np.float32)
+    fused, fused_scores, class_ids = merge_detections(boxes, scores, np.zeros(3, dtype=np.int64), 0.45, method="wbf")
+    assert len(fused) == 2
+    np.testing.assert_allclose(fused[0], [300, 300, 310, 310])
+    np.testing.assert_allclose(fused[1], [101, 100, 121, 120])
+    np.testing.assert_allclose(fused_scores, [0.9, 0.4])
+
+
+def test_georeferenced_geojson(tmp_path):
+    """Test that pixel boxes are written as polygons in map coordinates of the source CRS"""
+    transform = from_origin(35.0, 45.0, 0.5, 0.25)
+    boxes = np.array([[0, 0, 10, 20], [2, 4, 6, 8]], dtype=np.float32)
+    rings = pixel_to_map(boxes, transform)
+    np.testing.assert_allclose(rings[0], [[35, 45], [40, 45], [40, 40], [35, 40], [35, 45]])
+
+    path = str(tmp_path / "detections.geojson")
+    write_geojson(path, rings, np.array([0.9, 0.5]), np.array([2, 7]), CRS.from_epsg(4326))
+    with open(path) as f:
+        collection = json.load(f)
+    assert collection["crs"]["properties"]["name"].endswith("EPSG::4326")
+    assert [f["properties"]["class_id"] for f in collection["features"]] == [2, 7]
+    np.testing.assert_allclose(collection["features"][1]["geometry"]["coordinates"][0], rings[1])
@@ -0,0 +1,68 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from output_store import OutputStore
+from session_pool import SessionPool
+from test_parallel_inference import write_detector, write_raster
+from tiled_inference import run_tiled_inference
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+
+@pytest.fixture
+def scene(tmp_path):
+    model_file, raster = str(tmp_path / "detector.onnx"), str(tmp_path / "scene.tif")
+    write_detector(model_file)
+    write_raster(raster, 200, 150, seed=3)
+    return model_file, raster
+
+
+def test_stored_outputs_match_tiled_inference(scene, tmp_path):
+    """Test that re-thresholding stored outputs gives exactly the detections of a full run"""
+    model_file, raster = scene
+    sess = SessionPool(cache_dir=None).get(model_file)
+    store = OutputStore(str(tmp_path / "store"))
+    with rasterio.open(raster) as src:
+        entry = store.record(sess, src, "detector", tile_size=64, overlap=16, batch_size=4)
+        # No session is needed once the entry exists
+        assert store.get_or_record(None, src, "detector", tile_size=64, overlap=16).directory == entry.directory
+        for conf, iou in [(0.25, 0.45), (0.5, 0.3), (0.9, 0.7)]:
+            expected = run_tiled_inference(sess, src, 64, 16, conf, iou, batch_size=3)
+            for actual, wanted in zip(store.get(raster, "detector", 64, 16).detections(conf, iou), expected):
+                np.testing.assert_array_equal(actual, wanted)
+
+    reopened = store.get(raster, "detector", 64, 16)
+    assert isinstance(reopened.outputs[0], np.memmap)
+    assert len(reopened) == reopened.meta["tiles"] == len(reopened.outputs[0])
+    assert store.get(raster, "other-model", 64, 16) is None and store.get(raster, "detector", 64, 8) is None
+
+
+def test_invalidation(scene, tmp_path):
+    """Test that an interrupted recording is ignored and that a rewritten raster is a new entry"""
+    model_file, raster = scene
+    sess = SessionPool(cache_dir=None).get(model_file)
+    store = OutputStore(str(tmp_path / "store"))
+    with rasterio.open(raster) as src:
+        entry = store.get_or_record(sess, src, "detector", tile_size=64, overlap=16)
+    assert store.get(raster, "detector", 64, 16) is not None
+
+    # An interrupted recording without meta.json is ignored
+    os.remove(os.path.join(entry.directory, "meta.json"))
+    assert store.get(raster, "detector", 64, 16) is None
+
+    with rasterio.open(raster) as src:
+        store.record(sess, src, "detector", tile_size=64, overlap=16)
+    assert store.get(raster, "detector", 64, 16) is not None
+    write_raster(raster, 200, 150, seed=4)
+    os.utime(raster, ns=(0, 12345))
+    assert store.get(raster, "detector", 64, 16) is None
@@ -0,0 +1,73 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+onnx = pytest.importorskip("onnx")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from onnx import TensorProto, helper, numpy_helper
+
+from parallel_inference import pool_size, run_parallel_inference, threads_per_worker
+from session_pool import get_session
+from tiled_inference import run_tiled_inference
+
+
+def write_detector(path, tile_size=64):
+    """Write a strided-conv model with a YOLOv8-style (N, 84, anchors) output."""
+    rng = np.random.default_rng(0)
+    weight = numpy_helper.from_array(rng.normal(0, 0.3, (84, 3, 8, 8)).astype(np.float32), "w")
+    shape = numpy_helper.from_array(np.array([0, 84, -1], dtype=np.int64), "shape")
+    graph = helper.make_graph(
+        [helper.make_node("Conv", ["images", "w"], ["features"], strides=[8, 8]),
+         helper.make_node("Reshape", ["features", "shape"], ["output0"])],
+        "detector",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, tile_size, tile_size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 84, None])],
+        initializer=[weight, shape],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def write_raster(path, width, height, seed):
+    data = np.random.default_rng(seed).integers(0, 255, (3, height, width), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=3, dtype="uint8") as dst:
+        dst.write(data)
+
+
+def test_threads_per_worker():
+    """Test that workers share the cores without oversubscribing them"""
+    assert threads_per_worker(8, cpu_count=32) == 4
+    assert threads_per_worker(64, cpu_count=32) == 1
+    # Two tasks on an 8-worker request start two processes, which then get half the cores each
+    assert pool_size(8, 2) == 2 and threads_per_worker(pool_size(8, 2), cpu_count=32) == 16
+    assert pool_size(8, 0) == 1
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_parallel_matches_single_process(tmp_path):
+    """Test that the process pool returns the same detections as the single-process path"""
+    model = str(tmp_path / "detector.onnx")
+    write_detector(model)
+    rasters = [str(tmp_path / "a.tif"), str(tmp_path / "b.tif")]
+    write_raster(rasters[0], 300, 200, 1)
+    write_raster(rasters[1], 128, 128, 2)
+
+    results = run_parallel_inference(model, rasters, workers=2, tile_size=64, overlap=16, tiles_per_task=5)
+
+    sess = get_session(model)
+    for raster_path in rasters:
+        with rasterio.open(raster_path) as src:
+            expected = run_tiled_inference(sess, src, tile_size=64, overlap=16)
+        boxes, scores, class_ids = results[raster_path]
+        assert len(boxes) == len(expected[0]) > 0
+        order, expected_order = np.lexsort(boxes.T), np.lexsort(expected[0].T)
+        np.testing.assert_allclose(boxes[order], expected[0][expected_order], rtol=1e-5)
+        np.testing.assert_array_equal(class_ids[order], expected[2][expected_order])
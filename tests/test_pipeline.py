@@ -0,0 +1,73 @@
+import pytest
+import sys
+import os
+import threading
+import time
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from pipeline import Pipeline, run_pipelined_inference
+from test_tiled_inference import FakeSession
+from tiled_inference import run_tiled_inference
+
+
+def test_pipeline_order_and_backpressure():
+    """Test that items keep their order and the queues bound the items in flight"""
+    in_flight = []
+    lock = threading.Lock()
+    produced = [0]
+    consumed = [0]
+
+    def source():
+        for i in range(50):
+            with lock:
+                produced[0] += 1
+                in_flight.append(produced[0] - consumed[0])
+            yield i
+
+    def slow(item):
+        time.sleep(0.001)
+        return item * 2
+
+    pipeline = Pipeline([("double", slow), ("inc", lambda item: item + 1)], queue_depth=2)
+    results = []
+    for item in pipeline.run(source()):
+        with lock:
+            consumed[0] += 1
+        results.append(item)
+    assert results == [2 * i + 1 for i in range(50)]
+    # Three queues of depth 2, two stages holding one item each, plus the item being produced
+    assert max(in_flight) <= 3 * 2 + 2 + 1
+    assert [stats.items for stats in pipeline.stats] == [50, 50]
+
+
+def test_pipeline_propagates_errors():
+    """Test that an exception in a stage is raised in the consumer"""
+    def fail(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    with pytest.raises(ValueError, match="bad item"):
+        list(Pipeline([("fail", fail)]).run(range(10)))
+
+
+@pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+def test_pipelined_matches_sequential(tmp_path):
+    """Test that the pipelined tiled path returns the same detections as the sequential one"""
+    path = str(tmp_path / "scene.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=1900, height=1300, count=3, dtype="uint8") as dst:
+        dst.write(np.zeros((3, 1300, 1900), dtype=np.uint8))
+
+    with rasterio.open(path) as src:
+        expected = run_tiled_inference(FakeSession(), src, batch_size=2)
+        (boxes, scores, class_ids), pipeline = run_pipelined_inference(FakeSession(), src, batch_size=2)
+    np.testing.assert_allclose(boxes, expected[0])
+    np.testing.assert_array_equal(class_ids, expected[2])
+    assert "Bottleneck" in pipeline.report()
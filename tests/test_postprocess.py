@@ -0,0 +1,92 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+
+from run_onnx_inference_draw import (
+    class_aware_non_max_suppression,
+    compute_iou,
+    non_max_suppression,
+    postprocess,
+    postprocess_batch,
+)
+
+
+def reference_non_max_suppression(boxes, scores, iou_threshold):
+    """The original pairwise pure-Python NMS."""
+    indices = sorted(range(len(boxes)), key=lambda i: scores[i], reverse=True)
+    keep = []
+    while indices:
+        current = indices.pop(0)
+        keep.append(current)
+        indices = [i for i in indices if compute_iou(boxes[current], boxes[i]) < iou_threshold]
+    return keep
+
+
+def reference_postprocess(outputs, conf_threshold, iou_threshold):
+    """The original per-row loop, with the 4 box + 80 class layout."""
+    preds = np.squeeze(outputs[0], axis=0).transpose(1, 0)
+    boxes, scores, class_ids = [], [], []
+    for pred in preds:
+        cx, cy, w, h = pred[0:4]
+        class_scores = pred[4:]
+        cls_id = np.argmax(class_scores)
+        score = class_scores[cls_id]
+        if score >= conf_threshold:
+            boxes.append([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+            scores.append(score)
+            class_ids.append(cls_id)
+    boxes, scores, class_ids = np.array(boxes), np.array(scores), np.array(class_ids)
+    keep = reference_non_max_suppression(boxes, scores, iou_threshold)
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+def random_outputs(rng, batch=1):
+    raw = np.zeros((batch, 84, 8400), dtype=np.float32)
+    raw[:, 0:2] = rng.uniform(0, 640, size=(batch, 2, 8400))
+    raw[:, 2:4] = rng.uniform(5, 120, size=(batch, 2, 8400))
+    raw[:, 4:] = rng.uniform(0, 0.2, size=(batch, 80, 8400))
+    for b in range(batch):
+        anchors = rng.choice(8400, size=300, replace=False)
+        raw[b, 4 + rng.integers(0, 80, size=300), anchors] = rng.uniform(0.1, 1, size=300)
+    return [raw]
+
+
+def test_postprocess_matches_reference():
+    """Test that the vectorized decode and NMS keep exactly the boxes of the original loop"""
+    rng = np.random.default_rng(0)
+    outputs = random_outputs(rng)
+    boxes, scores, class_ids = postprocess(outputs, 0.25, 0.45)
+    ref_boxes, ref_scores, ref_class_ids = reference_postprocess(outputs, 0.25, 0.45)
+    assert len(boxes) > 10
+    np.testing.assert_allclose(boxes, ref_boxes, rtol=1e-5)
+    np.testing.assert_allclose(scores, ref_scores)
+    np.testing.assert_array_equal(class_ids, ref_class_ids)
+
+
+def test_empty_and_batched_postprocess():
+    """Test that empty outputs return empty arrays and batches are split per image"""
+    boxes, scores, class_ids = postprocess([np.zeros((1, 84, 8400), dtype=np.float32)])
+    assert boxes.shape == (0, 4) and len(scores) == 0 and len(class_ids) == 0
+
+    rng = np.random.default_rng(1)
+    outputs = random_outputs(rng, batch=3)
+    results = postprocess_batch(outputs, 0.25, 0.45)
+    assert len(results) == 3
+    for i, (boxes, _, _) in enumerate(results):
+        np.testing.assert_allclose(boxes, postprocess([outputs[0][i:i + 1]], 0.25, 0.45)[0])
+
+
+def test_class_aware_nms():
+    """Test that overlapping boxes of different classes are both kept"""
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [0, 0, 10, 10]], dtype=np.float32)
+    scores = np.array([0.9, 0.8, 0.7])
+    class_ids = np.array([0, 0, 1])
+    assert non_max_suppression(boxes, scores, 0.45).tolist() == [0]
+    assert class_aware_non_max_suppression(boxes, scores, class_ids, 0.45).tolist() == [0, 2]
@@ -0,0 +1,72 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("rasterio")
+
+from preprocess_buffer import BatchPreprocessor, IOBindingRunner
+from run_onnx_inference_draw import preprocess_image_cv
+from session_pool import SessionPool
+from test_parallel_inference import write_detector
+
+
+def test_fused_preprocessing_matches_original():
+    """Test that the fused preprocessor writes the same tensor as preprocess_image_cv"""
+    image = np.random.default_rng(0).integers(0, 255, (480, 720, 3), dtype=np.uint8)
+    preprocessor = BatchPreprocessor(2)
+    buffer = preprocessor.batch
+    preprocessor.set_image(1, image)
+    assert preprocessor.batch is buffer
+    np.testing.assert_allclose(preprocessor.batch[1:2], preprocess_image_cv(image), atol=1e-6)
+
+
+def test_chw_tiles_are_padded():
+    """Test that a small CHW tile is scaled into the slot and the stale rest is zeroed"""
+    preprocessor = BatchPreprocessor(1, (8, 8))
+    preprocessor.batch[:] = 1.0
+    preprocessor.set_chw(0, np.full((3, 5, 6), 255, dtype=np.uint8))
+    assert np.all(preprocessor.batch[0, :, :5, :6] == 1.0)
+    assert preprocessor.batch[0].sum() == 3 * 5 * 6
+
+
+def test_io_binding_matches_run(tmp_path):
+    """Test that IO binding into reused output buffers gives the same outputs as sess.run"""
+    model = str(tmp_path / "detector.onnx")
+    write_detector(model)
+    sess = SessionPool(None).get(model)
+    batch = np.random.default_rng(1).uniform(0, 1, (3, 3, 64, 64)).astype(np.float32)
+    runner = IOBindingRunner(sess, 4)
+    for n in (3, 1):
+        expected = sess.run(None, {"images": batch[:n]})
+        outputs = runner(batch[:n])
+        assert len(outputs) == len(expected)
+        np.testing.assert_allclose(outputs[0], expected[0], rtol=1e-5)
+
+
+def test_io_binding_into_preallocated_outputs(tmp_path):
+    """Test that a fully static output shape is bound into the preallocated buffers, full and partial batches"""
+    import onnx
+
+    model = str(tmp_path / "static.onnx")
+    write_detector(model)
+    # 8 x 8 anchors for the 64 pixel input and stride 8 of write_detector
+    onnx_model = onnx.load(model)
+    onnx_model.graph.output[0].type.tensor_type.shape.dim[2].dim_value = 64
+    onnx.save(onnx_model, model)
+    sess = SessionPool(None).get(model)
+    batch = np.random.default_rng(2).uniform(0, 1, (4, 3, 64, 64)).astype(np.float32)
+    runner = IOBindingRunner(sess, 4)
+    buffer = runner.outputs["output0"]
+    assert buffer.shape == (4, 84, 64)
+    for n in (4, 3, 1):
+        expected = sess.run(None, {"images": batch[:n]})
+        outputs = runner(batch[:n])
+        assert outputs[0].shape == (n, 84, 64) and np.shares_memory(outputs[0], buffer)
+        np.testing.assert_allclose(outputs[0], expected[0], rtol=1e-5, atol=1e-6)
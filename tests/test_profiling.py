@@ -0,0 +1,107 @@
+import pytest
+import json
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import profiling
+
+
+@pytest.fixture(autouse=True)
+def clean_profile():
+    profiling.reset()
+    yield
+    profiling.disable()
+    profiling.reset()
+
+
+@profiling.timed("work")
+def work(x):
+    return x * 2
+
+
+def test_disabled_records_nothing():
+    """Test that timers, decorators and counters are no-ops until enabled"""
+    with profiling.timer("read"):
+        pass
+    assert work(2) == 4
+    profiling.count("tiles", 3)
+    assert not profiling.histograms and not profiling.counters and not profiling.trace_events
+
+
+def test_enabled_records_stages_and_counters():
+    """Test that spans land in the histograms and the trace, and counters add up"""
+    profiling.enable()
+    for _ in range(3):
+        with profiling.timer("read"):
+            pass
+    assert work(3) == 6
+    profiling.count("tiles", 2)
+    profiling.count("tiles")
+
+    assert profiling.histograms["read"].count == 3 and profiling.histograms["work"].count == 1
+    assert profiling.counters == {"tiles": 3}
+    trace = json.loads(json.dumps(profiling.chrome_trace()))
+    assert [event["name"] for event in trace["traceEvents"]] == ["read"] * 3 + ["work"]
+    assert all(event["ph"] == "X" and event["dur"] >= 0 for event in trace["traceEvents"])
+
+
+def test_timed_records_failing_calls():
+    """Test that a call that raises is still timed"""
+    @profiling.timed("fail")
+    def fail():
+        raise ValueError
+
+    profiling.enable()
+    with pytest.raises(ValueError):
+        fail()
+    assert profiling.histograms["fail"].count == 1
+
+
+def test_histogram_buckets_and_quantile():
+    """Test that observations go to the first bucket bounding them"""
+    histogram = profiling.Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.quantile(0.5) == 0.1 and histogram.quantile(1.0) == 2.0
+
+
+def test_prometheus_text():
+    """Test that the snapshot has cumulative buckets, sum, count and counters"""
+    profiling.enable()
+    profiling.record("infer", 0, 2_000_000)
+    profiling.record("infer", 0, 20_000_000)
+    profiling.count("detections", 5)
+    lines = profiling.prometheus_text().splitlines()
+    assert '# TYPE pylab_stage_seconds histogram' in lines
+    assert 'pylab_stage_seconds_bucket{stage="infer",le="0.0025"} 1' in lines
+    assert 'pylab_stage_seconds_bucket{stage="infer",le="+Inf"} 2' in lines
+    assert 'pylab_stage_seconds_count{stage="infer"} 2' in lines
+    assert 'pylab_detections_total 5.0' in lines
+
+
+def test_session_profiling(tmp_path):
+    """Test that a profile_prefix session writes an onnxruntime profile"""
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    np = pytest.importorskip("numpy")
+    from onnx import TensorProto, helper
+    from session_pool import SessionPool
+
+    model_file = str(tmp_path / "identity.onnx")
+    graph = helper.make_graph([helper.make_node("Relu", ["x"], ["y"])], "relu",
+                              [helper.make_tensor_value_info("x", TensorProto.FLOAT, [1, 4])],
+                              [helper.make_tensor_value_info("y", TensorProto.FLOAT, [1, 4])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, model_file)
+
+    sess = SessionPool(cache_dir=None).get(model_file, profile_prefix=str(tmp_path / "run.ort"))
+    sess.run(None, {"x": np.ones((1, 4), dtype=np.float32)})
+    profile_file = sess.end_profiling()
+    assert os.path.basename(profile_file).startswith("run.ort")
+    with open(profile_file) as f:
+        assert any(event.get("name", "").startswith("model_run") for event in json.load(f))
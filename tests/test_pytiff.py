@@ -0,0 +1,121 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+
+from rasterio.transform import from_origin
+
+import pytiff
+from pytiff import (
+    BLOCK_OVERHEAD_BYTES,
+    convert_to_cog,
+    expected_read_amplification,
+    layout_report,
+    matched_block_size,
+    query_index,
+    scan_directory,
+    tile_grid,
+)
+
+
+@pytest.fixture
+def striped_raster(tmp_path):
+    path = str(tmp_path / "striped.tif")
+    data = np.random.default_rng(0).integers(0, 255, (3, 1500, 2000), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=2000, height=1500, count=3, dtype="uint8",
+                       crs="EPSG:32633", transform=from_origin(500000, 4000000, 1, 1)) as dst:
+        dst.write(data)
+    return path, data
+
+
+def test_layout_report_of_striped_raster(striped_raster):
+    """Test that a striped raster is reported as such, with expected and measured amplification agreeing"""
+    path, _ = striped_raster
+    report = layout_report(path, tile_size=640, overlap=64)
+    assert not report["tiled"] and not report["cog"] and report["overviews"] == []
+    assert report["block_height"] == 1 and report["compression"] == "NONE"
+    # Every row of a 640-wide window reads a whole 2000-pixel strip
+    assert report["expected_amplification"] == pytest.approx(2000 / 640, rel=0.01)
+    assert report["measured_amplification"] == pytest.approx(report["expected_amplification"], rel=0.05)
+
+
+def test_matched_block_size_beats_tile_sized_blocks():
+    """Test that the matched block size costs less than blocks as large as the tiles"""
+    layout = {"width": 5000, "height": 5000, "count": 3, "dtype": "uint8", "interleave": "PIXEL"}
+    windows = tile_grid(5000, 5000, 640, 64)
+    block_size = matched_block_size(layout, windows)
+    assert block_size % 16 == 0
+    cost = lambda size: expected_read_amplification(layout, windows, size, size, block_overhead=BLOCK_OVERHEAD_BYTES)
+    assert cost(block_size) <= cost(640) and cost(block_size) <= cost(64)
+
+
+def test_cog_conversion_cuts_read_amplification(striped_raster, tmp_path):
+    """Test that the COG rewrite is tiled, has overviews, keeps the pixels and reads fewer bytes"""
+    path, data = striped_raster
+    before = layout_report(path, tile_size=640, overlap=64)
+    cog_path = str(tmp_path / "cog.tif")
+    convert_to_cog(path, cog_path, before["matched_block_size"], compress="NONE")
+    after = layout_report(cog_path, tile_size=640, overlap=64)
+    assert after["cog"] and after["tiled"] and after["overviews"]
+    assert after["block_width"] == before["matched_block_size"]
+    assert after["measured_amplification"] < before["measured_amplification"]
+    with rasterio.open(cog_path) as src:
+        np.testing.assert_array_equal(src.read(), data)
+
+
+def test_scan_index_rescans_only_changed_files(striped_raster, tmp_path, monkeypatch):
+    """Test that a re-scan only reads changed files and drops deleted ones"""
+    path, _ = striped_raster
+    index_path = str(tmp_path / "scenes.sqlite")
+    scenes = tmp_path / "scenes"
+    (scenes / "sub").mkdir(parents=True)
+    for name in ("a.tif", "sub/b.tif"):
+        convert_to_cog(path, str(scenes / name), 256, compress="NONE")
+    (scenes / "broken.tif").write_bytes(b"not a tiff")
+
+    records, read = scan_directory(str(scenes), index_path, workers=2)
+    assert read == 3 and len(records) == 3
+    by_name = {os.path.basename(record["path"]): record for record in records}
+    assert "error" in by_name["broken.tif"]
+    assert by_name["a.tif"]["crs"] == "EPSG:32633" and by_name["a.tif"]["width"] == 2000
+    assert by_name["a.tif"]["pixel_size"] == [1.0, -1.0]
+
+    opened = []
+    monkeypatch.setattr(pytiff, "read_metadata", lambda p: opened.append(p) or {"path": p, "error": "stub"})
+    os.remove(scenes / "sub" / "b.tif")
+    (scenes / "broken.tif").write_bytes(b"still not a tiff")
+    records, read = scan_directory(str(scenes), index_path, workers=2)
+    assert opened == [str(scenes / "broken.tif")]
+    assert sorted(os.path.basename(record["path"]) for record in records) == ["a.tif", "broken.tif"]
+
+
+def test_query_index_by_bbox(striped_raster, tmp_path):
+    """Test that the bounding-box query returns only scenes covering the area"""
+    path, _ = striped_raster
+    index_path = str(tmp_path / "scenes.sqlite")
+    scan_directory(os.path.dirname(path), index_path)
+    west, south, east, north = query_index(index_path, (-180, -90, 180, 90))[0]["lonlat_bounds"]
+    assert len(query_index(index_path, ((west + east) / 2, (south + north) / 2, east + 1, north + 1))) == 1
+    assert query_index(index_path, (east + 0.1, south, east + 1, north)) == []
+
+
+def test_scan_skips_broken_links_and_query_needs_an_index(striped_raster, tmp_path, monkeypatch, capsys):
+    """Test that a dangling symlink does not abort a scan and that querying a missing index creates nothing"""
+    path, _ = striped_raster
+    scenes = tmp_path / "linked"
+    scenes.mkdir()
+    os.symlink(path, scenes / "a.tif")
+    os.symlink(str(tmp_path / "gone.tif"), scenes / "dangling.tif")
+    records, read = scan_directory(str(scenes), str(tmp_path / "scenes.sqlite"))
+    assert read == 1 and [os.path.basename(record["path"]) for record in records] == ["a.tif"]
+
+    missing = str(tmp_path / "missing.sqlite")
+    monkeypatch.setattr(sys, "argv", ["pytiff.py", "query", "--bbox", "0", "0", "1", "1", "--index", missing])
+    pytiff.main()
+    assert "not found" in capsys.readouterr().out
+    assert not os.path.exists(missing)
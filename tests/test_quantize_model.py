@@ -0,0 +1,119 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+onnx = pytest.importorskip("onnx")
+rasterio = pytest.importorskip("rasterio")
+ort = pytest.importorskip("onnxruntime")
+pytest.importorskip("onnxruntime.quantization")
+pytest.importorskip("cv2")
+
+from onnx import TensorProto, helper, numpy_helper
+
+from quantize_model import detection_agreement, evaluate, head_nodes, quantize, recommend, sample_tiles
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+
+def write_two_branch_detector(path, input_size=64, strides=(8, 16, 32)):
+    """Write a YOLOv8-like model: separate box and class convs per scale, then a float head."""
+    rng = np.random.default_rng(0)
+    nodes, initializers, box_heads, class_heads = [], [], [], []
+    for stride in strides:
+        std = 1 / stride / np.sqrt(3)
+        box_weight = rng.normal(0, std, (4, 3, stride, stride)) * \
+            np.array([input_size / 4, input_size / 4, input_size / 32, input_size / 32])[:, None, None, None]
+        arrays = {
+            f"wb{stride}": box_weight.astype(np.float32),
+            f"bb{stride}": np.array([input_size / 2, input_size / 2, input_size / 8, input_size / 8], np.float32),
+            f"wc{stride}": rng.normal(0, std, (80, 3, stride, stride)).astype(np.float32),
+            f"bc{stride}": np.full(80, -3.0, np.float32),
+        }
+        initializers += [numpy_helper.from_array(array, name) for name, array in arrays.items()]
+        nodes += [helper.make_node("Conv", ["images", f"wb{stride}", f"bb{stride}"], [f"box{stride}"],
+                                   strides=[stride, stride]),
+                  helper.make_node("Reshape", [f"box{stride}", "box_shape"], [f"boxes{stride}"]),
+                  helper.make_node("Conv", ["images", f"wc{stride}", f"bc{stride}"], [f"cls{stride}"],
+                                   strides=[stride, stride]),
+                  helper.make_node("Reshape", [f"cls{stride}", "class_shape"], [f"logits{stride}"])]
+        box_heads.append(f"boxes{stride}")
+        class_heads.append(f"logits{stride}")
+    initializers += [numpy_helper.from_array(np.array([0, 4, -1], np.int64), "box_shape"),
+                     numpy_helper.from_array(np.array([0, 80, -1], np.int64), "class_shape")]
+    nodes += [helper.make_node("Concat", box_heads, ["xywh"], axis=2),
+              helper.make_node("Concat", class_heads, ["logits"], axis=2),
+              helper.make_node("Sigmoid", ["logits"], ["classes"]),
+              helper.make_node("Concat", ["xywh", "classes"], ["output0"], axis=1)]
+    anchors = sum((input_size // stride) ** 2 for stride in strides)
+    graph = helper.make_graph(
+        nodes, "detector",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, input_size, input_size])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, ["batch", 84, anchors])],
+        initializer=initializers,
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def detections(boxes, scores, class_ids):
+    return (np.array(boxes, dtype=np.float32).reshape(-1, 4), np.array(scores, dtype=np.float32),
+            np.array(class_ids, dtype=np.int64))
+
+
+def test_detection_agreement():
+    """Test that identical detections agree fully and a missed or shifted box lowers the scores"""
+    reference = [detections([[0, 0, 10, 10], [20, 20, 30, 30]], [0.9, 0.8], [1, 2])]
+    assert detection_agreement(reference, reference) == {"map": 1.0, "mean_iou": 1.0, "recall": 1.0}
+
+    missed = [detections([[0, 0, 10, 10]], [0.9], [1])]
+    assert detection_agreement(reference, missed)["recall"] == 0.5
+    assert detection_agreement(reference, missed)["map"] == 0.5
+
+    shifted = [detections([[1, 0, 11, 10], [20, 20, 30, 30]], [0.9, 0.8], [1, 2])]
+    agreement = detection_agreement(reference, shifted)
+    assert agreement["map"] == 1.0 and 0.8 < agreement["mean_iou"] < 1.0
+
+    wrong_class = [detections([[0, 0, 10, 10], [20, 20, 30, 30]], [0.9, 0.8], [1, 3])]
+    assert detection_agreement(reference, wrong_class)["recall"] == 0.5
+
+
+def test_head_nodes_are_after_the_convolutions(tmp_path):
+    """Test that only the decode/concat head is excluded from quantization"""
+    path = str(tmp_path / "detector.onnx")
+    write_two_branch_detector(path)
+    model = onnx.load(path)
+    excluded = {node.name for node in model.graph.node if node.name in head_nodes(model)}
+    ops = {node.op_type for node in model.graph.node if node.name in excluded}
+    assert ops == {"Reshape", "Concat", "Sigmoid"}
+    assert all(node.name not in excluded for node in model.graph.node if node.op_type == "Conv")
+
+
+def test_quantized_variants_run_and_are_reported(tmp_path):
+    """Test that every variant is written, runs, and gets a report row against FP32"""
+    model_file = str(tmp_path / "detector.onnx")
+    write_two_branch_detector(model_file)
+    raster = str(tmp_path / "scene.tif")
+    data = np.random.default_rng(0).integers(0, 255, (3, 256, 256), dtype=np.uint8)
+    with rasterio.open(raster, "w", driver="GTiff", width=256, height=256, count=3, dtype="uint8") as dst:
+        dst.write(data)
+
+    tiles = sample_tiles([raster], 16, (64, 64))
+    assert len(tiles) == 16 and tiles[0].shape == (1, 3, 64, 64)
+    variant_files = {variant: quantize(model_file, variant, tiles[0::2])
+                     for variant in ("int8-dynamic", "int8-static", "fp16")}
+    assert not os.path.exists(str(tmp_path / "detector.prepared.onnx"))
+
+    rows = evaluate(model_file, variant_files, tiles[1::2])
+    assert [row["variant"] for row in rows] == ["fp32", "int8-dynamic", "int8-static", "fp16"]
+    assert rows[0]["speedup"] == 1.0
+    by_variant = {row["variant"]: row for row in rows}
+    assert by_variant["int8-static"]["size_mb"] < by_variant["fp32"]["size_mb"]
+    # FP16 only rounds the weights, so it must agree closely with FP32
+    assert by_variant["fp16"]["map"] > 0.9
+    assert recommend(rows, min_map=0.0)["latency_ms"] == min(row["latency_ms"] for row in rows)
+    assert recommend(rows, min_map=1.0)["map"] == 1.0
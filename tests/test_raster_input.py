@@ -0,0 +1,151 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+import raster_input
+from raster_input import RasterTileReader, band_stretch
+from session_pool import SessionPool
+from test_parallel_inference import write_detector, write_raster
+from test_tiled_inference import FakeSession
+from tiled_inference import generate_windows, run_tiled_inference
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+NODATA = 0
+
+
+@pytest.fixture
+def scene16(tmp_path):
+    """A 4-band 12-bit-in-16-bit raster whose left 300 columns are nodata."""
+    path = str(tmp_path / "scene16.tif")
+    rng = np.random.default_rng(0)
+    data = rng.integers(100, 4000, (4, 400, 900), dtype=np.uint16)
+    data[:, :, :300] = NODATA
+    with rasterio.open(path, "w", driver="GTiff", width=900, height=400, count=4, dtype="uint16",
+                       nodata=NODATA) as dst:
+        dst.write(data)
+    return path, data
+
+
+def test_percentile_stretch_and_cache(scene16, tmp_path, monkeypatch):
+    """Test that the stretch comes from the valid pixels, and the second time from the cache"""
+    path, data = scene16
+    cache_file = str(tmp_path / "stretch.json")
+    with rasterio.open(path) as src:
+        stretch = band_stretch(src, (4, 3, 2), (2, 98), cache_file)
+        valid = data[3][:, 300:]
+        assert abs(stretch[0, 0] - np.percentile(valid, 2)) < 100
+        assert abs(stretch[0, 1] - np.percentile(valid, 98)) < 100
+
+        def fail(*args):
+            raise AssertionError("percentiles were recomputed")
+        monkeypatch.setattr(raster_input, "sampled_percentiles", fail)
+        np.testing.assert_array_equal(band_stretch(src, (4, 3, 2), (2, 98), cache_file), stretch)
+        assert band_stretch(src, (1, 2, 3), None, cache_file).tolist() == [[0, 65535]] * 3
+
+
+def test_stretch_from_aux_xml(tmp_path):
+    """Test that GDAL's .aux.xml histograms and statistics are used without reading pixels"""
+    path = str(tmp_path / "scene.tif")
+    write_raster(path, 64, 64, seed=0)
+    counts = "|".join(["0"] * 10 + ["1"] * 100 + ["0"] * 146)
+    band = ('<PAMRasterBand band="{}"><Metadata><MDI key="STATISTICS_MINIMUM">5</MDI>'
+            '<MDI key="STATISTICS_MAXIMUM">250</MDI></Metadata><Histograms><HistItem><HistMin>-0.5</HistMin>'
+            '<HistMax>255.5</HistMax><BucketCount>256</BucketCount><HistCounts>{}</HistCounts></HistItem>'
+            '</Histograms></PAMRasterBand>')
+    with open(path + ".aux.xml", "w") as f:
+        f.write("<PAMDataset>" + "".join(band.format(b, counts) for b in (1, 2, 3)) + "</PAMDataset>")
+    with rasterio.open(path) as src:
+        stretch = band_stretch(src, (1, 2, 3), (0, 100), cache_file=None)
+    np.testing.assert_allclose(stretch, [[10, 109]] * 3)
+
+
+def test_reader_normalizes_and_masks(scene16):
+    """Test the stretch formula, nodata zeroing and the padding of edge tiles"""
+    path, data = scene16
+    with rasterio.open(path) as src:
+        reader = RasterTileReader(src, bands=(4, 3, 2), tile_size=256, cache_file=None)
+        window = rasterio.windows.Window(200, 300, 256, 100)
+        tile = reader.read_tile(window)
+        assert reader.read_tile(rasterio.windows.Window(0, 0, 256, 256)) is None
+    assert tile.shape == (1, 3, 256, 256) and tile.dtype == np.float32
+    low, high = reader.stretch[0]
+    raw = data[3, 300:400, 300:456].astype(np.float64)
+    np.testing.assert_allclose(tile[0, 0, :100, 100:], np.clip((raw - low) / (high - low), 0, 1), atol=1e-5)
+    assert not tile[0, :, :100, :100].any() and not tile[0, :, 100:].any()
+
+
+def test_nodata_tiles_are_skipped(scene16):
+    """Test that tiles without valid pixels never reach the session"""
+    path, _ = scene16
+    sess = FakeSession(tile_size=256)
+    with rasterio.open(path) as src:
+        reader = RasterTileReader(src, cache_file=None, tile_size=256)
+        windows = list(generate_windows(src.width, src.height, 256, 32))
+        boxes, _, _ = run_tiled_inference(sess, src, 256, 32, batch_size=1, reader=reader)
+    skipped = sum(1 for w in windows if w.col_off + w.width <= 300)
+    assert skipped > 0 and sess.calls == len(windows) - skipped == len(boxes)
+
+
+def test_8bit_reader_matches_8bit_path(tmp_path):
+    """Test that the reader's default for 8-bit RGB gives exactly the detections of the uint8 path"""
+    model_file, raster = str(tmp_path / "detector.onnx"), str(tmp_path / "scene.tif")
+    write_detector(model_file)
+    write_raster(raster, 150, 100, seed=1)
+    sess = SessionPool(cache_dir=None).get(model_file)
+    with rasterio.open(raster) as src:
+        expected = run_tiled_inference(sess, src, 64, 16, batch_size=2)
+        actual = run_tiled_inference(sess, src, 64, 16, batch_size=2,
+                                     reader=RasterTileReader(src, tile_size=64, cache_file=None))
+    for a, e in zip(actual, expected):
+        np.testing.assert_array_equal(a, e)
+
+
+def test_entry_points_read_through_reader(tmp_path):
+    """Test that the pipelined, stored, multi-process and calibration paths all stretch 16-bit tiles"""
+    from output_store import OutputStore
+    from parallel_inference import run_parallel_inference
+    from pipeline import run_pipelined_inference
+    from quantize_model import sample_tiles
+
+    model_file, raster = str(tmp_path / "detector.onnx"), str(tmp_path / "scene16.tif")
+    write_detector(model_file)
+    data = np.random.default_rng(2).integers(100, 4000, (3, 150, 200), dtype=np.uint16)
+    data[:, :, :70] = NODATA
+    with rasterio.open(raster, "w", driver="GTiff", width=200, height=150, count=3, dtype="uint16",
+                       nodata=NODATA) as dst:
+        dst.write(data)
+
+    sess = SessionPool(cache_dir=None).get(model_file)
+    with rasterio.open(raster) as src:
+        reader = RasterTileReader(src, tile_size=64)
+        expected = run_tiled_inference(sess, src, 64, 16, batch_size=2, reader=reader)
+        pipelined, _ = run_pipelined_inference(sess, src, 64, 16, batch_size=2, reader=reader)
+        stored = OutputStore(str(tmp_path / "store")).record(sess, src, "detector", 64, 16, 2, reader)
+        # quantize_model samples the tiled_inference grid with the overlap scaled to the tile size
+        valid_windows = [w for w in generate_windows(200, 150, 64, 6) if w.col_off + w.width > 70]
+        first_tile = reader.read_tile(valid_windows[0])
+    assert len(expected[0]) > 0
+    for actual in (pipelined, stored.detections()):
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(a, e)
+
+    boxes, _, class_ids = run_parallel_inference(model_file, [raster], workers=2, tile_size=64, overlap=16,
+                                                 tiles_per_task=5)[raster]
+    order, expected_order = np.lexsort(boxes.T), np.lexsort(expected[0].T)
+    np.testing.assert_allclose(boxes[order], expected[0][expected_order], rtol=1e-5)
+    np.testing.assert_array_equal(class_ids[order], expected[2][expected_order])
+
+    # Calibration tiles are sampled from the valid windows only, stretched like the rest
+    tiles = sample_tiles([raster], 100, (64, 64))
+    assert len(tiles) == len(valid_windows)
+    np.testing.assert_array_equal(tiles[0], first_tile)
@@ -0,0 +1,66 @@
+import pytest
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("customtkinter")
+pytest.importorskip("PIL")
+
+from raster_viewer import RasterPyramid, TileCache, overview_factors
+
+pytestmark = pytest.mark.filterwarnings("ignore::rasterio.errors.NotGeoreferencedWarning")
+
+
+@pytest.fixture
+def raster(tmp_path):
+    path = str(tmp_path / "scene.tif")
+    data = np.random.default_rng(0).integers(0, 255, (3, 3000, 4000), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=4000, height=3000, count=3, dtype="uint8",
+                       tiled=True, blockxsize=256, blockysize=256) as dst:
+        dst.write(data)
+    return path, data
+
+
+def test_tile_cache_budget():
+    """Test that the cache evicts least recently used tiles beyond its byte budget"""
+    cache = TileCache(max_bytes=3 * 1000)
+    for key in range(3):
+        cache.put(key, np.zeros(1000, dtype=np.uint8))
+    cache.get(0)
+    cache.put(3, np.zeros(1000, dtype=np.uint8))
+    assert cache.get(1) is None
+    assert cache.get(0) is not None and len(cache) == 3 and cache.nbytes == 3000
+
+
+def test_overviews_are_built_and_selected(raster):
+    """Test that missing overviews are built and the level follows the zoom"""
+    path, _ = raster
+    assert overview_factors(4000, 3000) == [2, 4, 8, 16]
+    pyramid = RasterPyramid(path)
+    assert pyramid.factors == [1, 2, 4, 8, 16]
+    assert pyramid.level_for_zoom(1.0) == 1
+    assert pyramid.level_for_zoom(0.3) == 2
+    assert pyramid.level_for_zoom(0.01) == 16
+    pyramid.close()
+
+
+def test_render_reads_only_visible_tiles(raster):
+    """Test that a full-resolution view matches the raster and reads are cached"""
+    path, data = raster
+    pyramid = RasterPyramid(path)
+    view = pyramid.render((1000, 700), 1.0, (300, 200))
+    expected = data[:, 600:800, 850:1150].transpose(1, 2, 0)
+    np.testing.assert_array_equal(view, expected)
+    assert pyramid.reads == 4
+
+    pyramid.render((1010, 705), 1.0, (300, 200))
+    assert pyramid.reads == 4
+
+    # The whole scene at a small zoom comes from one coarse tile
+    overview = pyramid.render((2000, 1500), 0.06, (240, 180))
+    assert overview.shape == (180, 240, 3) and pyramid.reads == 5
+    pyramid.close()
@@ -0,0 +1,76 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+
+from rasterio.transform import from_origin
+
+from render_detections import LabelCache, render_block, render_raster, write_preview
+from spatial_index import DetectionIndex
+
+
+@pytest.fixture
+def scene(tmp_path):
+    path = str(tmp_path / "scene.tif")
+    data = np.random.default_rng(0).integers(0, 200, (3, 700, 900), dtype=np.uint8)
+    with rasterio.open(path, "w", driver="GTiff", width=900, height=700, count=3, dtype="uint8",
+                       crs="EPSG:32633", transform=from_origin(500000, 4000000, 0.5, 0.5)) as dst:
+        dst.write(data)
+    return path, data
+
+
+def random_detections(n, width=900, height=700):
+    rng = np.random.default_rng(1)
+    xy = rng.uniform(-20, [width, height], (n, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(4, 120, (n, 2))], axis=1).astype(np.float32)
+    return boxes, rng.random(n).astype(np.float32), rng.integers(0, 3, n)
+
+
+def test_label_stamp_matches_put_text():
+    """Test that a stamped pre-rendered label equals cv2.putText at the same origin, also when clipped"""
+    # Exact on black, where blending with the coverage reproduces cv2's own antialiasing
+    labels = LabelCache()
+    for x, y in [(20, 30), (-5, 8), (70, 95)]:
+        expected = np.zeros((100, 80, 3), dtype=np.uint8)
+        cv2.putText(expected, "0.87", (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+        stamped = np.zeros((100, 80, 3), dtype=np.uint8)
+        labels.stamp(stamped, "0.87", x, y, (0, 255, 0))
+        np.testing.assert_array_equal(stamped, expected)
+
+
+def test_blocks_match_whole_image_rendering(scene, tmp_path):
+    """Test that block-by-block rendering is identical to drawing on the whole image, seams included"""
+    path, data = scene
+    boxes, scores, class_ids = random_detections(300)
+    index = DetectionIndex.build(boxes, scores, class_ids)
+    expected = render_block(np.ascontiguousarray(data.transpose(1, 2, 0)), index.boxes, index.scores, 0, 0,
+                            LabelCache())
+
+    with rasterio.open(path) as src:
+        drawn = render_raster(src, str(tmp_path / "annotated.tif"), index, block_size=128)
+    assert drawn >= 300
+    with rasterio.open(str(tmp_path / "annotated.tif")) as out:
+        assert out.crs == src.crs and out.transform == src.transform
+        assert out.block_shapes[0] == (128, 128) and out.compression.value == "DEFLATE"
+        np.testing.assert_array_equal(out.read().transpose(1, 2, 0), expected)
+
+
+def test_overviews_and_preview(scene, tmp_path):
+    """Test that the output gets internal overviews and a downsampled preview"""
+    path, _ = scene
+    boxes, scores, class_ids = random_detections(20)
+    output = str(tmp_path / "annotated.tif")
+    with rasterio.open(path) as src:
+        render_raster(src, output, DetectionIndex.build(boxes, scores, class_ids), labels=False, overviews=True)
+    with rasterio.open(output) as out:
+        assert out.overviews(1)
+    width, height = write_preview(output, str(tmp_path / "preview.png"), max_size=300)
+    assert max(width, height) <= 300
+    assert cv2.imread(str(tmp_path / "preview.png")).shape == (height, width, 3)
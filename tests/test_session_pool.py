@@ -0,0 +1,56 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+onnx = pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+
+from onnx import TensorProto, helper
+
+from session_pool import SessionPool
+
+
+def write_model(path):
+    """Write a tiny (x + 1) * 2 model, which the graph optimizer can fold."""
+    one = helper.make_tensor("one", TensorProto.FLOAT, [1], [1.0])
+    two = helper.make_tensor("two", TensorProto.FLOAT, [1], [2.0])
+    graph = helper.make_graph(
+        [helper.make_node("Add", ["x", "one"], ["y"]), helper.make_node("Mul", ["y", "two"], ["z"])],
+        "tiny",
+        [helper.make_tensor_value_info("x", TensorProto.FLOAT, ["batch", 4])],
+        [helper.make_tensor_value_info("z", TensorProto.FLOAT, ["batch", 4])],
+        initializer=[one, two],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, path)
+
+
+def test_pool_reuses_sessions(tmp_path):
+    """Test that the same settings return the same session and different settings do not"""
+    model = str(tmp_path / "tiny.onnx")
+    write_model(model)
+    pool = SessionPool(str(tmp_path / "cache"))
+    sess = pool.get(model)
+    assert pool.get(model) is sess
+    assert pool.get(model, intra_op_threads=1) is not sess
+    x = np.zeros((2, 4), dtype=np.float32)
+    np.testing.assert_allclose(sess.run(None, {"x": x})[0], 2.0)
+
+
+def test_optimized_model_cache(tmp_path):
+    """Test that the optimized model is written once and loaded by a fresh pool"""
+    model = str(tmp_path / "tiny.onnx")
+    write_model(model)
+    cache_dir = str(tmp_path / "cache")
+    SessionPool(cache_dir).get(model)
+    cached = SessionPool(cache_dir).optimized_model_path(model, ["CPUExecutionProvider"], "all")
+    assert os.listdir(cache_dir) == [os.path.basename(cached)]
+
+    sess = SessionPool(cache_dir).get(model)
+    x = np.ones((1, 4), dtype=np.float32)
+    np.testing.assert_allclose(sess.run(None, {"x": x})[0], 4.0)
@@ -0,0 +1,108 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+
+from spatial_index import DetectionIndex, map_bounds
+
+# A 0.5 m north-up pixel grid and one shifted by 10 km
+TRANSFORMS = [(0.5, 0.0, 500000.0, 0.0, -0.5, 4000000.0), (0.5, 0.0, 510000.0, 0.0, -0.5, 4000000.0)]
+
+
+def random_detections(n, seed=0, extent=20000):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, extent, (n, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(5, 60, (n, 2))], axis=1).astype(np.float32)
+    return boxes, rng.random(n).astype(np.float32), rng.integers(0, 4, n), rng.integers(0, 2, n)
+
+
+@pytest.fixture(scope="module")
+def collection():
+    boxes, scores, class_ids, scene_ids = random_detections(20000)
+    return DetectionIndex.build(boxes, scores, class_ids, scene_ids, TRANSFORMS, ["a.tif", "b.tif"])
+
+
+def brute_force_window(index, window):
+    b = index.map_boxes
+    return np.flatnonzero((b[:, 0] <= window[2]) & (b[:, 2] >= window[0]) & (b[:, 1] <= window[3]) &
+                          (b[:, 3] >= window[1]))
+
+
+def test_window_matches_brute_force(collection):
+    """Test that window queries return exactly the intersecting detections"""
+    index = collection
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        x, y = rng.uniform(500000, 515000), rng.uniform(3990000, 4000000)
+        window = (x, y, x + rng.uniform(10, 2000), y + rng.uniform(10, 2000))
+        np.testing.assert_array_equal(np.sort(index.window(window)), brute_force_window(index, window))
+    assert len(index.window((0, 0, 1, 1))) == 0
+
+
+def test_pixel_window_and_filters(collection):
+    """Test that pixel queries only return the scene's detections overlapping the pixel window"""
+    index = collection
+    found = index.pixel_window(1, (1000, 1000, 3000, 2500), class_ids=[2])
+    boxes = index.boxes[found]
+    assert len(found) > 0
+    assert np.all(index.scene_ids[found] == 1) and np.all(index.class_ids[found] == 2)
+    assert np.all((boxes[:, 0] <= 3000) & (boxes[:, 2] >= 1000) & (boxes[:, 1] <= 2500) & (boxes[:, 3] >= 1000))
+    expected = np.flatnonzero((index.scene_ids == 1) & (index.class_ids == 2) &
+                              (index.boxes[:, 0] <= 3000) & (index.boxes[:, 2] >= 1000) &
+                              (index.boxes[:, 1] <= 2500) & (index.boxes[:, 3] >= 1000))
+    np.testing.assert_array_equal(np.sort(found), expected)
+
+
+def test_nearest_matches_brute_force(collection):
+    """Test that kNN returns the k closest boxes in order, with class and scene filters"""
+    index = collection
+    x, y = 505000.0, 3995000.0
+    b = index.map_boxes
+    dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0)
+    dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0)
+    all_distances = np.hypot(dx, dy)
+
+    indices, distances = index.nearest(x, y, k=10)
+    np.testing.assert_allclose(distances, np.sort(all_distances)[:10])
+    np.testing.assert_allclose(all_distances[indices], distances)
+
+    indices, distances = index.nearest(x, y, k=5, scene=0, class_ids=3)
+    selected = (index.scene_ids == 0) & (index.class_ids == 3)
+    np.testing.assert_allclose(distances, np.sort(all_distances[selected])[:5])
+    assert np.all(index.class_ids[indices] == 3)
+
+    pixel_indices, _ = index.pixel_nearest(0, (x - 500000) / 0.5, (4000000 - y) / 0.5, k=5, class_ids=3)
+    np.testing.assert_array_equal(pixel_indices, indices)
+
+
+def test_save_and_memory_mapped_load(collection, tmp_path):
+    """Test that a saved index loads memory mapped and answers queries identically"""
+    index = collection
+    index.save(str(tmp_path / "idx"))
+    loaded = DetectionIndex.load(str(tmp_path / "idx"))
+    assert isinstance(loaded.boxes, np.memmap) and isinstance(loaded.node_bounds, np.memmap)
+    assert loaded.scenes == ["a.tif", "b.tif"] and len(loaded) == len(index)
+    window = (502000, 3991000, 504000, 3993000)
+    np.testing.assert_array_equal(loaded.window(window), index.window(window))
+    np.testing.assert_array_equal(loaded.nearest(506000, 3996000, 3)[0], index.nearest(506000, 3996000, 3)[0])
+
+
+def test_map_bounds_of_rotated_transform():
+    """Test that map bounds cover all four transformed corners"""
+    bounds = map_bounds([[0, 0, 10, 20]], (0.0, 1.0, 100.0, -1.0, 0.0, 50.0))
+    np.testing.assert_allclose(bounds, [[100, 40, 120, 50]])
+
+
+def test_small_and_empty_collections():
+    """Test a single-leaf tree and an empty one"""
+    boxes = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], dtype=np.float32)
+    index = DetectionIndex.build(boxes, [0.9, 0.8], [0, 1])
+    np.testing.assert_array_equal(np.sort(index.window((5, 5, 25, 25))), [0, 1])
+    assert index.nearest(100, 100, k=5)[0].tolist() == [1, 0]
+
+    empty = DetectionIndex.build(np.empty((0, 4)), [], [])
+    assert len(empty.window((0, 0, 1, 1))) == 0 and len(empty.nearest(0, 0, 3)[0]) == 0
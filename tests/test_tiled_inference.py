@@ -0,0 +1,71 @@
+import pytest
+import sys
+import os
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+rasterio = pytest.importorskip("rasterio")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("cv2")
+
+from tiled_inference import generate_windows, run_tiled_inference, tile_offsets
+
+
+class FakeSession:
+    """Stands in for an InferenceSession and reports one box in the middle of every tile."""
+
+    def __init__(self, tile_size=640):
+        self.tile_size = tile_size
+        self.calls = 0
+
+    def get_inputs(self):
+        class Input:
+            name = "images"
+            shape = ["batch", 3, self.tile_size, self.tile_size]
+        return [Input()]
+
+    def run(self, output_names, feeds):
+        self.calls += 1
+        batch = feeds["images"].shape[0]
+        raw = np.zeros((batch, 84, 8400), dtype=np.float32)
+        raw[:, 0:4, 0] = [self.tile_size / 2, self.tile_size / 2, 20, 10]
+        raw[:, 4, 0] = 0.9
+        raw[:, 5, 0] = 0.9
+        return [raw]
+
+
+def test_windows_cover_raster():
+    """Test that the windows overlap and cover every pixel of the raster"""
+    assert tile_offsets(640) == [0]
+    assert tile_offsets(1280, 640, 64) == [0, 576, 640]
+    windows = list(generate_windows(1500, 700, 640, 64))
+    covered = np.zeros((700, 1500), dtype=bool)
+    for window in windows:
+        assert window.width <= 640 and window.height <= 640
+        covered[window.row_off:window.row_off + window.height, window.col_off:window.col_off + window.width] = True
+    assert covered.all()
+
+
+def test_detections_in_image_coordinates(tmp_path):
+    """Test that tile detections are shifted back to full-image pixel coordinates"""
+    path = str(tmp_path / "scene.tif")
+    with rasterio.open(path, "w", driver="GTiff", width=1200, height=640, count=3, dtype="uint8") as dst:
+        dst.write(np.zeros((3, 640, 1200), dtype=np.uint8))
+
+    sess = FakeSession()
+    with rasterio.open(path) as src:
+        boxes, scores, class_ids = run_tiled_inference(sess, src, tile_size=640, overlap=80)
+
+    assert sess.calls == 2
+    centers = np.sort((boxes[:, 0] + boxes[:, 2]) / 2)
+    np.testing.assert_allclose(centers, [320, 560 + 320])
+    np.testing.assert_allclose((boxes[:, 1] + boxes[:, 3]) / 2, [320, 320])
+    assert np.all(scores >= 0.25)
+
+    batched = FakeSession()
+    with rasterio.open(path) as src:
+        batched_boxes, _, _ = run_tiled_inference(batched, src, tile_size=640, overlap=80, batch_size=4)
+    assert batched.calls == 1
+    np.testing.assert_allclose(batched_boxes, boxes)
@@ -0,0 +1,124 @@
+import pytest
+import sys
+import os
+import json
+import time
+
+# Add the repository root to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("rasterio")
+
+from test_tiled_inference import FakeSession
+from video_inference import (
+    FrameGate,
+    ImageSequence,
+    StreamStats,
+    VideoFrames,
+    frame_record,
+    iter_frame_batches,
+    open_frames,
+    run_stream,
+)
+
+
+class SlowSession(FakeSession):
+    def run(self, output_names, feeds):
+        time.sleep(0.05)
+        return super().run(output_names, feeds)
+
+
+def write_frames(directory, count, still_after=None, size=(320, 240)):
+    """Write count noise frames; from still_after on every frame repeats the previous one."""
+    rng = np.random.default_rng(0)
+    os.makedirs(directory, exist_ok=True)
+    image = None
+    for i in range(count):
+        if image is None or still_after is None or i < still_after:
+            image = rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, f"frame_{i:04d}.png"), image)
+
+
+def test_gate_reuses_detections_of_unchanged_frames(tmp_path):
+    """Test that repeated frames skip the model and carry the last detections"""
+    write_frames(str(tmp_path / "frames"), 12, still_after=4)
+    sess, stats = FakeSession(), StreamStats()
+    results = list(run_stream(sess, open_frames(str(tmp_path / "frames")), batch_size=2, stats=stats))
+
+    assert [result[0] for result in results] == list(range(12))
+    assert [result[-1] for result in results] == [False] * 4 + [True] * 8
+    assert (stats.read, stats.inferred, stats.reused, stats.dropped) == (12, 4, 8, 0)
+    assert sess.calls == 2
+    # Boxes are mapped back from the letterboxed 640 x 640 input to the 320 x 240 frame
+    np.testing.assert_allclose(results[-1][2], [[155, 117.5, 165, 122.5]])
+    record = json.loads(json.dumps(frame_record(*[results[-1][0], 30.0] + list(results[-1][2:]))))
+    assert record["reused"] and record["detections"][0]["class_id"] == 0
+
+    calls = FakeSession()
+    assert len(list(run_stream(calls, open_frames(str(tmp_path / "frames")), batch_size=1, diff_threshold=0))) == 12
+    assert calls.calls == 12
+
+
+class StaticFrames:
+    """The same frame count times, like a camera pointed at a static scene."""
+
+    def __init__(self, count, image):
+        self.remaining = count
+        self.image = image
+
+    def grab(self):
+        self.remaining -= 1
+        return self.remaining >= 0
+
+    def retrieve(self):
+        return self.image
+
+
+def test_static_stream_batches_stay_bounded():
+    """Test that gated-out frames still flush batches, so a static stream is emitted frame by frame"""
+    frames = StaticFrames(200, np.zeros((240, 320, 3), dtype=np.uint8))
+    batches = list(iter_frame_batches(frames, batch_size=4, gate=FrameGate(2.0)))
+    assert max(len(batch) for batch in batches) == 4
+    assert sum(len(batch) for batch in batches) == 200
+    assert [infer for _, _, infer in batches[0]] == [True, False, False, False]
+    assert len(list(iter_frame_batches(StaticFrames(9, frames.image), 4, gate=FrameGate(2.0), max_frames=6))) == 2
+
+
+def test_frame_gate_threshold():
+    image = np.full((240, 320, 3), 100, dtype=np.uint8)
+    gate = FrameGate(threshold=2.0)
+    assert gate.changed(image)
+    assert not gate.changed(image + 1)
+    assert gate.changed(image + 5)
+
+
+def test_frames_are_dropped_when_inference_falls_behind(tmp_path):
+    """Test that a slow model at a high target FPS skips frames instead of queueing them"""
+    write_frames(str(tmp_path / "frames"), 60, size=(64, 48))
+    stats = StreamStats()
+    results = list(run_stream(SlowSession(), ImageSequence(str(tmp_path / "frames")), batch_size=1, target_fps=100,
+                              diff_threshold=0, queue_depth=1, stats=stats))
+    assert stats.dropped > 0 and stats.read + stats.dropped == 60
+    indices = [result[0] for result in results]
+    assert len(indices) == stats.read and indices == sorted(indices)
+
+
+def test_video_file_round_trip(tmp_path):
+    """Test that frames of a video file stream through and keep their count"""
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (160, 120))
+    if not writer.isOpened():
+        pytest.skip("No video encoder available")
+    rng = np.random.default_rng(1)
+    for _ in range(8):
+        writer.write(rng.integers(0, 255, (120, 160, 3), dtype=np.uint8))
+    writer.release()
+
+    frames = open_frames(path)
+    assert isinstance(frames, VideoFrames) and frames.fps == 25
+    results = list(run_stream(FakeSession(), frames, batch_size=4))
+    frames.release()
+    assert len(results) == 8 and results[0][1].shape == (120, 160, 3)
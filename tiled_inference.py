@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""Script to run tiled sliding-window YOLO inference over a full-size GeoTIFF.
+
+Usage:
+    python tiled_inference.py testimage.tif --tile-size 640 --overlap 64 [--profile [PREFIX]]
+    python tiled_inference.py scene_v2.tif --store detections.sqlite      # only changed tiles run the model
+    python tiled_inference.py scene_16bit.tif --bands 4 3 2 --stretch 2 98
+
+The raster is never loaded as a whole: each tile is read with rasterio's windowed reads
+(``src.read(window=...)``), run through the ONNX session in batches and its detections are
+shifted back into full-image pixel coordinates. Peak memory is one batch of tiles plus the
+detections, whatever the raster size.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import rasterio
+
+from batch_inference import auto_batch_size, run_batch
+from detection_store import MAX_BYTES, DetectionStore, tile_digest
+from preprocess_buffer import BatchPreprocessor, make_runner
+from run_onnx_inference_draw import CONF_THRESHOLD, IOU_THRESHOLD, postprocess_batch
+from profiling import add_profile_argument, count, finish_profile, start_profile
+from raster_input import RasterTileReader, add_band_arguments
+from session_pool import get_session, model_digest
+# The tile grid lives in tiling.py so that pytiff can use it without the inference stack
+from tiling import TILE_OVERLAP, TILE_SIZE, generate_windows, tile_offsets
+
+
+def read_window(src, window, bands=(1, 2, 3)):
+    """Read one window of the given bands as a (bands, height, width) array, in the raster's dtype."""
+    indexes = list(bands) if src.count >= len(bands) else [1] * len(bands)
+    return src.read(indexes, window=window)
+
+
+def normalize_tile(data, tile_size=TILE_SIZE):
+    """Turn (3, h, w) 8-bit window data into a normalized (1, 3, tile_size, tile_size) float32 tensor.
+
+    GeoTIFF bands are already RGB and CHW, so no color conversion or transpose is needed.
+    Edge tiles smaller than tile_size are zero padded on the right and bottom.
+    """
+    tile = np.zeros((1, data.shape[0], tile_size, tile_size), dtype=np.float32)
+    tile[0, :, :data.shape[1], :data.shape[2]] = data
+    tile /= 255.0
+    return tile
+
+
+def read_tile(src, window, tile_size=TILE_SIZE, bands=(1, 2, 3)):
+    """Read one window as a normalized (1, 3, tile_size, tile_size) float32 tensor."""
+    return normalize_tile(read_window(src, window, bands), tile_size)
+
+
+def to_image_coordinates(boxes, window):
+    """Clip tile-space boxes to the valid part of the window and shift them to full-image pixels."""
+    # Clip to the valid part of the tile so boxes never extend into the zero padding
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, window.width)
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, window.height)
+    boxes += np.array([window.col_off, window.row_off, window.col_off, window.row_off], dtype=np.float32)
+    return boxes
+
+
+def detect_tiles(sess, tiles, windows, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """Run the session on a stacked (N, 3, H, W) batch of tiles in one call.
+
+    Returns one (boxes, scores, class_ids) tuple per window, in full-image pixel coordinates.
+    """
+    return postprocess_tiles(run_batch(sess, tiles), windows, conf_threshold, iou_threshold)
+
+
+def postprocess_tiles(outputs, windows, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """Post-process batched outputs into one (boxes, scores, class_ids) tuple per window, in image pixels."""
+    return [(to_image_coordinates(boxes, window), scores, class_ids)
+            for window, (boxes, scores, class_ids)
+            in zip(windows, postprocess_batch(outputs, conf_threshold, iou_threshold))]
+
+
+def detect_tile(sess, tile, window, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD):
+    """Run the session on a single tile and return detections in full-image pixel coordinates."""
+    return detect_tiles(sess, tile, [window], conf_threshold, iou_threshold)[0]
+
+
+def iter_tiled_detections(sess, src, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, conf_threshold=CONF_THRESHOLD,
+                          iou_threshold=IOU_THRESHOLD, batch_size=1, store=None, model_key=None, reader=None):
+    """Yield (window, boxes, scores, class_ids) for every tile of an open rasterio dataset.
+
+    Tiles are read batch_size at a time into one reusable batch buffer and sent to the session
+    through IO binding where the model allows it.
+
+    With a raster_input.RasterTileReader, tiles of any band selection and dtype are stretched
+    into the batch instead of the 8-bit path, and tiles without a valid pixel are skipped
+    without being yielded.
+
+    With a DetectionStore (and the model_key it is keyed by, see session_pool.model_digest),
+    each tile's pixels are hashed before preprocessing. Tiles found in the store are yielded
+    straight away from their stored detections; only the others are batched for the session,
+    so tiles no longer come out in grid order.
+    """
+    if store is not None and model_key is None:
+        raise ValueError("A detection store needs the model_key of the session's model")
+    if reader is not None and model_key is not None:
+        # Stored detections depend on the band selection and stretch as much as on the pixels
+        model_key = f"{model_key}|{reader.fingerprint()}"
+    preprocessor = BatchPreprocessor(batch_size, (tile_size, tile_size))
+    run = make_runner(sess, batch_size)
+    pending = []
+    try:
+        for window in generate_windows(src.width, src.height, tile_size, overlap):
+            if reader is None:
+                data, valid = preprocessor.read_raw(src, window), None
+            else:
+                data, valid = reader.read(window)
+                if valid is not None and not valid.any():
+                    count("nodata_tiles")
+                    continue
+            key = None
+            if store is not None:
+                key = store.make_key(tile_digest(data, tile_size), model_key, conf_threshold, iou_threshold)
+                stored = store.get(key)
+                if stored is not None:
+                    count("stored_tiles")
+                    count("detections", len(stored[0]))
+                    yield window, to_image_coordinates(stored[0], window), stored[1], stored[2]
+                    continue
+            if reader is None:
+                preprocessor.set_chw(len(pending), data)
+            else:
+                reader.normalize(data, valid, preprocessor.batch[len(pending)])
+            pending.append((window, key))
+            if len(pending) == batch_size:
+                yield from detect_pending(run, preprocessor, pending, conf_threshold, iou_threshold, store)
+                pending = []
+        if pending:
+            yield from detect_pending(run, preprocessor, pending, conf_threshold, iou_threshold, store)
+    finally:
+        if store is not None:
+            store.commit()
+
+
+def detect_pending(run, preprocessor, pending, conf_threshold, iou_threshold, store=None):
+    """Run the first len(pending) slots of the batch and return (window, boxes, scores, class_ids) tuples.
+
+    pending holds (window, store key) pairs; detections are stored in tile space, before the
+    shift to image coordinates, so identical content anywhere in any scene is a hit.
+    """
+    outputs = run(preprocessor.batch[:len(pending)])
+    count("tiles", len(pending))
+    results = []
+    for (window, key), (boxes, scores, class_ids) in zip(
+            pending, postprocess_batch(outputs, conf_threshold, iou_threshold)):
+        if store is not None:
+            store.put(key, (boxes, scores, class_ids))
+        count("detections", len(boxes))
+        results.append((window, to_image_coordinates(boxes, window), scores, class_ids))
+    if store is not None:
+        store.commit()
+    return results
+
+
+def concat_detections(detections):
+    """Concatenate a list of (boxes, scores, class_ids) tuples into one tuple of arrays."""
+    if not detections:
+        return np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+    boxes, scores, class_ids = zip(*detections)
+    return np.concatenate(boxes), np.concatenate(scores), np.concatenate(class_ids)
+
+
+def run_tiled_inference(sess, src, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, conf_threshold=CONF_THRESHOLD,
+                        iou_threshold=IOU_THRESHOLD, batch_size=1, store=None, model_key=None, reader=None):
+    """Run tiled inference over a whole raster and return concatenated (boxes, scores, class_ids).
+
+    Detections of neighbouring tiles are not merged, so objects on tile seams may appear twice;
+    see merge_detections.py for the global merge.
+    """
+    tiles = iter_tiled_detections(sess, src, tile_size, overlap, conf_threshold, iou_threshold, batch_size,
+                                  store, model_key, reader)
+    return concat_detections([detections for _, *detections in tiles])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tiled YOLO inference over a full-size GeoTIFF.')
+    parser.add_argument('raster', help='Path to the GeoTIFF file.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='Tile size in pixels.')
+    parser.add_argument('--overlap', type=int, default=TILE_OVERLAP, help='Overlap between tiles in pixels.')
+    parser.add_argument('--conf', type=float, default=CONF_THRESHOLD, help='Confidence threshold.')
+    parser.add_argument('--iou', type=float, default=IOU_THRESHOLD, help='IoU threshold for non-max suppression.')
+    parser.add_argument('--batch-size', type=int, default=0, help='Tiles per session call, 0 to pick it from memory.')
+    add_band_arguments(parser)
+    parser.add_argument('--store', help='Detection store file; tiles whose pixels are already in it skip the model.')
+    parser.add_argument('--store-size-mb', type=float, default=MAX_BYTES / 2 ** 20,
+                        help='Size bound of the detection store; least recently used tiles are evicted.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    sess = get_session(args.model, **start_profile(args))
+    batch_size = args.batch_size or auto_batch_size(sess)
+
+    store = DetectionStore(args.store, int(args.store_size_mb * 2 ** 20)) if args.store else None
+    model_key = model_digest(args.model) if store is not None else None
+
+    start = time.perf_counter()
+    with rasterio.open(args.raster) as src:
+        reader = RasterTileReader(src, args.bands, args.stretch or 'default', args.tile_size)
+        boxes, scores, class_ids = run_tiled_inference(sess, src, args.tile_size, args.overlap, args.conf, args.iou,
+                                                        batch_size, store, model_key, reader)
+        tile_count = len(list(generate_windows(src.width, src.height, args.tile_size, args.overlap)))
+    elapsed = time.perf_counter() - start
+    if store is not None:
+        print(f"Detection store: {len(store)} tiles, {store.total_bytes / 2 ** 20:.1f} MB")
+        store.close()
+
+    print(f"Batch size: {batch_size}")
+    print(f"Processed {tile_count} tiles in {elapsed:.2f}s ({tile_count / elapsed:.1f} tiles/s)")
+    print(f"Detections: {len(boxes)}")
+    for cls in np.unique(class_ids):
+        print(f"Class {cls}: {int(np.sum(class_ids == cls))}")
+    finish_profile(args, [sess])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""The sliding-window tile grid shared by tiled inference and the GeoTIFF tools.
+
+Usage:
+    from tiling import generate_windows
+    windows = list(generate_windows(src.width, src.height, tile_size=640, overlap=64))
+
+Only rasterio and the standard library are imported here, so pytiff (which is frozen into a
+standalone executable) can lay out the inference grid without pulling in onnxruntime or cv2.
+"""
+
+import math
+
+from rasterio.windows import Window
+
+# Parameters
+TILE_SIZE = 640
+TILE_OVERLAP = 64
+
+
+def tile_offsets(length, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Return the tile start offsets along one axis; the last tile is flush with the edge."""
+    if not 0 <= overlap < tile_size:
+        raise ValueError(f"Overlap must be in [0, {tile_size}), got {overlap}")
+    if length <= tile_size:
+        return [0]
+    stride = tile_size - overlap
+    count = math.ceil((length - tile_size) / stride) + 1
+    return [min(i * stride, length - tile_size) for i in range(count)]
+
+
+def generate_windows(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Yield rasterio Windows covering a width x height raster with the given overlap."""
+    for row_off in tile_offsets(height, tile_size, overlap):
+        for col_off in tile_offsets(width, tile_size, overlap):
+            yield Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
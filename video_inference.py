@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""Stream a video file or an image sequence through the YOLO ONNX model.
+
+Usage:
+    python video_inference.py drone.mp4 --output annotated.mp4
+    python video_inference.py frames/ --output detections.jsonl --batch-size 4
+    python video_inference.py drone.mp4 --target-fps 30 --diff-threshold 2 [--profile [PREFIX]]
+
+Frames are read by a generator and flow through the pipeline.Pipeline stages (letterbox
+preprocessing, batched inference, postprocessing) on their own threads. The bounded queues
+between the stages bound memory to queue_depth batches per stage, however long the video.
+
+With --target-fps, frame k is due k / target_fps seconds after the start. When inference
+falls behind and the reader is more than one frame interval late, frames are skipped with
+``grab()`` only, so a dropped video frame is never decoded or converted.
+
+The frame-difference gate compares a small grayscale thumbnail of each frame with that of the
+last frame that went through the model. Frames whose mean absolute difference is below
+--diff-threshold (in 8-bit levels) skip inference and reuse the last detections.
+
+Output is an annotated video (any extension cv2.VideoWriter handles) or, for .jsonl, one
+detection record per frame. Skipped frames are not written.
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from batch_inference import model_input_shape, run_batch, stack_inputs
+from pipeline import QUEUE_DEPTH, Pipeline
+from profiling import add_profile_argument, count, finish_profile, start_profile
+from run_onnx_inference_draw import (
+    CONF_THRESHOLD,
+    INPUT_SIZE,
+    IOU_THRESHOLD,
+    draw_detections,
+    postprocess_batch,
+    preprocess_image_letterbox,
+    scale_boxes_to_original,
+)
+from session_pool import get_session
+
+# Parameters
+BATCH_SIZE = 4
+DIFF_THRESHOLD = 2.0
+THUMBNAIL_SIZE = (64, 36)
+SEQUENCE_FPS = 30.0
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+VIDEO_CODEC = 'mp4v'
+
+
+class VideoFrames:
+    """Frames of a video file through cv2.VideoCapture, with separate grab and decode."""
+
+    def __init__(self, path):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Failed to open video {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or SEQUENCE_FPS
+
+    def grab(self):
+        return self.capture.grab()
+
+    def retrieve(self):
+        ok, image = self.capture.retrieve()
+        return image if ok else None
+
+    def release(self):
+        self.capture.release()
+
+
+class ImageSequence:
+    """Image files of a directory (or a glob pattern) in name order, behaving like VideoFrames."""
+
+    def __init__(self, source, fps=SEQUENCE_FPS):
+        pattern = os.path.join(source, '*') if os.path.isdir(source) else source
+        self.paths = sorted(path for path in glob.glob(pattern) if path.lower().endswith(IMAGE_EXTENSIONS))
+        self.fps = fps
+        self._next = 0
+
+    def grab(self):
+        self._next += 1
+        return self._next <= len(self.paths)
+
+    def retrieve(self):
+        return cv2.imread(self.paths[self._next - 1])
+
+    def release(self):
+        pass
+
+
+def open_frames(source, fps=SEQUENCE_FPS):
+    """Open a video file, or a directory or glob pattern of images."""
+    if os.path.isdir(source) or glob.has_magic(source):
+        return ImageSequence(source, fps)
+    return VideoFrames(source)
+
+
+class FrameGate:
+    """Cheap change detector: compares frames with the last frame that was let through."""
+
+    def __init__(self, threshold=DIFF_THRESHOLD, size=THUMBNAIL_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self._reference = None
+
+    def changed(self, image):
+        """Return True if image differs from the last changed frame by at least the threshold."""
+        if self.threshold <= 0:
+            return True
+        thumbnail = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), self.size, interpolation=cv2.INTER_AREA)
+        if self._reference is not None and cv2.norm(thumbnail, self._reference, cv2.NORM_L1) < (
+                self.threshold * thumbnail.size):
+            return False
+        self._reference = thumbnail
+        return True
+
+
+class StreamStats:
+    """Frames read, dropped to keep up with the target FPS, reused through the gate and inferred."""
+
+    def __init__(self):
+        self.read = 0
+        self.dropped = 0
+        self.reused = 0
+        self.inferred = 0
+
+    def __repr__(self):
+        return (f"Frames read: {self.read}, inferred: {self.inferred}, reused: {self.reused}, "
+                f"dropped: {self.dropped}")
+
+
+def iter_frame_batches(frames, batch_size=BATCH_SIZE, target_fps=0, gate=None, stats=None, max_frames=None):
+    """Yield lists of (index, image, infer) frames, holding up to batch_size frames to infer.
+
+    Frames that arrive more than one interval after their due time at target_fps are grabbed
+    but not decoded. Frames the gate finds unchanged are passed along with infer=False. A batch
+    is also flushed once it holds max_frames frames (batch_size by default), so a static
+    stream neither piles its frames up in one batch nor holds back the reused ones.
+    """
+    max_frames = max_frames or batch_size
+    stats = stats if stats is not None else StreamStats()
+    start = time.perf_counter()
+    batch, to_infer, index = [], 0, -1
+    while frames.grab():
+        index += 1
+        if target_fps > 0 and time.perf_counter() - start > (index + 1) / target_fps:
+            stats.dropped += 1
+            count("frames_dropped")
+            continue
+        image = frames.retrieve()
+        if image is None:
+            break
+        stats.read += 1
+        infer = gate is None or gate.changed(image)
+        batch.append((index, image, infer))
+        to_infer += infer
+        if to_infer == batch_size or len(batch) == max_frames:
+            yield batch
+            batch, to_infer = [], 0
+    if batch:
+        yield batch
+
+
+def make_stream_pipeline(sess, input_shape=INPUT_SIZE, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD,
+                         queue_depth=QUEUE_DEPTH):
+    """Build the preprocess -> infer -> postprocess pipeline over batches of (index, image, infer) frames."""
+    def preprocess(frames):
+        letterboxed = [preprocess_image_letterbox(image, input_shape) if infer else None
+                       for _, image, infer in frames]
+        tensors = [item[0] for item in letterboxed if item is not None]
+        return frames, letterboxed, stack_inputs(tensors) if tensors else None
+
+    def infer(item):
+        frames, letterboxed, batch = item
+        return frames, letterboxed, run_batch(sess, batch) if batch is not None else None
+
+    def postprocess(item):
+        frames, letterboxed, outputs = item
+        detections = iter(postprocess_batch(outputs, conf_threshold, iou_threshold) if outputs is not None else [])
+        results = []
+        for (index, image, _), geometry in zip(frames, letterboxed):
+            if geometry is None:
+                results.append((index, image, None))
+                continue
+            boxes, scores, class_ids = next(detections)
+            _, scale, pad = geometry
+            results.append((index, image, (scale_boxes_to_original(boxes, scale, pad, image.shape), scores, class_ids)))
+        return results
+
+    stages = [("preprocess", preprocess), ("infer", infer), ("postprocess", postprocess)]
+    return Pipeline(stages, queue_depth)
+
+
+def run_stream(sess, frames, batch_size=BATCH_SIZE, target_fps=0, diff_threshold=DIFF_THRESHOLD,
+               conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, queue_depth=QUEUE_DEPTH, stats=None):
+    """Yield (index, image, boxes, scores, class_ids, reused) for every frame that was not dropped, in order.
+
+    Reused frames carry the detections of the last frame that went through the model.
+    """
+    stats = stats if stats is not None else StreamStats()
+    gate = FrameGate(diff_threshold) if diff_threshold > 0 else None
+    pipeline = make_stream_pipeline(sess, model_input_shape(sess), conf_threshold, iou_threshold, queue_depth)
+    last = (np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64))
+    for results in pipeline.run(iter_frame_batches(frames, batch_size, target_fps, gate, stats)):
+        for index, image, detections in results:
+            reused = detections is None
+            if reused:
+                stats.reused += 1
+                count("frames_reused")
+            else:
+                stats.inferred += 1
+                count("frames_inferred")
+                last = detections
+            yield (index, image) + last + (reused,)
+
+
+def frame_record(index, fps, boxes, scores, class_ids, reused):
+    """Return a JSON-serializable detection record of one frame."""
+    return {
+        "frame": index,
+        "time": round(index / fps, 4),
+        "reused": reused,
+        "detections": [{"box": [round(v, 1) for v in box], "score": round(score, 4), "class_id": cls}
+                       for box, score, cls in zip(boxes.tolist(), scores.tolist(), class_ids.tolist())],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the YOLO ONNX model over a video or an image sequence.')
+    parser.add_argument('source', help='Video file, or a directory or glob pattern of frames.')
+    parser.add_argument('--model', default='yolov8s.onnx', help='Path to the ONNX model.')
+    parser.add_argument('--output', help='Annotated video, or .jsonl for per-frame detection records.')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Frames per session call.')
+    parser.add_argument('--target-fps', type=float, default=0,
+                        help='Frames per second to keep up with; late frames are skipped. 0 processes every frame.')
+    parser.add_argument('--diff-threshold', type=float, default=DIFF_THRESHOLD,
+                        help='Mean 8-bit difference below which a frame reuses the last detections; 0 disables.')
+    parser.add_argument('--fps', type=float, default=SEQUENCE_FPS, help='Frame rate of an image sequence.')
+    parser.add_argument('--conf', type=float, default=CONF_THRESHOLD, help='Confidence threshold.')
+    parser.add_argument('--iou', type=float, default=IOU_THRESHOLD, help='IoU threshold for non-max suppression.')
+    parser.add_argument('--queue-depth', type=int, default=QUEUE_DEPTH, help='Batches buffered between stages.')
+    add_profile_argument(parser)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"ONNX model file '{args.model}' not found. Please export the model first.")
+        return
+
+    try:
+        frames = open_frames(args.source, args.fps)
+    except IOError as e:
+        print(e)
+        return
+
+    sess = get_session(args.model, **start_profile(args))
+    stats = StreamStats()
+    writer = records = None
+    start = time.perf_counter()
+    try:
+        for index, image, boxes, scores, class_ids, reused in run_stream(
+                sess, frames, args.batch_size, args.target_fps, args.diff_threshold, args.conf, args.iou,
+                args.queue_depth, stats):
+            if args.output and args.output.lower().endswith('.jsonl'):
+                if records is None:
+                    records = open(args.output, 'w')
+                records.write(json.dumps(frame_record(index, frames.fps, boxes, scores, class_ids, reused)) + '\n')
+            elif args.output:
+                if writer is None:
+                    fps = args.target_fps or frames.fps
+                    writer = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*VIDEO_CODEC), fps,
+                                             (image.shape[1], image.shape[0]))
+                writer.write(draw_detections(image, boxes, scores, class_ids))
+    finally:
+        frames.release()
+        if writer is not None:
+            writer.release()
+        if records is not None:
+            records.close()
+    elapsed = time.perf_counter() - start
+
+    print(stats)
+    print(f"Processed {stats.read} frames in {elapsed:.2f}s ({stats.read / max(elapsed, 1e-9):.1f} frames/s)")
+    if args.output:
+        print(f"Wrote {args.output}")
+    finish_profile(args, [sess])
+
+
+if __name__ == "__main__":
+    main()